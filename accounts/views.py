@@ -2,12 +2,14 @@ from django.shortcuts import render, redirect
 from .forms import CustomUserCreationForm, CustomErrorList
 from django.contrib.auth import login as auth_login, authenticate, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from moviesstore.querybudget import query_budget
 
 @login_required
 def logout(request):
     auth_logout(request)
     return redirect('home.index')
 
+@query_budget(2, 0.5, post_queries=11)
 def login(request):
     template_data = {}
     template_data['title'] = 'Login'
@@ -28,6 +30,7 @@ def login(request):
             auth_login(request, user)
             return redirect('home.index')
 
+@query_budget(2, 0.5, post_queries=6)
 def signup(request):
     template_data = {}
     template_data['title'] = 'Sign Up'
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CartConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "cart"
+
+    def ready(self):
+        # Registers the receivers that merge carts at login, keep cart
+        # totals current when prices change and drop stale order lines.
+        from . import history, store  # noqa: F401
@@ -0,0 +1,46 @@
+"""Order history with cached line items.
+
+An order never changes once it has been placed, so its lines (movie, price
+paid and quantity) are cached without expiry the first time they are read.
+A page of history is then one keyset query for the orders plus one
+``get_many`` on the cache; only orders missing from the cache fall back to a
+single query for all of their items. The cache entry is dropped if an item
+row is ever deleted, for example when its movie is removed from the store.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Item
+
+OrderLine = namedtuple('OrderLine', ['movie_id', 'movie_name', 'price', 'quantity'])
+
+
+def _key(order_id):
+    return f'order_lines:{order_id}'
+
+
+def attach_lines(orders):
+    """Set ``order.lines`` to a list of OrderLine on each of ``orders``."""
+    cached = cache.get_many([_key(order.id) for order in orders])
+    missing = [order.id for order in orders if _key(order.id) not in cached]
+    if missing:
+        loaded = {order_id: [] for order_id in missing}
+        items = (Item.objects.filter(order_id__in=missing)
+                 .select_related('movie').only('order_id', 'price', 'quantity', 'movie__name')
+                 .order_by('id'))
+        for item in items:
+            loaded[item.order_id].append(OrderLine(item.movie_id, item.movie.name, item.price, item.quantity))
+        fresh = {_key(order_id): lines for order_id, lines in loaded.items()}
+        cache.set_many(fresh, timeout=None)
+        cached.update(fresh)
+    for order in orders:
+        order.lines = cached[_key(order.id)]
+    return orders
+
+
+@receiver(post_delete, sender=Item)
+def item_deleted(sender, instance, **kwargs):
+    cache.delete(_key(instance.order_id))
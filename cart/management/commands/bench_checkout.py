@@ -0,0 +1,62 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.models import Cart, CartItem
+from movies.models import Movie
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark checkout latency and query count as the cart grows (changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,25,50,100',
+                            help='Comma-separated cart sizes to measure.')
+        parser.add_argument('--runs', type=int, default=5, help='Checkouts per cart size.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'items':>6} {'median ms':>10} {'queries':>8}")
+        try:
+            with transaction.atomic():
+                self.run(sizes, options['runs'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, runs):
+        user = User.objects.create_user('bench-checkout', password='unused')
+        client = Client()
+        client.force_login(user)
+        missing = max(sizes) - Movie.objects.count()
+        if missing > 0:
+            Movie.objects.bulk_create(
+                Movie(name=f'Bench movie {i}', price=10, description='Benchmark filler.',
+                      image='movie_images/bench.jpg')
+                for i in range(missing)
+            )
+        movie_ids = list(Movie.objects.values_list('id', flat=True)[:max(sizes)])
+
+        for size in sizes:
+            timings, query_counts = [], []
+            for _ in range(runs):
+                cart, _ = Cart.objects.get_or_create(user=user)
+                CartItem.objects.bulk_create(
+                    CartItem(cart=cart, movie_id=movie_id, quantity=2) for movie_id in movie_ids[:size]
+                )
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    client.post(reverse('cart.purchase'))
+                timings.append((time.perf_counter() - start) * 1000)
+                query_counts.append(len(queries))
+            self.stdout.write(f'{size:>6} {statistics.median(timings):>10.2f} {max(query_counts):>8}')
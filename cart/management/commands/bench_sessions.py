@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from movies.models import Movie
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Benchmark cart-heavy traffic under each session engine and report requests/sec '
+            '(database changes are rolled back)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(settings.SESSION_ENGINES),
+                            help='Comma-separated SESSION_ENGINES keys to compare.')
+        parser.add_argument('--requests', type=int, default=300,
+                            help='Requests per visitor (one anonymous, one logged in) and mode.')
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        unknown = set(modes) - set(settings.SESSION_ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown session modes: {', '.join(sorted(unknown))}")
+        self.stdout.write(f"{'mode':>15} {'req/s':>8} {'queries/req':>12} {'session queries/req':>20}")
+        for mode in modes:
+            try:
+                with transaction.atomic():
+                    self.run(mode, options['requests'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, mode, requests):
+        user = User.objects.create_user('bench-sessions', password='unused')
+        movie_ids = list(Movie.objects.values_list('id', flat=True)[:20])
+        if not movie_ids:
+            raise CommandError('Add some movies first.')
+
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+            anonymous, shopper = Client(), Client()
+            shopper.force_login(user)
+            elapsed, total, num_queries, session_queries = 0.0, 0, 0, 0
+            for client in (anonymous, shopper):
+                for i in range(requests):
+                    start = time.perf_counter()
+                    # Each request resets the query log, so capture them one at a time
+                    with CaptureQueriesContext(connection) as queries:
+                        # Every third request changes the cart, the rest view it
+                        if i % 3 == 0:
+                            movie_id = movie_ids[i % len(movie_ids)]
+                            client.post(reverse('cart.add', args=[movie_id]), {'quantity': i % 4 + 1})
+                        else:
+                            client.get(reverse('cart.index'))
+                    elapsed += time.perf_counter() - start
+                    total += 1
+                    num_queries += len(queries)
+                    session_queries += sum('django_session' in query['sql'] for query in queries)
+        self.stdout.write(f'{mode:>15} {total / elapsed:>8.0f} {num_queries / total:>12.2f} '
+                          f'{session_queries / total:>20.2f}')
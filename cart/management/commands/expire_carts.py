@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous carts that have not changed for ANONYMOUS_CART_MAX_AGE_DAYS days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ANONYMOUS_CART_MAX_AGE_DAYS,
+                            help='Age in days after which an untouched anonymous cart is deleted.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = Cart.objects.filter(user=None, updated_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired cart(s) and lines.'))
@@ -5,6 +5,14 @@ class Order(models.Model):
     total = models.IntegerField()
     date = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # One-time token from the cart page; makes a repeated purchase submit a no-op
+    checkout_token = models.CharField(max_length=32, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Order history: a user's orders newest first, paginated by (date, id)
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_id'),
+        ]
 
     def __str__(self):
         return str(self.id) + ' - ' + self.user.username
@@ -16,5 +24,39 @@ class Item(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     movie = models.ForeignKey('movies.Movie', on_delete=models.CASCADE)  # <-- use string reference
 
+    class Meta:
+        indexes = [
+            # Covers units-sold sums per movie; sums per order use the order foreign key index
+            models.Index(fields=['movie', 'quantity'], name='item_movie_quantity'),
+        ]
+
     def __str__(self):
         return str(self.id) + ' - ' + str(self.movie)
+
+class Cart(models.Model):
+    """A shopping cart, owned by a user or (for anonymous visitors) by a session.
+
+    Anonymous carts are found through the ``cart_id`` stored in the session
+    and merged into the user's cart at login. ``total`` is kept up to date
+    by cart/store.py whenever a line or a movie price changes.
+    """
+    user = models.OneToOneField(User, null=True, blank=True, on_delete=models.CASCADE,
+                                related_name='cart')
+    total = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.id) + ' - ' + (self.user.username if self.user_id else 'anonymous')
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    movie = models.ForeignKey('movies.Movie', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'movie'], name='cartitem_unique_movie'),
+        ]
+
+    def __str__(self):
+        return str(self.cart_id) + ' - ' + str(self.movie_id) + ' x ' + str(self.quantity)
@@ -0,0 +1,146 @@
+"""Server-side cart storage.
+
+Carts live in their own tables instead of a dict in ``request.session``:
+a logged-in user's cart is keyed by the user, and an anonymous visitor's
+cart by a ``cart_id`` kept in the session. The session is written once,
+when an anonymous cart is created. Changing a quantity is a single upsert
+on (cart, movie), and ``Cart.total`` is refreshed in the same request
+with one UPDATE, so reading the total never touches the lines.
+
+At login the anonymous cart is merged into the user's cart. When a movie's
+price changes, the totals of the carts holding it are recomputed.
+Anonymous carts left alone for ANONYMOUS_CART_MAX_AGE_DAYS are deleted by
+the expire_carts command.
+"""
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from movies.models import Movie
+from .models import Cart, CartItem
+
+SESSION_KEY = 'cart_id'
+# Most copies of one movie a cart may hold
+MAX_QUANTITY = 10
+
+
+def get_cart(request, create=False):
+    """Return this request's Cart (creating it if ``create``), or None."""
+    cart = getattr(request, '_cart', None)
+    if cart is not None or (not create and hasattr(request, '_cart')):
+        return cart
+    if request.user.is_authenticated:
+        if create:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+        else:
+            cart = Cart.objects.filter(user=request.user).first()
+    else:
+        cart_id = request.session.get(SESSION_KEY)
+        cart = Cart.objects.filter(pk=cart_id, user=None).first() if cart_id else None
+        if cart is None and create:
+            cart = Cart.objects.create()
+            request.session[SESSION_KEY] = cart.id
+    request._cart = cart
+    return cart
+
+
+def items(request):
+    """Return the cart's items with their movies, in one query."""
+    if request.user.is_authenticated:
+        queryset = CartItem.objects.filter(cart__user=request.user)
+    else:
+        cart_id = request.session.get(SESSION_KEY)
+        if not cart_id:
+            return []
+        queryset = CartItem.objects.filter(cart_id=cart_id, cart__user=None)
+    cart_items = list(queryset.select_related('cart', 'movie').order_by('id'))
+    if cart_items:
+        request._cart = cart_items[0].cart
+    return cart_items
+
+
+def quantities(cart_items):
+    return {item.movie_id: item.quantity for item in cart_items}
+
+
+def total(cart_items):
+    """The cached total of the cart these items (from ``items``) belong to."""
+    return cart_items[0].cart.total if cart_items else 0
+
+
+def set_quantity(request, movie_id, quantity):
+    """Set one movie's quantity; zero or less removes it from the cart."""
+    cart = get_cart(request, create=True)
+    if quantity > 0:
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, movie_id=movie_id, quantity=quantity)],
+            update_conflicts=True, unique_fields=['cart', 'movie'], update_fields=['quantity'],
+        )
+    else:
+        CartItem.objects.filter(cart=cart, movie_id=movie_id).delete()
+    refresh_totals(Cart.objects.filter(pk=cart.pk), touch=True)
+
+
+def clear(request):
+    cart = get_cart(request)
+    if cart is not None:
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(total=0)
+
+
+def refresh_totals(carts, touch=False):
+    """Recompute ``total`` for a Cart queryset in a single UPDATE.
+
+    ``touch`` also stamps ``updated_at``, for changes the cart's owner made.
+    """
+    line_totals = (CartItem.objects.filter(cart=OuterRef('pk'))
+                   .values('cart')
+                   .annotate(total=Sum(F('quantity') * F('movie__price')))
+                   .values('total'))
+    extra = {'updated_at': timezone.now()} if touch else {}
+    carts.update(total=Coalesce(Subquery(line_totals), 0), **extra)
+
+
+def merge(source, target):
+    """Move ``source``'s items into ``target``, then delete ``source``.
+
+    A movie in both carts takes the quantity from ``source``, the more
+    recent choice.
+    """
+    moved = [CartItem(cart=target, movie_id=item.movie_id, quantity=item.quantity)
+             for item in source.items.all()]
+    if moved:
+        CartItem.objects.bulk_create(
+            moved, update_conflicts=True, unique_fields=['cart', 'movie'], update_fields=['quantity'],
+        )
+    source.delete()
+    refresh_totals(Cart.objects.filter(pk=target.pk), touch=True)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is None:
+        return
+    cart_id = request.session.pop(SESSION_KEY, None)
+    anonymous = Cart.objects.filter(pk=cart_id, user=None).first() if cart_id else None
+    if anonymous is None:
+        return
+    user_cart = Cart.objects.filter(user=user).first()
+    if user_cart is None:
+        # Adopt the anonymous cart as it is
+        anonymous.user = user
+        anonymous.save(update_fields=['user', 'updated_at'])
+    else:
+        merge(anonymous, user_cart)
+    if hasattr(request, '_cart'):
+        del request._cart
+
+
+@receiver(post_save, sender=Movie)
+def movie_price_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and 'price' not in update_fields:
+        return
+    refresh_totals(Cart.objects.filter(items__movie_id=instance.id))
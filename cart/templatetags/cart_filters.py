@@ -1,5 +0,0 @@
-from django import template
-register = template.Library()
-@register.filter(name='get_quantity')
-def get_cart_quantity(cart, movie_id):
-    return cart[str(movie_id)]
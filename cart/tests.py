@@ -1,3 +1,275 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from movies.models import Movie, MovieStats
+from moviesstore.testing import PerformanceTestCase
+from .models import Cart, CartItem, Item, Order
+
+
+class CartStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {i}', price=10 + i, description='Film.',
+                                 image='movie_images/film.jpg')
+            for i in range(3)
+        ]
+
+    def add(self, movie, quantity):
+        return self.client.post(reverse('cart.add', args=[movie.id]), {'quantity': quantity})
+
+    def test_add_updates_items_and_total(self):
+        self.add(self.movies[0], 2)
+        self.add(self.movies[1], 1)
+        self.add(self.movies[0], 3)
+        response = self.client.get(reverse('cart.index'))
+        items = response.context['template_data']['cart_items']
+        self.assertEqual([(item.movie_id, item.quantity) for item in items],
+                         [(self.movies[0].id, 3), (self.movies[1].id, 1)])
+        self.assertEqual(response.context['template_data']['cart_total'], 3 * 10 + 11)
+
+    def test_adding_an_item_does_not_rewrite_the_session(self):
+        self.add(self.movies[0], 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.add(self.movies[1], 1)
+        self.assertFalse([q for q in queries if 'django_session' in q['sql'] and 'UPDATE' in q['sql']])
+
+    def test_anonymous_cart_merges_into_user_cart_at_login(self):
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, movie=self.movies[0], quantity=1)
+        CartItem.objects.create(cart=user_cart, movie=self.movies[1], quantity=1)
+        self.add(self.movies[1], 4)
+        self.add(self.movies[2], 1)
+
+        self.client.post(reverse('accounts.login'), {'username': 'buyer', 'password': 'pass'})
+
+        self.assertEqual(Cart.objects.count(), 1)
+        quantities = dict(user_cart.items.values_list('movie_id', 'quantity'))
+        self.assertEqual(quantities, {self.movies[0].id: 1, self.movies[1].id: 4, self.movies[2].id: 1})
+        user_cart.refresh_from_db()
+        self.assertEqual(user_cart.total, 10 + 4 * 11 + 12)
+
+    def test_price_change_refreshes_cart_totals(self):
+        self.add(self.movies[0], 2)
+        movie = self.movies[0]
+        movie.price = 20
+        movie.save()
+        self.assertEqual(Cart.objects.get().total, 40)
+
+    def test_invalid_quantities_are_rejected(self):
+        for quantity in ('', 'two', '-1', '11'):
+            response = self.add(self.movies[0], quantity)
+            self.assertRedirects(response, reverse('movies.show', args=[self.movies[0].id]),
+                                 fetch_redirect_response=False)
+        self.assertRedirects(self.client.post(reverse('cart.add', args=[self.movies[0].id])),
+                             reverse('movies.show', args=[self.movies[0].id]), fetch_redirect_response=False)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_expire_carts_deletes_only_stale_anonymous_carts(self):
+        self.add(self.movies[0], 1)
+        stale, fresh = Cart.objects.get(), Cart.objects.create()
+        users_cart = Cart.objects.create(user=self.user)
+        Cart.objects.filter(pk__in=[stale.pk, users_cart.pk]).update(
+            updated_at=timezone.now() - timedelta(days=31))
+        call_command('expire_carts', stdout=io.StringIO())
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {fresh.pk, users_cart.pk})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_changing_a_line_touches_the_cart(self):
+        self.add(self.movies[0], 1)
+        Cart.objects.update(updated_at=timezone.now() - timedelta(days=31))
+        self.add(self.movies[0], 2)
+        self.assertGreater(Cart.objects.get().updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_purchase_empties_the_cart(self):
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        self.client.post(reverse('cart.purchase'))
+        self.assertEqual(self.user.order_set.get().total, 20)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_purchase_needs_a_post(self):
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        self.assertRedirects(self.client.get(reverse('cart.purchase')), reverse('cart.index'))
+        self.assertFalse(Order.objects.exists())
+
+    def test_resubmitting_a_checkout_token_places_one_order(self):
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        token = self.client.get(reverse('cart.index')).context['template_data']['checkout_token']
+        first = self.client.post(reverse('cart.purchase'), {'token': token})
+        order = self.user.order_set.get()
+        self.add(self.movies[1], 1)
+        again = self.client.post(reverse('cart.purchase'), {'token': token})
+        self.assertEqual(again.context['template_data']['order_id'], order.id)
+        self.assertEqual(first.context['template_data']['order_id'], order.id)
+        self.assertEqual(self.user.order_set.count(), 1)
+        self.assertEqual(order.item_set.count(), 1)
+        # The cart filled after the first submit is left for a fresh checkout
+        self.assertEqual(CartItem.objects.get().movie_id, self.movies[1].id)
+
+    def test_failed_checkout_rolls_back_the_whole_order(self):
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        with mock.patch('movies.stats.record_purchase', side_effect=RuntimeError('stats down')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('cart.purchase'), {'token': 'b' * 32})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Item.objects.exists())
+        self.assertEqual(MovieStats.objects.get(movie=self.movies[0]).units_sold, 0)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        # The token was not used up, so the same checkout can be retried
+        self.client.post(reverse('cart.purchase'), {'token': 'b' * 32})
+        self.assertEqual(self.user.order_set.get().total, 20)
+
+    def test_checkout_charges_current_prices(self):
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        Movie.objects.filter(pk=self.movies[0].pk).update(price=15)
+        self.client.post(reverse('cart.purchase'))
+        order = self.user.order_set.get()
+        self.assertEqual(order.total, 30)
+        self.assertEqual(order.item_set.get().price, 15)
+
+    def test_another_users_token_does_not_show_their_order(self):
+        other = User.objects.create_user('other', password='pass')
+        Order.objects.create(user=other, total=99, checkout_token='a' * 32)
+        self.client.force_login(self.user)
+        self.add(self.movies[0], 2)
+        response = self.client.post(reverse('cart.purchase'), {'token': 'a' * 32})
+        self.assertRedirects(response, reverse('cart.index'))
+        self.assertFalse(self.user.order_set.exists())
+        self.assertEqual(CartItem.objects.count(), 1)
+
+
+class SessionModeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass')
+        cls.movie = Movie.objects.create(name='Movie', price=10, description='Film.',
+                                         image='movie_images/film.jpg')
+
+    def setUp(self):
+        cache.clear()
+        caches['sessions'].clear()
+        self.session_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.session_dir)
+
+    def shop(self):
+        client = Client()
+        client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': 2})
+        self.assertEqual(client.get(reverse('cart.index')).context['template_data']['cart_total'], 20)
+        self.assertTrue(client.login(username='buyer', password='pass'))
+        # The anonymous cart followed the visitor through login
+        self.assertEqual(client.get(reverse('cart.index')).context['template_data']['cart_total'], 20)
+        client.logout()
+        self.assertEqual(client.get(reverse('cart.index')).context['template_data']['cart_total'], 0)
+
+    def test_every_mode_keeps_the_cart_across_requests(self):
+        for mode, engine in settings.SESSION_ENGINES.items():
+            with self.subTest(mode), override_settings(SESSION_ENGINE=engine, SESSION_FILE_PATH=self.session_dir):
+                self.shop()
+                self.user.cart.items.all().delete()
+
+    def test_only_database_modes_write_sessions_to_the_database(self):
+        for mode, engine in settings.SESSION_ENGINES.items():
+            with self.subTest(mode), override_settings(SESSION_ENGINE=engine, SESSION_FILE_PATH=self.session_dir):
+                Session.objects.all().delete()
+                client = Client()
+                client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': 1})
+                self.assertEqual(Session.objects.exists(), mode in ('db', 'cached_db'))
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('collector', password='pass')
+        cls.movies = [
+            Movie.objects.create(name=f'Movie {i}', price=10, description='Film.',
+                                 image='movie_images/film.jpg')
+            for i in range(5)
+        ]
+        for i in range(15):
+            order = Order.objects.create(user=cls.user, total=0)
+            Item.objects.bulk_create(
+                Item(order=order, movie=movie, price=5 + i, quantity=1) for movie in cls.movies[:i % 5 + 1]
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_page(self, cursor=None):
+        url = reverse('accounts.orders') + (f'?cursor={cursor}' if cursor else '')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response.context['template_data']['orders'], len(queries)
+
+    def test_pages_are_keyset_paginated_newest_first(self):
+        first, _ = self.get_page()
+        second, _ = self.get_page(first.next_cursor)
+        orders = list(first) + list(second)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next)
+        self.assertEqual([order.id for order in orders],
+                         list(self.user.order_set.order_by('-date', '-id').values_list('id', flat=True)))
+
+    def test_lines_show_the_price_paid_and_come_from_cache(self):
+        page, cold = self.get_page()
+        newest = page.items[0]
+        self.assertEqual([line.price for line in newest.lines], [19] * 5)
+        Movie.objects.update(price=99)
+        page, warm = self.get_page()
+        self.assertEqual([line.price for line in page.items[0].lines], [19] * 5)
+        self.assertEqual(warm, cold - 1)
+
+    def test_deleting_a_movie_drops_its_cached_lines(self):
+        self.get_page()
+        self.movies[4].delete()
+        page, _ = self.get_page()
+        self.assertEqual(len(page.items[0].lines), 4)
+
+
+class CartPerformanceBudgetTests(PerformanceTestCase):
+    """Cart and order history stay within their declared budgets on a seeded store."""
+
+    def fill_cart(self, cart):
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, movie_id=movie_id, quantity=2)
+            for movie_id in Movie.objects.values_list('id', flat=True)[:20]
+        )
+
+    def test_cart_index(self):
+        self.fill_cart(Cart.objects.create(user=self.shopper))
+        self.assertWithinBudget(reverse('cart.index'), user=self.shopper)
+
+    def test_anonymous_cart_index(self):
+        cart = Cart.objects.create()
+        self.fill_cart(cart)
+        session = self.client.session
+        session['cart_id'] = cart.id
+        session.save()
+        self.assertWithinBudget(reverse('cart.index'))
+
+    def test_orders(self):
+        response = self.assertWithinBudget(reverse('accounts.orders'), user=self.shopper)
+        cursor = response.context['template_data']['orders'].next_cursor
+        if cursor:
+            self.assertWithinBudget(reverse('accounts.orders') + '?cursor=' + cursor)
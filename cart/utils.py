@@ -1,6 +1,6 @@
-def calculate_cart_total(cart, movies_in_cart):
+def calculate_cart_total(quantities, movies_in_cart):
     total = 0
     for movie in movies_in_cart:
-        quantity = cart[str(movie.id)]
+        quantity = quantities[movie.id]
         total += movie.price * int(quantity)
     return total
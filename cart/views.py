@@ -1,63 +1,97 @@
 from django.shortcuts import render
 from django.shortcuts import get_object_or_404, redirect
 from movies.models import Movie
+from movies import stats
 from .utils import calculate_cart_total
 from .models import Order, Item
+from . import history, store
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+import uuid
+from django.conf import settings
+from moviesstore.pagination import keyset_paginate
+from moviesstore.querybudget import query_budget
+@query_budget(3, 0.5)
 def index(request):
-    cart_total = 0
-    movies_in_cart = []
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-    if (movie_ids != []):
-        movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-        cart_total = calculate_cart_total(cart,
-            movies_in_cart)
+    cart_items = store.items(request)
     template_data = {}
     template_data['title'] = 'Cart'
-    template_data['movies_in_cart'] = movies_in_cart
-    template_data['cart_total'] = cart_total
+    template_data['cart_items'] = cart_items
+    template_data['cart_total'] = store.total(cart_items)
+    # Repeating a checkout with the same token shows its order instead of placing another
+    template_data['checkout_token'] = uuid.uuid4().hex
     return render(request, 'cart/index.html',
         {'template_data': template_data})
 def add(request, id):
     get_object_or_404(Movie, id=id)
-    cart = request.session.get('cart', {})
-    cart[id] = request.POST['quantity']
-    request.session['cart'] = cart
+    try:
+        quantity = int(request.POST.get('quantity', ''))
+    except ValueError:
+        quantity = None
+    # Zero removes the movie from the cart
+    if quantity is None or not 0 <= quantity <= store.MAX_QUANTITY:
+        messages.error(request, f'Choose a quantity from 1 to {store.MAX_QUANTITY}.')
+        return redirect('movies.show', id=id)
+    store.set_quantity(request, id, quantity)
     return redirect('cart.index')
 def clear(request):
-    request.session['cart'] = {}
+    store.clear(request)
     return redirect('cart.index')
 @login_required
 def purchase(request):
-    cart = request.session.get('cart', {})
-    movie_ids = list(cart.keys())
-    if (movie_ids == []):
+    # Placing an order is a write: a prefetched or crawled link must not buy anything
+    if request.method != 'POST':
         return redirect('cart.index')
-    movies_in_cart = Movie.objects.filter(id__in=movie_ids)
-    cart_total = calculate_cart_total(cart, movies_in_cart)
-    order = Order()
-    order.user = request.user
-    order.total = cart_total
-    order.save()
-    for movie in movies_in_cart:
-        item = Item()
-        item.movie = movie
-        item.price = movie.price
-        item.order = order
-        item.quantity = cart[str(movie.id)]
-        item.save()
-    request.session['cart'] = {}
+    token = request.POST.get('token') or None
+    if token:
+        # A resubmitted checkout shows the order it already placed
+        placed = Order.objects.filter(user=request.user, checkout_token=token).first()
+        if placed:
+            return purchase_confirmation(request, placed)
+    quantities = store.quantities(store.items(request))
+    if not quantities:
+        return redirect('cart.index')
+    country = request.user.profile.country.code
+    with transaction.atomic():
+        # Read every price once, under lock, and charge exactly those prices
+        movies_in_cart = list(Movie.objects.select_for_update()
+                              .filter(id__in=quantities).only('id', 'price'))
+        cart_total = calculate_cart_total(quantities, movies_in_cart)
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(user=request.user, total=cart_total,
+                                             checkout_token=token)
+        except IntegrityError:
+            # A concurrent submit with the same token won the race. The token
+            # came from the client, so only ever show the order if it is ours.
+            placed = Order.objects.filter(user=request.user, checkout_token=token).first()
+            if placed is None:
+                messages.error(request, 'That checkout link is not valid. Please try again.')
+                return redirect('cart.index')
+            return purchase_confirmation(request, placed)
+        Item.objects.bulk_create([
+            Item(movie=movie, price=movie.price, order=order, quantity=quantities[movie.id])
+            for movie in movies_in_cart
+        ])
+        stats.record_purchase(quantities, country=country)
+        store.clear(request)
+    return purchase_confirmation(request, order)
+def purchase_confirmation(request, order):
     template_data = {}
     template_data['title'] = 'Purchase confirmation'
     template_data['order_id'] = order.id
     return render(request, 'cart/purchase.html',
         {'template_data': template_data})
+@query_budget(4, 0.5)
 @login_required
 def orders(request):
+    page = keyset_paginate(request.user.order_set.all(), request.GET.get('cursor'),
+                           settings.ORDERS_PAGE_SIZE)
+    history.attach_lines(page.items)
     template_data = {}
     template_data['title'] = 'Orders'
-    template_data['orders'] = request.user.order_set.all()
+    template_data['orders'] = page
     return render(request, 'accounts/orders.html',
         {'template_data': template_data})
\ No newline at end of file
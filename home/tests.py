@@ -1,3 +1,33 @@
-from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from cart.models import Cart, CartItem
+from movies.models import Movie
+from moviesstore.testing import PerformanceTestCase
+
+
+class HomePerformanceBudgetTests(PerformanceTestCase):
+    """Static pages and the account forms stay within their declared budgets."""
+
+    def test_static_pages(self):
+        for name in ('home.index', 'home.about', 'home.dog'):
+            self.assertWithinBudget(reverse(name))
+            self.assertWithinBudget(reverse(name), user=self.shopper)
+
+    def test_account_forms(self):
+        self.assertWithinBudget(reverse('accounts.login'))
+        self.assertWithinBudget(reverse('accounts.signup'))
+
+    def test_account_posts(self):
+        self.shopper.set_password('pass')
+        self.shopper.save()
+        # The costliest login: an anonymous cart merged into the user's own
+        movie_ids = list(Movie.objects.values_list('id', flat=True)[:2])
+        CartItem.objects.create(cart=Cart.objects.create(user=self.shopper), movie_id=movie_ids[0], quantity=1)
+        self.client.post(reverse('cart.add', args=[movie_ids[1]]), {'quantity': 2})
+        self.assertWithinBudget(reverse('accounts.login'),
+                                data={'username': self.shopper.username, 'password': 'pass'}, status=302)
+        self.client.logout()
+        self.assertWithinBudget(reverse('accounts.signup'), data={
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'password1': 'a-long-Passw0rd',
+            'password2': 'a-long-Passw0rd', 'country': 'FR',
+        }, status=302)
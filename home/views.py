@@ -1,15 +1,23 @@
 from django.shortcuts import render
+from moviesstore.pagecache import cache_anonymous
+from moviesstore.querybudget import query_budget
+@query_budget(2, 0.5)
+@cache_anonymous()
 def index(request):
     template_data = {}
     template_data['title'] = 'Movies Store'
     return render(request, 'home/index.html', {
         'template_data': template_data})
+@query_budget(2, 0.5)
+@cache_anonymous()
 def about(request):
     template_data = {}
     template_data['title'] = 'About'
     return render(request,
                   'home/about.html',
                   {'template_data': template_data})
+@query_budget(2, 0.5)
+@cache_anonymous()
 def dog(request):
     template_data = {}
     template_data['title'] = 'About'
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "movies"
+
+    def ready(self):
+        # Registers the receivers that keep review popularity, the
+        # typeahead index, the search index triggers, the cached index
+        # fragments and the poster derivatives current.
+        from . import fragments, images, search, stats, suggest  # noqa: F401
@@ -0,0 +1,61 @@
+"""Signal receivers that invalidate the cached movies index fragments.
+
+Each group names the data that a set of fragments in movies/index.html
+shows:
+
+    reviews  the Highest, Most Popular and Most Recent review lists
+    ratings  the top movies by rating
+    likes    the top movies by likes
+    orders   the top movies by units ordered
+    movies   every movie card (names, images), plus Recently Added
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from cart.models import Item
+from moviesstore import fragments
+from .models import Movie, Rating, Review
+
+GROUPS = ('reviews', 'ratings', 'likes', 'orders', 'movies')
+
+
+def versions():
+    return fragments.versions(*GROUPS)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, **kwargs):
+    fragments.bump('reviews')
+
+
+@receiver(m2m_changed, sender=Review.liked_users.through)
+def review_likes_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        fragments.bump('reviews')
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, **kwargs):
+    fragments.bump('ratings')
+
+
+@receiver(m2m_changed, sender=Movie.liked_users.through)
+def movie_likes_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        fragments.bump('likes')
+
+
+# Checkout writes its Items with bulk_create, which sends no post_save, so
+# movies/stats.record_purchase bumps 'orders' itself
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_changed(sender, **kwargs):
+    fragments.bump('orders')
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, **kwargs):
+    fragments.bump('movies')
@@ -0,0 +1,204 @@
+"""Self-hosted world geometry for the popularity map.
+
+build_world_geometry turns a countries GeoJSON (Natural Earth or any file
+with ISO or name properties) into one static file per entry in LEVELS,
+under movies/static/movies/geo/. Each feature keeps only its ISO 3166-1
+alpha-2 code as ``id`` and its name. map_data reports sales under the same
+codes, so the page joins the two without matching names.
+
+Simplification preserves topology, the way TopoJSON does. Rings are cut
+into arcs at junctions (points where neighbouring countries meet or
+part). Each arc is simplified once with Douglas-Peucker, keeping its
+endpoints, and the same result is reused by every ring that borders it.
+Neighbouring countries therefore keep a shared border, with no gaps or
+overlaps, at every level.
+
+The files are static assets, so in production they get content-hashed
+names, a one-year immutable Cache-Control and .gz/.br siblings (see
+moviesstore/assets.py).
+"""
+import json
+import os
+
+from django_countries import countries
+
+# (name, Douglas-Peucker tolerance in degrees, decimal places, first zoom it is shown at)
+LEVELS = (
+    ('low', 0.5, 2, 0),
+    ('medium', 0.1, 2, 4),
+    ('high', 0.0, 3, 5),
+)
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'static', 'movies', 'geo')
+
+
+def static_name(level):
+    return f'movies/geo/world-{level}.geojson'
+
+
+def country_code(properties):
+    """The ISO 3166-1 alpha-2 code for a feature's properties, or None."""
+    for key in ('ISO_A2', 'iso_a2', 'ISO3166-1-Alpha-2'):
+        code = countries.alpha2(properties.get(key) or '')
+        if code:
+            return code
+    for key in ('ISO_A3', 'iso_a3', 'ADM0_A3', 'ISO3166-1-Alpha-3'):
+        code = countries.alpha2(properties.get(key) or '')
+        if code:
+            return code
+    for key in ('ADMIN', 'NAME', 'name'):
+        code = countries.by_name(properties.get(key) or '')
+        if code:
+            return code
+    return None
+
+
+def polygons(geometry):
+    """The geometry as a list of polygons, each a list of rings."""
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def douglas_peucker(points, tolerance):
+    """Simplify an open polyline, always keeping both endpoints."""
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = points[first], points[last]
+        dx, dy = x2 - x1, y2 - y1
+        length_sq = dx * dx + dy * dy
+        farthest, distance = None, tolerance
+        for index in range(first + 1, last):
+            px, py = points[index]
+            if length_sq == 0:
+                offset = ((px - x1) ** 2 + (py - y1) ** 2) ** 0.5
+            else:
+                offset = abs(dy * px - dx * py + x2 * y1 - y2 * x1) / length_sq ** 0.5
+            if offset > distance:
+                farthest, distance = index, offset
+        if farthest is not None:
+            keep[farthest] = True
+            stack.extend([(first, farthest), (farthest, last)])
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def junctions(rings):
+    """Points where rings meet or part: those seen with more than one set of neighbours."""
+    neighbours = {}
+    found = set()
+    for ring in rings:
+        points = ring[:-1]
+        for index, point in enumerate(points):
+            pair = frozenset((points[index - 1], points[(index + 1) % len(points)]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                found.add(point)
+    return found
+
+
+class ArcSimplifier:
+    """Simplifies rings arc by arc so that shared arcs simplify identically."""
+
+    def __init__(self, rings, tolerance):
+        self.tolerance = tolerance
+        self.junctions = junctions(rings)
+        self.arcs = {}
+
+    def arc(self, points):
+        forward, backward = tuple(points), tuple(reversed(points))
+        canonical = min(forward, backward)
+        if canonical not in self.arcs:
+            self.arcs[canonical] = douglas_peucker(canonical, self.tolerance)
+        simplified = self.arcs[canonical]
+        return simplified if canonical == forward else simplified[::-1]
+
+    def ring(self, ring):
+        points = ring[:-1]
+        cuts = [index for index, point in enumerate(points) if point in self.junctions]
+        if not cuts:
+            # An island: cut it at the point farthest from its start so both halves keep an endpoint
+            start = points[0]
+            far = max(range(len(points)), key=lambda i: (points[i][0] - start[0]) ** 2 + (points[i][1] - start[1]) ** 2)
+            cuts = [0, far] if far else [0]
+        # Start the ring at its first cut so every arc runs from one cut to the next
+        points = points[cuts[0]:] + points[:cuts[0]]
+        cuts = [index - cuts[0] for index in cuts] + [len(points)]
+        points.append(points[0])
+        simplified = []
+        for start, end in zip(cuts, cuts[1:]):
+            simplified.extend(self.arc(points[start:end + 1])[:-1])
+        simplified.append(simplified[0])
+        return simplified
+
+
+def simplify(collection, tolerance, precision):
+    """Return slim ``(code, name, polygons)`` triples for every country in ``collection``."""
+    features = []
+    for feature in collection['features']:
+        properties = feature.get('properties') or {}
+        shapes = [[[(round(x, precision), round(y, precision)) for x, y, *_ in ring] for ring in polygon]
+                  for polygon in polygons(feature['geometry'] or {'type': None})]
+        shapes = [[dedupe(ring) for ring in polygon] for polygon in shapes]
+        features.append((country_code(properties), properties, shapes))
+
+    simplifier = ArcSimplifier([ring for _, _, shapes in features for polygon in shapes for ring in polygon
+                                if len(ring) >= 4], tolerance)
+    result = []
+    for code, properties, shapes in features:
+        kept = []
+        for polygon in shapes:
+            if len(polygon[0]) < 4:
+                continue
+            exterior = simplifier.ring(polygon[0])
+            if len(exterior) < 4:
+                # Tiny islands collapse at coarse levels; drop them
+                continue
+            holes = [simplifier.ring(ring) for ring in polygon[1:] if len(ring) >= 4]
+            kept.append([exterior] + [hole for hole in holes if len(hole) >= 4])
+        if not kept and shapes and shapes[0] and len(shapes[0][0]) >= 4:
+            # Never lose a whole country: keep its first outline unsimplified
+            kept = [[shapes[0][0]]]
+        if kept:
+            name = properties.get('ADMIN') or properties.get('NAME') or properties.get('name') or ''
+            result.append((code, name, kept))
+    return result
+
+
+def dedupe(ring):
+    """Drop consecutive duplicate points, which rounding can create."""
+    deduped = [point for index, point in enumerate(ring) if index == 0 or point != ring[index - 1]]
+    if deduped and deduped[0] != deduped[-1]:
+        deduped.append(deduped[0])
+    return deduped
+
+
+def to_geojson(shapes_by_country):
+    features = []
+    for code, name, shapes in shapes_by_country:
+        feature = {'type': 'Feature', 'properties': {'name': name}, 'geometry': {
+            'type': 'Polygon' if len(shapes) == 1 else 'MultiPolygon',
+            'coordinates': shapes[0] if len(shapes) == 1 else shapes,
+        }}
+        if code:
+            feature['id'] = code
+        features.append(feature)
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def build(collection, output_dir=OUTPUT_DIR):
+    """Write every level of ``collection``; returns ``{level: (path, bytes)}``."""
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}
+    for level, tolerance, precision, _ in LEVELS:
+        body = json.dumps(to_geojson(simplify(collection, tolerance, precision)), separators=(',', ':'))
+        path = os.path.join(output_dir, os.path.basename(static_name(level)))
+        with open(path, 'w') as output:
+            output.write(body)
+        written[level] = (path, len(body))
+    return written
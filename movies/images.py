@@ -0,0 +1,103 @@
+"""Sized, re-encoded derivatives of movie posters.
+
+Each poster gets one derivative per width in WIDTHS (capped at the
+original's own width) and per format: AVIF and WebP where this Pillow
+build supports them, plus a JPEG (PNG if the image has transparency)
+fallback.
+Derivatives are stored next to the uploads under ``derivatives/`` and
+recorded on Movie.image_derivatives. Templates (see
+templatetags/movie_images.py) can then emit srcset without touching the disk.
+
+New or replaced uploads are processed once the saving transaction commits.
+The build_image_derivatives command backfills existing posters in
+parallel. ``generate`` only reads and writes files and never the database,
+so it can run in worker processes.
+"""
+import io
+import logging
+import os
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, features
+
+from moviesstore import fragments
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (200, 400, 800)
+QUALITY = {'avif': 50, 'webp': 75, 'jpg': 80}
+PIL_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpg': 'JPEG', 'png': 'PNG'}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpg': 'image/jpeg', 'png': 'image/png'}
+
+
+def modern_formats():
+    """The next-generation formats this Pillow build can encode, best first."""
+    return [ext for ext in ('avif', 'webp') if features.check(ext)]
+
+
+def derivative_name(source, width, ext):
+    stem, _ = os.path.splitext(source)
+    return posixpath.join('derivatives', f'{stem}.{width}w.{ext}')
+
+
+def generate(source, force=False):
+    """Write every derivative of ``source`` and return its image_derivatives record.
+
+    Returns None when the original cannot be read.
+    """
+    try:
+        with default_storage.open(source) as original:
+            image = ImageOps.exif_transpose(Image.open(original))
+            image.load()
+    except (OSError, ValueError) as error:
+        logger.warning('Cannot build derivatives of %s: %s', source, error)
+        return None
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    fallback = 'png' if has_alpha else 'jpg'
+    formats = modern_formats() + [fallback]
+    # Every standard width the original can fill, then the original's own width
+    widths = [width for width in WIDTHS if width < image.width]
+    if image.width <= WIDTHS[-1]:
+        widths.append(image.width)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for ext in formats:
+            name = derivative_name(source, width, ext)
+            if not force and default_storage.exists(name):
+                continue
+            buffer = io.BytesIO()
+            resized.save(buffer, PIL_FORMATS[ext], quality=QUALITY.get(ext), optimize=True)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return {'source': source, 'widths': widths, 'formats': formats}
+
+
+def needs_derivatives(movie):
+    return bool(movie.image) and (movie.image_derivatives or {}).get('source') != movie.image.name
+
+
+def build_for(movie_id, source):
+    derivatives = generate(source)
+    if derivatives is not None:
+        # update(), not save(), so this does not trigger the receiver again;
+        # the cached movie cards are invalidated here instead
+        if Movie.objects.filter(pk=movie_id, image=source).update(image_derivatives=derivatives):
+            fragments.bump('movies')
+
+
+@receiver(post_save, sender=Movie)
+def movie_image_saved(sender, instance, **kwargs):
+    if needs_derivatives(instance):
+        movie_id, source = instance.pk, instance.image.name
+        transaction.on_commit(lambda: build_for(movie_id, source))
@@ -0,0 +1,84 @@
+"""Likes and ratings, written the same way by the HTML views and the JSON API.
+
+toggle_like() flips a row in a like table (the through table of
+Movie.liked_users or Review.liked_users) without loading any likers. It
+issues one DELETE and, only when nothing was deleted, one INSERT. Both use
+the table's unique (owner, user) index. The through table is written
+directly, so no m2m_changed signal fires, and the helpers here update the
+counters and fragment versions themselves.
+
+Call these inside transaction.atomic(), as with movies/stats.py.
+"""
+from django.db import IntegrityError, transaction
+
+from moviesstore import fragments
+from . import stats
+from .models import Movie, MovieStats, Rating, Review
+
+
+def toggle_like(through, owner_field, owner_id, user_id):
+    """Flip ``user_id``'s like of ``owner_id``; returns ``(liked, changed)``.
+
+    ``changed`` is False when a concurrent request inserted the same like
+    first, so the caller must not count it again.
+    """
+    deleted, _ = through.objects.filter(**{owner_field: owner_id, 'user_id': user_id}).delete()
+    if deleted:
+        return False, True
+    try:
+        with transaction.atomic():
+            through.objects.create(**{owner_field: owner_id, 'user_id': user_id})
+    except IntegrityError:
+        return True, False
+    return True, True
+
+
+def toggle_movie_like(movie_id, user_id):
+    """Returns ``(liked, like_count)``."""
+    liked, changed = toggle_like(Movie.liked_users.through, 'movie_id', movie_id, user_id)
+    movie_stats = None
+    if changed:
+        movie_stats = stats.like_toggled(movie_id, liked=liked)
+        fragments.bump('likes')
+    return liked, (movie_stats or current_stats(movie_id)).like_count
+
+
+def toggle_review_like(review_id, user_id):
+    """Returns ``(liked, like_count)``."""
+    liked, changed = toggle_like(Review.liked_users.through, 'review_id', review_id, user_id)
+    if changed:
+        stats.review_like_toggled(review_id, liked)
+        fragments.bump('reviews')
+    return liked, Review.objects.values_list('popularity', flat=True).get(pk=review_id)
+
+
+def rate(movie_id, user_id, value):
+    """Set ``user_id``'s rating of the movie; returns the movie's MovieStats afterwards."""
+    rating = Rating.objects.select_for_update().filter(movie_id=movie_id, user_id=user_id).first()
+    if rating is None:
+        # select_for_update() locks nothing while the row is missing
+        try:
+            with transaction.atomic():
+                Rating.objects.create(movie_id=movie_id, user_id=user_id, rating=value)
+        except IntegrityError:
+            # A concurrent first rating got in first; change that one instead
+            rating = Rating.objects.select_for_update().get(movie_id=movie_id, user_id=user_id)
+        else:
+            return stats.rating_added(movie_id, value) or current_stats(movie_id)
+    old_value = rating.rating
+    rating.rating = value
+    rating.save()
+    return stats.rating_changed(movie_id, old_value, value) or current_stats(movie_id)
+
+
+def unrate(movie_id, user_id):
+    """Remove ``user_id``'s rating of the movie, if any; returns the movie's MovieStats afterwards."""
+    rating = Rating.objects.select_for_update().filter(movie_id=movie_id, user_id=user_id).first()
+    if rating is None:
+        return current_stats(movie_id)
+    rating.delete()
+    return stats.rating_removed(movie_id, rating.rating) or current_stats(movie_id)
+
+
+def current_stats(movie_id):
+    return MovieStats.objects.filter(movie_id=movie_id).first() or MovieStats(movie_id=movie_id)
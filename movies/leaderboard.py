@@ -0,0 +1,90 @@
+"""Precomputed rankings for the movies index page.
+
+Each ranking ("board") is a set of LeaderboardEntry rows ordered by score.
+Boards are refreshed from the MovieStats counters whenever movies/stats.py
+adjusts them. Reading a board is then a single indexed range scan on
+(board, -score). Popular reviews are not a board: Review.popularity is a
+live counter with its own index.
+
+Everything here writes in bulk and sends no model signals, so a full
+rebuild bumps the index fragment groups that show the boards itself.
+"""
+from django.db.models import Q
+
+from moviesstore import fragments
+from .models import LeaderboardEntry, MovieStats
+
+MOVIE_BOARDS = [
+    LeaderboardEntry.MOVIES_BY_ORDERS,
+    LeaderboardEntry.MOVIES_BY_RATING,
+    LeaderboardEntry.MOVIES_BY_LIKES,
+]
+
+
+def movie_score(board, stats):
+    """Read a movie's score for one board from its MovieStats row."""
+    if board == LeaderboardEntry.MOVIES_BY_ORDERS:
+        return stats.units_sold
+    if board == LeaderboardEntry.MOVIES_BY_RATING:
+        return stats.avg_rating
+    if board == LeaderboardEntry.MOVIES_BY_LIKES:
+        return stats.like_count
+    raise ValueError(f"Unknown movie board: {board}")
+
+
+def refresh_movie(movie_id, boards=MOVIE_BOARDS):
+    """Refresh a movie's entries; returns the MovieStats row they were read from, or None."""
+    return refresh_movies([movie_id], boards).get(movie_id)
+
+
+def refresh_movies(movie_ids, boards=MOVIE_BOARDS):
+    """Refresh the movies' entries with one read plus at most one upsert and one delete.
+
+    Movies with nothing to rank on are dropped from a board so boards stay
+    small. Returns ``{movie_id: MovieStats}`` for the rows that were read.
+    """
+    stats_by_movie = MovieStats.objects.in_bulk(list(movie_ids))
+    upserts, empty = [], Q(pk__in=[])
+    for movie_id in movie_ids:
+        stats = stats_by_movie.get(movie_id)
+        for board in boards:
+            score = movie_score(board, stats) if stats else None
+            if score:
+                upserts.append(LeaderboardEntry(board=board, movie_id=movie_id, score=score))
+            else:
+                empty |= Q(board=board, movie_id=movie_id)
+    if upserts:
+        LeaderboardEntry.objects.bulk_create(
+            upserts, update_conflicts=True,
+            unique_fields=['board', 'movie'], update_fields=['score', 'updated_at'],
+        )
+    if len(upserts) < len(movie_ids) * len(boards):
+        LeaderboardEntry.objects.filter(empty).delete()
+    return stats_by_movie
+
+
+def rebuild():
+    """Recompute every board from scratch. Used by the rebuild_leaderboard command."""
+    LeaderboardEntry.objects.all().delete()
+    entries = []
+    for stats in MovieStats.objects.all():
+        for board in MOVIE_BOARDS:
+            score = movie_score(board, stats)
+            if score:
+                entries.append(LeaderboardEntry(board=board, movie_id=stats.movie_id, score=score))
+    LeaderboardEntry.objects.bulk_create(entries)
+    fragments.bump('ratings', 'likes', 'orders')
+
+
+def top_movies(board, limit, score_attr):
+    """Return the top movies of a board, with the score set as ``score_attr``."""
+    entries = (LeaderboardEntry.objects
+               .filter(board=board)
+               .select_related('movie')
+               .order_by('-score')[:limit])
+    movies = []
+    for entry in entries:
+        score = entry.score
+        setattr(entry.movie, score_attr, int(score) if score.is_integer() else score)
+        movies.append(entry.movie)
+    return movies
@@ -0,0 +1,160 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from movies.models import Movie, RequestedMovie, Review
+from moviesstore.testing import seed_store
+from petitions.models import Petition
+
+# URLs that would end the audit's session or place an order on a GET
+SKIPPED_URLS = {'accounts.logout', 'cart.purchase', 'cart.clear'}
+SCAN_RE = {
+    'sqlite': re.compile(r'^SCAN (\w+)\b(?! USING (?:COVERING )?INDEX)'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+SORT_RE = {
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)'),
+    'postgresql': re.compile(r'^\s*(?:->\s*)?Sort\b'),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+def url_names(resolver=None):
+    """Every named URL pattern of the project, with its keyword argument names."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name == 'admin':
+                continue
+            yield from url_names(pattern)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, list(pattern.pattern.converters)
+
+
+class Command(BaseCommand):
+    help = ("Request every view on a seeded store, EXPLAIN each query it runs and report full table scans "
+            "and temporary sorts (changes are rolled back)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-seed', action='store_true',
+                            help='Audit the data already in the database instead of seeding a store.')
+        parser.add_argument('--verbose', action='store_true', help='Print the offending SQL too.')
+        parser.add_argument('--fail', action='store_true',
+                            help='Exit with an error if any full scan is found, e.g. in CI.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SCAN_RE:
+            raise CommandError(f'EXPLAIN parsing is not implemented for {connection.vendor}.')
+        # The seeded store is rolled back, but pages, fragments and map payloads
+        # rendered from it would outlive it in a shared cache, under versions and
+        # order ids that real data reuses. Give the audit private caches instead.
+        private_caches = {
+            alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'audit-indexes-{alias}'}
+            for alias in settings.CACHES
+        }
+        with override_settings(CACHES=private_caches):
+            try:
+                with transaction.atomic():
+                    findings = self.audit(seed=not options['no_seed'])
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                for alias in private_caches:
+                    caches[alias].clear()
+        self.report(findings, options['verbose'])
+        if options['fail'] and any(kind == 'scan' for kind, _ in findings):
+            raise CommandError('Full table scans found.')
+
+    def audit(self, seed):
+        if seed:
+            seed_store()
+        shopper = User.objects.order_by('-order__id').first()
+        if shopper is None or not Movie.objects.exists():
+            raise CommandError('The audit needs movies and at least one order; drop --no-seed.')
+        kwargs = {
+            'id': Movie.objects.order_by('-stats__like_count').values_list('id', flat=True).first(),
+            'review_id': Review.objects.values_list('id', flat=True).first() or 0,
+            'request_id': RequestedMovie.objects.values_list('id', flat=True).first() or 0,
+            'petition_id': Petition.objects.values_list('id', flat=True).first() or 0,
+            'region': 'France',
+        }
+        # A broken view should not stop the audit; its queries up to the error are still explained
+        anonymous, member = Client(raise_request_exception=False), Client(raise_request_exception=False)
+        member.force_login(shopper)
+
+        findings = defaultdict(set)
+        # The query log is capped and cleared when each request starts; keep one request's worth in it
+        request_started.disconnect(reset_queries)
+        try:
+            for name, params in url_names():
+                if name in SKIPPED_URLS:
+                    continue
+                url = reverse(name, kwargs={param: kwargs[param] for param in params})
+                for client in (anonymous, member):
+                    reset_queries()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url)
+                    if response.status_code >= 500:
+                        self.stderr.write(f'{url} answered {response.status_code}')
+                    for query in queries.captured_queries:
+                        for finding in self.explain(query['sql']):
+                            findings[finding].add(name)
+        finally:
+            request_started.connect(reset_queries)
+        return findings
+
+    def explain(self, sql):
+        """Yield ``(kind, detail)`` for each full scan or temporary sort in ``sql``'s plan."""
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return
+        vendor = connection.vendor
+        prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            if not hasattr(self, 'tables'):
+                self.tables = set(connection.introspection.table_names(cursor))
+            cursor.execute(prefix + sql)
+            lines = [row[-1] for row in cursor.fetchall()]
+        for line in lines:
+            scan = SCAN_RE[vendor].search(line.strip())
+            # Scans of derived tables (subqueries, window emulation) are not table scans
+            if scan and scan.group(1) in self.tables:
+                yield 'scan', (scan.group(1), sql)
+            sort = SORT_RE[vendor].search(line)
+            if sort:
+                yield 'sort', (line.strip(), sql)
+
+    def report(self, findings, verbose):
+        if not findings:
+            self.stdout.write(self.style.SUCCESS('No full table scans or temporary sorts.'))
+            return
+        by_table = defaultdict(lambda: (set(), set()))
+        for (kind, (detail, sql)), views in findings.items():
+            key = detail if kind == 'scan' else f'sort: {detail}'
+            by_table[key][0].update(views)
+            by_table[key][1].add(sql)
+        scans = sorted(key for key in by_table if not key.startswith('sort: '))
+        sorts = sorted(key for key in by_table if key.startswith('sort: '))
+        for title, keys in (('Full table scans', scans), ('Temporary sorts', sorts)):
+            if not keys:
+                continue
+            self.stdout.write(self.style.WARNING(title))
+            for key in keys:
+                views, statements = by_table[key]
+                self.stdout.write(f"  {key.removeprefix('sort: ')} ({len(statements)} queries): "
+                                  f"{', '.join(sorted(views))}")
+                if verbose:
+                    for sql in sorted(statements):
+                        self.stdout.write(f'      {sql}')
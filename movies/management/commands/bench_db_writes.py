@@ -0,0 +1,91 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from cart.models import Item, Order
+from movies import interactions, stats
+from movies.models import Movie
+
+BENCH_PREFIX = 'bench-db-writes'
+
+
+class Command(BaseCommand):
+    help = ('Benchmark concurrent likes, ratings and purchases against the configured database '
+            '(run once per MOVIESSTORE_DB profile to compare them; bench rows are deleted afterwards)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', default='1,4,8,16',
+                            help='Comma-separated numbers of concurrent writers to measure.')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration of each run.')
+        parser.add_argument('--movies', type=int, default=5,
+                            help='Movies the writers share; fewer means hotter rows.')
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        self.stdout.write(f"{connection.vendor} {settings_dict['NAME']} {settings_dict.get('OPTIONS') or ''}")
+        self.stdout.write(f"{'threads':>8} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'locked':>7}")
+        for threads in [int(count) for count in options['threads'].split(',')]:
+            movies = Movie.objects.bulk_create(
+                Movie(name=f'{BENCH_PREFIX} {i}', price=10, description='Benchmark filler.',
+                      image='movie_images/bench.jpg')
+                for i in range(options['movies'])
+            )
+            users = [User.objects.create_user(f'{BENCH_PREFIX}-{i}', password='unused') for i in range(threads)]
+            try:
+                self.run(users, movies, options['seconds'])
+            finally:
+                User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+                Movie.objects.filter(name__startswith=BENCH_PREFIX).delete()
+
+    def run(self, users, movies, seconds):
+        latencies, locked = [], []
+        deadline = []
+        # Every writer starts together, and the clock starts when they do
+        start_line = threading.Barrier(len(users), action=lambda: deadline.append(time.perf_counter() + seconds))
+
+        def writer(user):
+            own_latencies, own_locked = [], 0
+            start_line.wait()
+            i = 0
+            try:
+                while time.perf_counter() < deadline[0]:
+                    began = time.perf_counter()
+                    try:
+                        self.write(user, movies[i % len(movies)], i)
+                    except OperationalError:
+                        # "database is locked": the writer gave up waiting for the lock
+                        own_locked += 1
+                    else:
+                        own_latencies.append((time.perf_counter() - began) * 1000)
+                    i += 1
+            finally:
+                connection.close()
+            latencies.extend(own_latencies)
+            locked.append(own_locked)
+
+        workers = [threading.Thread(target=writer, args=(user,)) for user in users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        p50 = statistics.median(latencies) if latencies else 0.0
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else p50
+        self.stdout.write(f'{len(users):>8} {len(latencies) / seconds:>9.0f} {p50:>8.2f} {p95:>8.2f} '
+                          f'{sum(locked):>7}')
+
+    def write(self, user, movie, i):
+        """One user action, through the same helpers as the views: a like toggle, a rating or a purchase."""
+        action = i % 3
+        with transaction.atomic():
+            if action == 0:
+                interactions.toggle_movie_like(movie.id, user.id)
+            elif action == 1:
+                interactions.rate(movie.id, user.id, i % 10 + 1)
+            else:
+                order = Order.objects.create(user=user, total=movie.price)
+                Item.objects.bulk_create([Item(order=order, movie=movie, price=movie.price, quantity=1)])
+                stats.record_purchase({movie.id: 1})
@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies import images
+from movies.models import Movie
+from moviesstore import fragments
+
+
+class Command(BaseCommand):
+    help = 'Generate sized AVIF/WebP/JPEG poster derivatives for existing movies, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (default: one per CPU).')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild every derivative, not just missing ones.')
+
+    def handle(self, *args, **options):
+        movies = [movie for movie in Movie.objects.exclude(image='').only('id', 'image', 'image_derivatives')
+                  if options['force'] or images.needs_derivatives(movie)]
+        sources = {}
+        for movie in movies:
+            sources.setdefault(movie.image.name, []).append(movie.id)
+        if not sources:
+            self.stdout.write('Every poster already has its derivatives.')
+            return
+
+        # Workers only touch files; close the connections so none are shared across the fork
+        connections.close_all()
+        built, failed = 0, 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = {pool.submit(images.generate, source, options['force']): source for source in sources}
+            for future in as_completed(futures):
+                source = futures[future]
+                derivatives = future.result()
+                if derivatives is None:
+                    failed += 1
+                    continue
+                Movie.objects.filter(id__in=sources[source], image=source).update(image_derivatives=derivatives)
+                built += 1
+        if built:
+            # update() sends no post_save, so the cached movie cards still show the plain <img>
+            fragments.bump('movies')
+        self.stdout.write(self.style.SUCCESS(
+            f'Built derivatives for {built} posters ({failed} unreadable) with {options["workers"]} workers.'
+        ))
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from movies import recommend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed "Recommended for you" neighbors (needs NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, metavar='MINUTES',
+                            help='Only recompute movies rated or purchased in the last MINUTES, and the '
+                                 'other movies of the users who did so. Likes and removed ratings have no '
+                                 'timestamp, so they are only picked up by a full build.')
+        parser.add_argument('--top-k', type=int, default=recommend.TOP_K,
+                            help='Neighbors kept per movie.')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError('build_recommendations needs NumPy: pip install numpy')
+
+        movie_ids = None
+        if options['since'] is not None:
+            movie_ids = recommend.changed_movies(timezone.now() - timedelta(minutes=options['since']))
+        written = recommend.build(movie_ids, top_k=options['top_k'])
+        scope = 'all movies' if movie_ids is None else f'{len(movie_ids)} changed movies'
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} neighbors for {scope}.'))
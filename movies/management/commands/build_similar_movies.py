@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from movies import similar
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "people who bought or liked this also..." neighbors from orders and likes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=similar.TOP_K,
+                            help='Neighbors kept per movie.')
+        parser.add_argument('--partition-size', type=int, default=similar.PARTITION_SIZE,
+                            help='Movies counted per pass over the baskets; lower it to use less memory.')
+        parser.add_argument('--user-chunk', type=int, default=similar.USER_CHUNK,
+                            help='Users whose baskets are fetched per query.')
+
+    def handle(self, *args, **options):
+        written = similar.build(top_k=options['top_k'], partition_size=options['partition_size'],
+                                user_chunk=options['user_chunk'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {written} also-bought neighbors.'))
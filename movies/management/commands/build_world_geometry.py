@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import geometry
+
+
+class Command(BaseCommand):
+    help = 'Write the simplified world geometry files the popularity map serves, from a countries GeoJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Countries GeoJSON, e.g. Natural Earth admin-0 countries.')
+        parser.add_argument('--output', default=geometry.OUTPUT_DIR,
+                            help='Directory for the world-<level>.geojson files.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['source']) as source:
+                collection = json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {options["source"]}: {error}')
+        for level, (path, size) in geometry.build(collection, options['output']).items():
+            self.stdout.write(f'{level}: {path} ({size / 1024:.0f} KiB)')
+        self.stdout.write(self.style.SUCCESS('World geometry written.'))
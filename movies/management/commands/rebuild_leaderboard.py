@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from movies import leaderboard
+from movies.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute every movies index leaderboard from MovieStats'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt leaderboards ({LeaderboardEntry.objects.count()} entries).'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from movies import leaderboard, stats
+from movies.models import MovieStats
+
+FIELDS = ('rating_sum', 'rating_count', 'like_count', 'units_sold')
+
+
+class Command(BaseCommand):
+    help = 'Recompute the MovieStats counters from the Rating, Item and like tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report counters that disagree with the child tables; do not write.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = stats.computed_stats()
+            current = {row.movie_id: row for row in MovieStats.objects.all()}
+
+            mismatches = []
+            for movie_id, values in expected.items():
+                row = current.get(movie_id)
+                for field in FIELDS:
+                    actual = getattr(row, field) if row else None
+                    if actual != values[field]:
+                        mismatches.append((movie_id, field, actual, values[field]))
+
+            if options['verify']:
+                for movie_id, field, actual, wanted in mismatches:
+                    self.stdout.write(f'Movie {movie_id}: {field} is {actual}, expected {wanted}')
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} counter(s) out of date.')
+                self.stdout.write(self.style.SUCCESS(f'All {len(expected)} movie stats rows are correct.'))
+                return
+
+            MovieStats.objects.all().delete()
+            MovieStats.objects.bulk_create(
+                MovieStats(movie_id=movie_id, **values) for movie_id, values in expected.items()
+            )
+            leaderboard.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt stats for {len(expected)} movies ({len(mismatches)} counter(s) corrected).'
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from movies import stats
+from moviesstore import fragments
+from movies.models import Review
+
+
+class Command(BaseCommand):
+    help = 'Recompute Review.popularity from the review like table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report counters that disagree with the like table; do not write.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = stats.computed_popularity()
+            reviews = list(Review.objects.only('id', 'popularity'))
+
+            mismatches, stale = [], []
+            for review in reviews:
+                if review.popularity != expected[review.id]:
+                    mismatches.append((review.id, review.popularity, expected[review.id]))
+                    review.popularity = expected[review.id]
+                    stale.append(review)
+
+            if options['verify']:
+                for review_id, actual, wanted in mismatches:
+                    self.stdout.write(f'Review {review_id}: popularity is {actual}, expected {wanted}')
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} counter(s) out of date.')
+                self.stdout.write(self.style.SUCCESS(f'All {len(reviews)} review counters are correct.'))
+                return
+
+            Review.objects.bulk_update(stale, ['popularity'], batch_size=500)
+            if stale:
+                # bulk_update sends no post_save for movies/fragments.py
+                fragments.bump('reviews')
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt popularity for {len(reviews)} reviews ({len(mismatches)} counter(s) corrected).'
+        ))
@@ -0,0 +1,81 @@
+"""Versioned, precompressed cache for the popularity map JSON.
+
+The payload is built from RegionalSales rows and movie names, so its
+version is the pair of fragment versions (see moviesstore/fragments.py) for
+the 'regional_sales' and 'movies' groups. stats.record_purchase and the
+rebuild_regional_sales command bump 'regional_sales'; movie saves bump
+'movies'. Reading the version is one cache round trip and no query. It
+drives the ETag, and a built payload is cached under it, so only those
+writes invalidate either.
+"""
+import gzip
+import json
+import re
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django_countries import countries
+
+from moviesstore import fragments
+
+# Same check django.middleware.gzip uses
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# Bump when the payload's shape changes, so neither the cache nor a browser's ETag serves the old one
+PAYLOAD_VERSION = 2
+# Stands for every region name that matches no country; they all get the same 404 payload
+UNKNOWN_REGION = 'unknown'
+GROUPS = ('regional_sales', 'movies')
+
+
+def data_version(request):
+    """Return the payload's data version as a string, memoized per request."""
+    if not hasattr(request, '_map_data_version'):
+        found = fragments.versions(*GROUPS)
+        request._map_data_version = '.'.join(str(found[group]) for group in GROUPS)
+    return request._map_data_version
+
+
+def region_key(request):
+    """The requested region as a country code, '' for all regions or UNKNOWN_REGION.
+
+    The raw parameter never reaches a header or a cache key, so neither can
+    be made invalid or grow without bound.
+    """
+    region = request.GET.get('region', '')
+    if not region:
+        return ''
+    return countries.by_name(region) or UNKNOWN_REGION
+
+
+def etag(request, *args, **kwargs):
+    return f'W/"map-v{PAYLOAD_VERSION}-{data_version(request)}-{region_key(request)}"'
+
+
+def cached_response(request, build):
+    """Serve the payload for this request's version, building it on a miss.
+
+    ``build`` returns ``(data, status)``. The JSON body and its gzip encoding
+    are both cached, so repeat requests cost neither serialization nor
+    compression.
+    """
+    key = f'map_data:v{PAYLOAD_VERSION}:{data_version(request)}:{region_key(request)}'
+    entry = cache.get(key)
+    if entry is None:
+        data, status = build()
+        body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        entry = (status, body, gzip.compress(body))
+        cache.set(key, entry, CACHE_TIMEOUT)
+    status, body, compressed = entry
+
+    use_gzip = re_accepts_gzip.search(request.headers.get('Accept-Encoding', ''))
+    response = HttpResponse(compressed if use_gzip else body,
+                            content_type='application/json', status=status)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Let browsers keep the payload but always revalidate it against the ETag
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_leaderboard(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Review = apps.get_model('movies', 'Review')
+    LeaderboardEntry = apps.get_model('movies', 'LeaderboardEntry')
+    movie_boards = {
+        'movies_by_orders': Sum('item__quantity'),
+        'movies_by_rating': Avg('rating__rating'),
+        'movies_by_likes': Count('liked_users'),
+    }
+    entries = []
+    for board, aggregate in movie_boards.items():
+        for movie_id, score in Movie.objects.annotate(score=aggregate).values_list('id', 'score'):
+            if score:
+                entries.append(LeaderboardEntry(board=board, movie_id=movie_id, score=score))
+    for review_id, score in Review.objects.annotate(score=Count('liked_users')).values_list('id', 'score'):
+        if score:
+            entries.append(LeaderboardEntry(board='reviews_by_likes', review_id=review_id, score=score))
+    LeaderboardEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_rating'),
+        ('cart', '0002_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('movies_by_orders', 'Movies by units ordered'), ('movies_by_rating', 'Movies by average rating'), ('movies_by_likes', 'Movies by likes'), ('reviews_by_likes', 'Reviews by likes')], max_length=32)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.movie')),
+                ('review', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.review')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', '-score'], name='leaderboard_board_score')],
+                'constraints': [models.UniqueConstraint(fields=('board', 'movie'), name='leaderboard_unique_movie'), models.UniqueConstraint(fields=('board', 'review'), name='leaderboard_unique_review')],
+            },
+        ),
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_movie_stats(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    MovieStats = apps.get_model('movies', 'MovieStats')
+    rows = []
+    for movie in Movie.objects.all():
+        ratings = movie.rating_set.aggregate(total=Sum('rating'), count=Count('id'))
+        rows.append(MovieStats(
+            movie=movie,
+            rating_sum=ratings['total'] or 0,
+            rating_count=ratings['count'],
+            like_count=movie.liked_users.count(),
+            units_sold=movie.item_set.aggregate(total=Sum('quantity'))['total'] or 0,
+        ))
+    MovieStats.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='movies.movie')),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('like_count', models.IntegerField(default=0)),
+                ('units_sold', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_movie_stats, migrations.RunPython.noop),
+    ]
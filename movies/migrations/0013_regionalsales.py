@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:03
+
+import django.db.models.deletion
+import django_countries.fields
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_regional_sales(apps, schema_editor):
+    Item = apps.get_model('cart', 'Item')
+    RegionalSales = apps.get_model('movies', 'RegionalSales')
+    rows = (Item.objects
+            .filter(order__user__profile__country__gt='')
+            .values('order__user__profile__country', 'movie_id')
+            .annotate(total=Sum('quantity')))
+    RegionalSales.objects.bulk_create(
+        RegionalSales(country=row['order__user__profile__country'], movie_id=row['movie_id'],
+                      units_sold=row['total'])
+        for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_moviestats'),
+        ('accounts', '0002_remove_userprofile_state_alter_userprofile_country'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionalSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', django_countries.fields.CountryField(max_length=2)),
+                ('units_sold', models.IntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regional_sales', to='movies.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['country', '-units_sold'], name='regionalsales_country_units')],
+                'constraints': [models.UniqueConstraint(fields=('country', 'movie'), name='regionalsales_unique_country_movie')],
+            },
+        ),
+        migrations.RunPython(backfill_regional_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+# External-content FTS5 index over Movie.name/description. The triggers keep
+# it in sync with movies_movie on every insert, update and delete.
+CREATE_FTS = [
+    """
+    CREATE VIRTUAL TABLE movies_movie_fts USING fts5(
+        name, description,
+        content='movies_movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(movies_movie_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF name, description ON movies_movie BEGIN
+        INSERT INTO movies_movie_fts(movies_movie_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO movies_movie_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO movies_movie_fts(movies_movie_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS movies_movie_fts_update",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_delete",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_insert",
+    "DROP TABLE IF EXISTS movies_movie_fts",
+]
+
+
+def run_on_sqlite(statements):
+    def run(apps, schema_editor):
+        # Other databases use the LIKE fallback in movies/search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_regionalsales'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_FTS), run_on_sqlite(DROP_FTS)),
+    ]
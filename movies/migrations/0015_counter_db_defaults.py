@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_movie_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='moviestats',
+            name='like_count',
+            field=models.IntegerField(db_default=0, default=0),
+        ),
+        migrations.AlterField(
+            model_name='moviestats',
+            name='rating_count',
+            field=models.IntegerField(db_default=0, default=0),
+        ),
+        migrations.AlterField(
+            model_name='moviestats',
+            name='rating_sum',
+            field=models.IntegerField(db_default=0, default=0),
+        ),
+        migrations.AlterField(
+            model_name='moviestats',
+            name='units_sold',
+            field=models.IntegerField(db_default=0, default=0),
+        ),
+        migrations.AlterField(
+            model_name='regionalsales',
+            name='units_sold',
+            field=models.IntegerField(db_default=0, default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_counter_db_defaults'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('cf', 'Collaborative filtering')], max_length=16)),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='movies.movie')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='movies.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['movie', 'source', '-score'], name='movieneighbor_movie_score')],
+                'constraints': [models.UniqueConstraint(fields=('movie', 'source', 'neighbor'), name='movieneighbor_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_movie_neighbors'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movieneighbor',
+            name='source',
+            field=models.CharField(choices=[('cf', 'Collaborative filtering'), ('also', 'Bought or liked by the same people')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_movie_neighbor_also'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
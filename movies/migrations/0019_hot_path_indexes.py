@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0018_movie_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-date', '-id'], name='movie_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['movie', 'rating'], name='rating_movie_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='requestedmovie',
+            index=models.Index(fields=['-requested_at'], name='requestedmovie_requested_at'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', '-rating'], name='review_movie_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', '-date'], name='review_movie_date'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-rating'], name='review_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-date'], name='review_date'),
+        ),
+    ]
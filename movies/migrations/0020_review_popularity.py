@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_popularity(apps, schema_editor):
+    Review = apps.get_model('movies', 'Review')
+    LeaderboardEntry = apps.get_model('movies', 'LeaderboardEntry')
+    likes = (Review.liked_users.through.objects
+             .filter(review_id=OuterRef('pk'))
+             .values('review_id')
+             .annotate(count=Count('id'))
+             .values('count'))
+    Review.objects.update(popularity=Coalesce(Subquery(likes), 0))
+    # The review board is retired; its rows would block dropping the column
+    LeaderboardEntry.objects.filter(board='reviews_by_likes').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0019_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='leaderboardentry',
+            name='leaderboard_unique_review',
+        ),
+        migrations.RemoveField(
+            model_name='leaderboardentry',
+            name='review',
+        ),
+        migrations.AlterField(
+            model_name='leaderboardentry',
+            name='board',
+            field=models.CharField(choices=[('movies_by_orders', 'Movies by units ordered'), ('movies_by_rating', 'Movies by average rating'), ('movies_by_likes', 'Movies by likes')], max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='popularity',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['movie', '-popularity', '-id'], name='review_movie_popularity'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['-popularity', '-id'], name='review_popularity'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def delete_orphans(apps, schema_editor):
+    LeaderboardEntry = apps.get_model('movies', 'LeaderboardEntry')
+    # Left over from the retired review board; every board now ranks movies
+    LeaderboardEntry.objects.filter(movie__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0020_review_popularity'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_orphans, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='leaderboardentry',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='movies.movie'),
+        ),
+    ]
@@ -3,6 +3,9 @@ from django.contrib.auth.models import User
 from cart.models import Order
 from cart.models import Item
 from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django_countries.fields import CountryField
 
 class Movie(models.Model):
     id = models.AutoField(primary_key=True)
@@ -13,6 +16,63 @@ class Movie(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     day = models.DateField(auto_now_add=True)
     liked_users = models.ManyToManyField(User, related_name="liked_movies", blank=True)
+    # Sized AVIF/WebP/JPEG copies of image, written by movies/images.py
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Newest-first listings (index page, catalog keyset pages)
+            models.Index(fields=['-date', '-id'], name='movie_date_id'),
+        ]
+
+class MovieStats(models.Model):
+    """Denormalized per-movie counters, maintained by movies/stats.py.
+
+    Pages read these columns instead of aggregating over Rating, Item and
+    the liked_users table. rebuild_movie_stats recomputes and verifies them.
+    """
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    rating_sum = models.IntegerField(default=0, db_default=0)
+    rating_count = models.IntegerField(default=0, db_default=0)
+    like_count = models.IntegerField(default=0, db_default=0)
+    units_sold = models.IntegerField(default=0, db_default=0)
+
+    def __str__(self):
+        return f"Stats for {self.movie_id}"
+
+    @property
+    def avg_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+
+# Every movie gets a stats row so counter updates never have to create one
+@receiver(post_save, sender=Movie)
+def create_movie_stats(sender, instance, created, **kwargs):
+    if created:
+        MovieStats.objects.get_or_create(movie=instance)
+
+class RegionalSales(models.Model):
+    """Units sold per (country, movie), keyed by the buyer's profile country.
+
+    Filled in by cart.views.purchase through movies/stats.py so the map
+    endpoints read a top-N per country instead of walking every Item.
+    """
+    country = CountryField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='regional_sales')
+    units_sold = models.IntegerField(default=0, db_default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'movie'], name='regionalsales_unique_country_movie'),
+        ]
+        indexes = [
+            models.Index(fields=['country', '-units_sold'], name='regionalsales_country_units'),
+        ]
+
+    def __str__(self):
+        return f"{self.country} - {self.movie_id}: {self.units_sold}"
 
 class RequestedMovie(models.Model):
     title = models.CharField(max_length=255)
@@ -22,6 +82,11 @@ class RequestedMovie(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-requested_at'], name='requestedmovie_requested_at'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -29,18 +94,31 @@ class Review(models.Model):
     id = models.AutoField(primary_key=True)
     comment = models.CharField(max_length=255)
     rating = models.IntegerField(default=0)
-    popularity = models.IntegerField(default=0)
+    # Number of likes, kept in step with liked_users by movies/stats.py
+    popularity = models.IntegerField(default=0, editable=False)
     date = models.DateTimeField(auto_now_add=True)
     liked_users = models.ManyToManyField(User, blank=True, related_name='liked_reviews')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # A movie's reviews best-first or newest-first, and the store-wide top reviews
+            models.Index(fields=['movie', '-rating'], name='review_movie_rating'),
+            models.Index(fields=['movie', '-date'], name='review_movie_date'),
+            models.Index(fields=['-rating'], name='review_rating'),
+            models.Index(fields=['-date'], name='review_date'),
+            # A movie's most helpful reviews, and the store-wide most popular ones
+            models.Index(fields=['movie', '-popularity', '-id'], name='review_movie_popularity'),
+            models.Index(fields=['-popularity', '-id'], name='review_popularity'),
+        ]
     
     def __str__(self):
         return str(self.id) + ' - ' + self.movie.name
     
     @property
     def likes(self):
-        return self.liked_users.count()
+        return self.popularity
 
 # NEW MODEL: Separate ratings from reviews
 class Rating(models.Model):
@@ -52,6 +130,74 @@ class Rating(models.Model):
     
     class Meta:
         unique_together = ('movie', 'user')  # One rating per user per movie
+        indexes = [
+            # Covers per-movie averages without reading the table
+            models.Index(fields=['movie', 'rating'], name='rating_movie_rating'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.movie.name}: {self.rating}/10"
\ No newline at end of file
+        return f"{self.user.username} - {self.movie.name}: {self.rating}/10"
+
+class LeaderboardEntry(models.Model):
+    """One precomputed row of a ranking shown on the movies index page.
+
+    Rows are kept current by movies/leaderboard.py, so the index page reads
+    a handful of indexed rows instead of grouping the Item/Rating/like
+    tables on every request. Popular reviews need no board: they are read
+    from the Review.popularity index.
+    """
+    MOVIES_BY_ORDERS = 'movies_by_orders'
+    MOVIES_BY_RATING = 'movies_by_rating'
+    MOVIES_BY_LIKES = 'movies_by_likes'
+    BOARD_CHOICES = [
+        (MOVIES_BY_ORDERS, 'Movies by units ordered'),
+        (MOVIES_BY_RATING, 'Movies by average rating'),
+        (MOVIES_BY_LIKES, 'Movies by likes'),
+    ]
+
+    board = models.CharField(max_length=32, choices=BOARD_CHOICES)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['board', '-score'], name='leaderboard_board_score'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'movie'], name='leaderboard_unique_movie'),
+        ]
+
+    def __str__(self):
+        return f"{self.board}: {self.movie} ({self.score})"
+
+class MovieNeighbor(models.Model):
+    """One of a movie's top-K most similar movies, precomputed offline.
+
+    movies/recommend.py fills the 'cf' rows from item-item cosine similarity
+    over ratings, likes and purchases; movies/similar.py fills the 'also'
+    rows from purchase and like co-occurrence. Reading a movie's neighbors
+    is an index range scan on (movie, source, -score).
+    """
+    COLLABORATIVE = 'cf'
+    ALSO = 'also'
+    SOURCE_CHOICES = [
+        (COLLABORATIVE, 'Collaborative filtering'),
+        (ALSO, 'Bought or liked by the same people'),
+    ]
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbor_of')
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES)
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'source', 'neighbor'], name='movieneighbor_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['movie', 'source', '-score'], name='movieneighbor_movie_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} -> {self.neighbor_id} ({self.source}: {self.score:.3f})"
@@ -0,0 +1,168 @@
+"""Item-item collaborative filtering for the "Recommended for you" row.
+
+Every (user, movie) pair gets an interaction weight: 1 for a like, 1 for a
+purchase and rating/10 for a rating, summed. Those triples form a sparse
+user x movie matrix. The similarity of two movies is the cosine of their
+columns, and each movie keeps its TOP_K most similar movies as MovieNeighbor
+rows.
+
+The build needs NumPy. It only runs offline, in ``manage.py
+build_recommendations``, and never on a request. The matrix is kept sparse
+(CSR index arrays), so the work per movie is proportional to the
+interactions of the users who touched it. A full build replaces every
+'cf' row. An incremental build recomputes only the movies with new
+activity, the other movies of the users behind it, and the movies that
+currently list a changed movie as a neighbor.
+
+Serving is two queries: the movies the user has interacted with, then
+the neighbors of those movies summed by score.
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from cart.models import Item
+from .models import Movie, MovieNeighbor, Rating
+
+TOP_K = 20
+# How many of the user's own movies seed a recommendation
+MAX_SEEDS = 50
+CHUNK_SIZE = 1000
+
+
+def interactions():
+    """Return ``{(user_id, movie_id): weight}`` for every interaction in the store."""
+    weights = {}
+
+    def add(pairs, weight):
+        for key in pairs:
+            weights[key] = weights.get(key, 0.0) + weight
+
+    add(Movie.liked_users.through.objects.values_list('user_id', 'movie_id').iterator(CHUNK_SIZE), 1.0)
+    add(Item.objects.values_list('order__user_id', 'movie_id').distinct().iterator(CHUNK_SIZE), 1.0)
+    for user_id, movie_id, rating in Rating.objects.values_list('user_id', 'movie_id', 'rating').iterator(CHUNK_SIZE):
+        weights[user_id, movie_id] = weights.get((user_id, movie_id), 0.0) + rating / 10
+    return weights
+
+
+class SimilarityMatrix:
+    """Sparse user x movie matrix with normalized columns, built with NumPy."""
+
+    def __init__(self, weights):
+        import numpy as np
+
+        self.np = np
+        pairs = list(weights)
+        users = np.fromiter((user_id for user_id, _ in pairs), dtype=np.int64, count=len(pairs))
+        movies = np.fromiter((movie_id for _, movie_id in pairs), dtype=np.int64, count=len(pairs))
+        values = np.fromiter(weights.values(), dtype=np.float64, count=len(pairs))
+
+        self.movie_ids, movie_index = np.unique(movies, return_inverse=True)
+        _, user_index = np.unique(users, return_inverse=True)
+
+        # Cosine similarity is the dot product of L2-normalized columns
+        norms = np.sqrt(np.bincount(movie_index, weights=values ** 2))
+        values = values / norms[movie_index]
+
+        # CSR by movie (which users touched it) and by user (which movies they touched)
+        self.by_movie = self._csr(movie_index, user_index, values, len(self.movie_ids))
+        self.by_user = self._csr(user_index, movie_index, values, user_index.max() + 1 if len(pairs) else 0)
+
+    def _csr(self, rows, cols, values, num_rows):
+        np = self.np
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(num_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+        return indptr, cols[order], values[order]
+
+    def neighbors(self, movie_id, top_k=TOP_K):
+        """Return ``[(neighbor_id, score)]``, best first, for one movie."""
+        np = self.np
+        position = np.searchsorted(self.movie_ids, movie_id)
+        if position == len(self.movie_ids) or self.movie_ids[position] != movie_id:
+            return []
+        m_ptr, m_users, m_values = self.by_movie
+        u_ptr, u_movies, u_values = self.by_user
+        users = m_users[m_ptr[position]:m_ptr[position + 1]]
+        weights = m_values[m_ptr[position]:m_ptr[position + 1]]
+
+        # Gather every (user, movie) entry of the users who touched this movie
+        starts, lengths = u_ptr[users], u_ptr[users + 1] - u_ptr[users]
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        scores = np.bincount(u_movies[offsets], weights=u_values[offsets] * np.repeat(weights, lengths),
+                             minlength=len(self.movie_ids))
+        scores[position] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(int(self.movie_ids[i]), float(scores[i])) for i in candidates]
+
+
+def build(movie_ids=None, top_k=TOP_K):
+    """Recompute 'cf' neighbors for ``movie_ids`` (every movie if None).
+
+    Returns the number of MovieNeighbor rows written.
+    """
+    matrix = SimilarityMatrix(interactions())
+    targets = matrix.movie_ids.tolist() if movie_ids is None else list(movie_ids)
+    stale = MovieNeighbor.objects.filter(source=MovieNeighbor.COLLABORATIVE)
+    written = 0
+    with transaction.atomic():
+        if movie_ids is not None:
+            stale = stale.filter(movie_id__in=targets)
+        stale.delete()
+        for start in range(0, len(targets), CHUNK_SIZE):
+            rows = [
+                MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, score=score,
+                              source=MovieNeighbor.COLLABORATIVE)
+                for movie_id in targets[start:start + CHUNK_SIZE]
+                for neighbor_id, score in matrix.neighbors(movie_id, top_k)
+            ]
+            MovieNeighbor.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+            written += len(rows)
+    return written
+
+
+def changed_movies(since):
+    """Movies whose neighbors may have moved since ``since``.
+
+    A rating or purchase at or after ``since`` changes that movie's column,
+    so the movies listing it as a neighbor are rescored. It also changes the
+    similarity between that movie and every other movie the same user has
+    touched, so all of the active users' movies are included too. Likes and
+    deleted ratings leave no timestamp; only a full build picks them up.
+    """
+    ratings = Rating.objects.filter(updated_at__gte=since)
+    items = Item.objects.filter(order__date__gte=since)
+    changed = set(ratings.values_list('movie_id', flat=True))
+    changed |= set(items.values_list('movie_id', flat=True))
+    users = set(ratings.values_list('user_id', flat=True))
+    users |= set(items.values_list('order__user_id', flat=True))
+
+    touched = set(changed)
+    touched |= set(Rating.objects.filter(user_id__in=users).values_list('movie_id', flat=True))
+    touched |= set(Item.objects.filter(order__user_id__in=users).values_list('movie_id', flat=True))
+    touched |= set(Movie.liked_users.through.objects.filter(user_id__in=users).values_list('movie_id', flat=True))
+    touched |= set(MovieNeighbor.objects.filter(source=MovieNeighbor.COLLABORATIVE, neighbor_id__in=changed)
+                   .values_list('movie_id', flat=True))
+    return touched
+
+
+def seed_movies(user, limit=MAX_SEEDS):
+    """Ids of up to ``limit`` movies this user has rated, bought or liked, in one query."""
+    rated = Rating.objects.filter(user=user).values_list('movie_id', flat=True)
+    bought = Item.objects.filter(order__user=user).values_list('movie_id', flat=True)
+    liked = Movie.liked_users.through.objects.filter(user=user).values_list('movie_id', flat=True)
+    return list(rated.union(bought, liked)[:limit])
+
+
+def recommended_for(user, limit=6):
+    """Movies the user has not touched, ranked by summed similarity to the ones they have."""
+    seeds = seed_movies(user)
+    if not seeds:
+        return []
+    return list(Movie.objects
+                .filter(neighbor_of__movie_id__in=seeds, neighbor_of__source=MovieNeighbor.COLLABORATIVE)
+                .exclude(id__in=seeds)
+                .annotate(match=Sum('neighbor_of__score'))
+                .order_by('-match', 'id')[:limit])
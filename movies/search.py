@@ -0,0 +1,166 @@
+"""Movie search.
+
+On SQLite, searches go through the ``movies_movie_fts`` FTS5 table over
+Movie.name and Movie.description. Triggers created in migration 0014 keep
+that table in sync on every insert, update and delete; SQLite drops them
+whenever a later migration rebuilds movies_movie, so a post_migrate receiver
+here puts back any that are missing and reindexes. Results are ranked
+with bm25, and a name hit outweighs a description hit. Every search word is
+also matched as a prefix. Other databases fall back to a
+case-insensitive LIKE search, and the MOVIES_SEARCH_BACKEND setting can
+point at any other backend class.
+"""
+import re
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Movie
+
+FTS_TABLE = 'movies_movie_fts'
+# bm25 column weights, in table column order (name, description)
+FTS_WEIGHTS = (10.0, 1.0)
+PAGE_SIZE = 20
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# The triggers from migration 0014
+FTS_TRIGGERS = {
+    'movies_movie_fts_insert': f"""
+        CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+    'movies_movie_fts_delete': f"""
+        CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    'movies_movie_fts_update': f"""
+        CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF name, description ON movies_movie BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+class RankedResults:
+    """Lazy, sliceable result set that Paginator can page through.
+
+    Only the requested page's ids are fetched from the index, and the
+    matching movies are then loaded with a single primary-key lookup.
+    """
+
+    def __init__(self, backend, query):
+        self.backend = backend
+        self.query = query
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        ids = self.backend.ranked_ids(self.query, start, stop - start)
+        movies = Movie.objects.in_bulk(ids)
+        return [movies[movie_id] for movie_id in ids if movie_id in movies]
+
+
+class SQLiteFTSBackend:
+    """Ranked prefix search over the FTS5 index."""
+
+    @staticmethod
+    def match_expression(query):
+        # Quote every word so user input can never be parsed as FTS syntax
+        words = WORD_RE.findall(query)
+        return ' '.join(f'"{word}"*' for word in words)
+
+    def count(self, query):
+        match = self.match_expression(query)
+        if not match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+            return cursor.fetchone()[0]
+
+    def ranked_ids(self, query, offset, limit):
+        match = self.match_expression(query)
+        if not match or limit <= 0:
+            return []
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class ContainsBackend:
+    """Portable fallback: LIKE matching, with name hits ranked first."""
+
+    def queryset(self, query):
+        return (Movie.objects
+                .filter(Q(name__icontains=query) | Q(description__icontains=query))
+                .annotate(name_hit=Case(When(name__icontains=query, then=Value(1)),
+                                        default=Value(0), output_field=IntegerField()))
+                .order_by('-name_hit', 'name', 'id'))
+
+    def count(self, query):
+        return self.queryset(query).count()
+
+    def ranked_ids(self, query, offset, limit):
+        return list(self.queryset(query).values_list('id', flat=True)[offset:offset + limit])
+
+
+def get_backend():
+    backend_path = getattr(settings, 'MOVIES_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return ContainsBackend()
+
+
+@receiver(post_migrate)
+def restore_fts_triggers(sender, using, **kwargs):
+    """Re-create FTS triggers lost to a table rebuild and reindex what they missed."""
+    db = connections[using]
+    if sender.label != 'movies' or db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT type, name FROM sqlite_master WHERE name = %s OR type = 'trigger'", [FTS_TABLE])
+        found = cursor.fetchall()
+        if ('table', FTS_TABLE) not in found:
+            # Migrated back past 0014
+            return
+        missing = FTS_TRIGGERS.keys() - {name for kind, name in found if kind == 'trigger'}
+        for name in sorted(missing):
+            cursor.execute(FTS_TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_movies(query, page_number=1, per_page=PAGE_SIZE):
+    """Return a Paginator page of movies matching ``query``, best match first."""
+    paginator = Paginator(RankedResults(get_backend(), query), per_page)
+    return paginator.get_page(page_number)
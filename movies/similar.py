@@ -0,0 +1,77 @@
+"""'People who bought or liked this also bought or liked' neighbors.
+
+Two movies co-occur once for every user who bought or liked both. Each
+movie keeps its TOP_K most frequent co-occurring movies as MovieNeighbor
+rows with source 'also', so the detail page reads its panel with one
+indexed query.
+
+The build streams baskets (a user's bought and liked movies) from the
+database, USER_CHUNK users at a time. Counting in one pass would hold every
+co-occurring pair in the store, so target movies are split into partitions
+of PARTITION_SIZE instead. Each pass streams the baskets again and counts
+only pairs that start in its partition. Memory is therefore bounded by the
+distinct pairs of PARTITION_SIZE movies: in the worst case PARTITION_SIZE
+times the number of movies, and in practice far less, since a movie
+co-occurs only with movies that share a basket with it. Each partition's
+top-K is written before the next partition starts; a smaller
+--partition-size trades more passes for less memory.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from cart.models import Item
+from .models import Movie, MovieNeighbor
+
+TOP_K = 10
+USER_CHUNK = 1000
+PARTITION_SIZE = 2000
+
+
+def baskets(user_chunk=USER_CHUNK):
+    """Yield each user's set of bought or liked movie ids, ``user_chunk`` users per query pair."""
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(user_ids), user_chunk):
+        chunk = user_ids[start:start + user_chunk]
+        by_user = defaultdict(set)
+        for user_id, movie_id in Item.objects.filter(order__user_id__in=chunk).values_list('order__user_id', 'movie_id'):
+            by_user[user_id].add(movie_id)
+        for user_id, movie_id in (Movie.liked_users.through.objects.filter(user_id__in=chunk)
+                                  .values_list('user_id', 'movie_id')):
+            by_user[user_id].add(movie_id)
+        for basket in by_user.values():
+            if len(basket) > 1:
+                yield basket
+
+
+def build(top_k=TOP_K, partition_size=PARTITION_SIZE, user_chunk=USER_CHUNK):
+    """Replace every 'also' neighbor row. Returns the number of rows written."""
+    movie_ids = list(Movie.objects.order_by('id').values_list('id', flat=True))
+    written = 0
+    with transaction.atomic():
+        MovieNeighbor.objects.filter(source=MovieNeighbor.ALSO).delete()
+        for start in range(0, len(movie_ids), partition_size):
+            partition = set(movie_ids[start:start + partition_size])
+            counts = defaultdict(Counter)
+            for basket in baskets(user_chunk):
+                for movie_id in basket & partition:
+                    counts[movie_id].update(basket)
+            rows = []
+            for movie_id, counter in counts.items():
+                del counter[movie_id]
+                best = heapq.nsmallest(top_k, counter.items(), key=lambda pair: (-pair[1], pair[0]))
+                rows.extend(MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, score=count,
+                                          source=MovieNeighbor.ALSO)
+                            for neighbor_id, count in best)
+            MovieNeighbor.objects.bulk_create(rows, batch_size=1000)
+            written += len(rows)
+    return written
+
+
+def similar_to(movie, limit=6):
+    """The movie's stored 'also' neighbors, best first, in one query."""
+    return [row.neighbor for row in
+            MovieNeighbor.objects.filter(movie=movie, source=MovieNeighbor.ALSO)
+            .select_related('neighbor').order_by('-score', 'neighbor_id')[:limit]]
@@ -0,0 +1,205 @@
+"""Maintenance of the denormalized MovieStats counters and Review.popularity.
+
+Views call these helpers inside the same transaction as the Rating, Item or
+like rows they write, so the counters move atomically with the data. Updates
+are F() expressions, which keeps concurrent writers from losing increments.
+
+Likes written through the ORM instead (``movie.liked_users.add()``,
+``review.liked_users.add()``, e.g. from the admin) are caught by
+m2m_changed receivers, which recount the movies or reviews they touched.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from cart.models import Item
+from moviesstore import fragments
+from . import leaderboard
+from .models import LeaderboardEntry, Movie, MovieStats, Rating, RegionalSales, Review
+
+COUNTER_BOARDS = {
+    'rating_sum': LeaderboardEntry.MOVIES_BY_RATING,
+    'rating_count': LeaderboardEntry.MOVIES_BY_RATING,
+    'like_count': LeaderboardEntry.MOVIES_BY_LIKES,
+    'units_sold': LeaderboardEntry.MOVIES_BY_ORDERS,
+}
+
+
+def adjust(movie_id, **deltas):
+    """Add ``deltas`` to a movie's counters and refresh the boards they feed.
+
+    Returns the movie's MovieStats row as it stands after the update.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if not MovieStats.objects.filter(movie_id=movie_id).update(**updates):
+        try:
+            with transaction.atomic():
+                MovieStats.objects.create(movie_id=movie_id, **deltas)
+        except IntegrityError:
+            # Another writer created the row first; apply on top of theirs.
+            MovieStats.objects.filter(movie_id=movie_id).update(**updates)
+    return leaderboard.refresh_movie(movie_id, {COUNTER_BOARDS[field] for field in deltas})
+
+
+def rating_added(movie_id, value):
+    return adjust(movie_id, rating_sum=value, rating_count=1)
+
+
+def rating_changed(movie_id, old_value, new_value):
+    if old_value != new_value:
+        return adjust(movie_id, rating_sum=new_value - old_value)
+    return None
+
+
+def rating_removed(movie_id, value):
+    return adjust(movie_id, rating_sum=-value, rating_count=-1)
+
+
+def like_toggled(movie_id, liked):
+    return adjust(movie_id, like_count=1 if liked else -1)
+
+
+def review_like_toggled(review_id, liked):
+    Review.objects.filter(pk=review_id).update(popularity=F('popularity') + (1 if liked else -1))
+
+
+def recount_popularity(review_ids):
+    """Set popularity from the like table for ``review_ids``, in one UPDATE."""
+    likes = (Review.liked_users.through.objects
+             .filter(review_id=OuterRef('pk'))
+             .values('review_id')
+             .annotate(count=Count('id'))
+             .values('count'))
+    Review.objects.filter(pk__in=review_ids).update(popularity=Coalesce(Subquery(likes), 0))
+
+
+def _changed_ids(instance, action, reverse, pk_set, related_ids):
+    """Work out which side-owning ids an m2m_changed signal touched.
+
+    For a forward change the owner is ``instance``; for a reverse change
+    (e.g. ``user.liked_reviews.add(review)``) the owners are in ``pk_set``.
+    A reverse clear() sends no pk_set, so the ids are captured in pre_clear.
+    """
+    if action == 'pre_clear':
+        if reverse:
+            instance._stats_cleared = list(related_ids(instance))
+        return []
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return []
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, '_stats_cleared', [])
+    return list(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Review.liked_users.through)
+def review_likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    related_ids = lambda user: user.liked_reviews.values_list('id', flat=True)
+    review_ids = _changed_ids(instance, action, reverse, pk_set, related_ids)
+    if review_ids:
+        recount_popularity(review_ids)
+
+
+def recount_likes(movie_ids):
+    """Set like_count from the like table for ``movie_ids`` and refresh their like board rows."""
+    MovieStats.objects.bulk_create([MovieStats(movie_id=movie_id) for movie_id in movie_ids],
+                                   ignore_conflicts=True)
+    likes = (Movie.liked_users.through.objects
+             .filter(movie_id=OuterRef('movie_id'))
+             .values('movie_id')
+             .annotate(count=Count('id'))
+             .values('count'))
+    MovieStats.objects.filter(movie_id__in=movie_ids).update(like_count=Coalesce(Subquery(likes), 0))
+    leaderboard.refresh_movies(movie_ids, [LeaderboardEntry.MOVIES_BY_LIKES])
+
+
+@receiver(m2m_changed, sender=Movie.liked_users.through)
+def movie_likes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    related_ids = lambda user: user.liked_movies.values_list('id', flat=True)
+    movie_ids = _changed_ids(instance, action, reverse, pk_set, related_ids)
+    if movie_ids:
+        recount_likes(movie_ids)
+
+
+def record_purchase(quantities, country=None):
+    """Apply a whole order's ``{movie_id: quantity}`` in a constant number of queries."""
+    if not quantities:
+        return
+    _upsert_increment(MovieStats, ['movie_id'], 'units_sold',
+                      [(movie_id, quantity) for movie_id, quantity in quantities.items()])
+    if country:
+        _upsert_increment(RegionalSales, ['country', 'movie_id'], 'units_sold',
+                          [(country, movie_id, quantity) for movie_id, quantity in quantities.items()])
+        # Versions the cached map payload (movies/mapcache.py)
+        fragments.bump('regional_sales')
+    leaderboard.refresh_movies(list(quantities), [LeaderboardEntry.MOVIES_BY_ORDERS])
+    # The Items were bulk-created, so no post_save reached movies/fragments.py
+    fragments.bump('orders')
+
+
+def _upsert_increment(model, key_columns, counter, rows):
+    """Add to ``counter`` for many keys in one INSERT ... ON CONFLICT statement.
+
+    ``rows`` are tuples of the key column values followed by the increment.
+    Missing rows are created with the increment as their value and the
+    model's other columns at their ``db_default``. SQLite and PostgreSQL
+    both support the syntax.
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = ', '.join(qn(column) for column in [*key_columns, counter])
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * (len(key_columns) + 1)) + ')'] * len(rows))
+    conflict = ', '.join(qn(column) for column in key_columns)
+    sql = (f'INSERT INTO {table} ({columns}) VALUES {placeholders} '
+           f'ON CONFLICT ({conflict}) DO UPDATE SET {qn(counter)} = {table}.{qn(counter)} + excluded.{qn(counter)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def computed_stats():
+    """Recompute every movie's counters from the child tables.
+
+    Returns ``{movie_id: {field: value}}``. Only the rebuild command should
+    need this; request handling reads MovieStats instead.
+    """
+    stats = {
+        movie_id: {'rating_sum': 0, 'rating_count': 0, 'like_count': 0, 'units_sold': 0}
+        for movie_id in Movie.objects.values_list('id', flat=True)
+    }
+    ratings = Rating.objects.values('movie_id').annotate(total=Sum('rating'), count=Count('id'))
+    for row in ratings:
+        stats[row['movie_id']].update(rating_sum=row['total'], rating_count=row['count'])
+    likes = Movie.liked_users.through.objects.values('movie_id').annotate(count=Count('id'))
+    for row in likes:
+        stats[row['movie_id']]['like_count'] = row['count']
+    sold = Item.objects.values('movie_id').annotate(total=Sum('quantity'))
+    for row in sold:
+        stats[row['movie_id']]['units_sold'] = row['total']
+    return stats
+
+
+def computed_popularity():
+    """Recompute every review's like count. Returns ``{review_id: likes}``."""
+    popularity = dict.fromkeys(Review.objects.values_list('id', flat=True), 0)
+    likes = Review.liked_users.through.objects.values('review_id').annotate(count=Count('id'))
+    for row in likes:
+        popularity[row['review_id']] = row['count']
+    return popularity
+
+
+def computed_regional_sales():
+    """Recompute units sold per (country, movie) from every Item.
+
+    Returns ``{(country_code, movie_id): units}`` for buyers with a country.
+    """
+    rows = (Item.objects
+            .filter(order__user__profile__country__gt='')
+            .values('order__user__profile__country', 'movie_id')
+            .annotate(total=Sum('quantity')))
+    return {
+        (row['order__user__profile__country'], row['movie_id']): row['total']
+        for row in rows
+    }
@@ -0,0 +1,126 @@
+"""In-process typeahead index for the /movies/suggest/ endpoint.
+
+Titles are normalized (accents stripped, case folded, punctuation removed)
+and every word-start suffix of a title is stored in one sorted array, so
+"pan" finds "Kung Fu Panda". A lookup bisects out the range of keys with
+the prefix and ranks every movie in it by popularity (units sold plus
+likes, from MovieStats). Broad prefixes such as one letter match many keys,
+so their rankings are memoized until the index next changes.
+
+The index loads lazily on the first lookup. Movie saves and deletes in this
+process patch it in place. Every process also reloads it after
+SUGGEST_MAX_AGE seconds, so movies saved by other processes show up without
+keystrokes ever querying the database in between.
+"""
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Movie
+
+MAX_RESULTS = 10
+# Prefixes matching more keys than this have their ranking memoized, so one-letter queries stay cheap
+MEMO_THRESHOLD = 500
+# Sorts after every normalized key with a given prefix; NON_WORD_RE strips it from titles
+PREFIX_END = '\U0010ffff'
+
+NON_WORD_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return NON_WORD_RE.sub(' ', text.casefold()).strip()
+
+
+def _keys_for(movie_id, name):
+    words = normalize(name).split()
+    return [(' '.join(words[i:]), movie_id) for i in range(len(words))]
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []       # sorted [(normalized suffix, movie_id)]
+        self._movies = {}     # movie_id -> (name, popularity)
+        self._ranked = {}     # broad prefix -> movie ids, most popular first
+        self._loaded_at = None
+
+    def _max_age(self):
+        return getattr(settings, 'SUGGEST_MAX_AGE', 300)
+
+    def load(self):
+        rows = Movie.objects.values_list('id', 'name', 'stats__units_sold', 'stats__like_count')
+        movies = {
+            movie_id: (name, (units or 0) + (likes or 0))
+            for movie_id, name, units, likes in rows
+        }
+        keys = sorted(key for movie_id, (name, _) in movies.items() for key in _keys_for(movie_id, name))
+        with self._lock:
+            self._movies, self._keys, self._ranked = movies, keys, {}
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self._max_age():
+            self.load()
+
+    def update(self, movie_id, name, popularity=None):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            if popularity is None:
+                popularity = self._movies.get(movie_id, (None, 0))[1]
+            movies = dict(self._movies)
+            movies[movie_id] = (name, popularity)
+            # Copy-on-write, so lookups running in other threads see a consistent list
+            keys = [key for key in self._keys if key[1] != movie_id]
+            for key in _keys_for(movie_id, name):
+                bisect.insort(keys, key)
+            # _ranked goes last: suggest() reads it first, so it never memoizes old keys under the new dict
+            self._movies, self._keys, self._ranked = movies, keys, {}
+
+    def remove(self, movie_id):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            movies = dict(self._movies)
+            movies.pop(movie_id, None)
+            keys = [key for key in self._keys if key[1] != movie_id]
+            self._movies, self._keys, self._ranked = movies, keys, {}
+
+    def suggest(self, query, limit=MAX_RESULTS):
+        self._ensure_fresh()
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        memo = self._ranked
+        keys, movies = self._keys, self._movies
+        ranked = memo.get(prefix)
+        if ranked is None:
+            start = bisect.bisect_left(keys, (prefix,))
+            end = bisect.bisect_left(keys, (prefix + PREFIX_END,), start)
+            # Rank the whole range; cutting it short first would drop popular titles late in the alphabet
+            matches = {movie_id for _, movie_id in keys[start:end]}
+            ranked = sorted(matches, key=lambda movie_id: (-movies[movie_id][1], movies[movie_id][0]))
+            if end - start > MEMO_THRESHOLD:
+                memo[prefix] = ranked
+        return [{'id': movie_id, 'name': movies[movie_id][0]} for movie_id in ranked[:limit]]
+
+
+index = SuggestIndex()
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, **kwargs):
+    index.update(instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    index.remove(instance.id)
@@ -0,0 +1,41 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from movies.images import MIME_TYPES, derivative_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def poster(movie, width, css_class='', lazy=True):
+    """Render a movie's poster as a <picture> sized for ``width`` CSS pixels.
+
+    The AVIF and WebP sources and the fallback <img> each list every stored
+    derivative in srcset, so the browser picks the right file for the
+    screen's pixel density. Movies without derivatives fall back to the
+    original upload.
+    """
+    if not movie.image:
+        return ''
+    loading = 'lazy' if lazy else 'eager'
+    derivatives = movie.image_derivatives or {}
+    if derivatives.get('source') != movie.image.name:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="{}">',
+                           movie.image.url, css_class, movie.name, loading)
+
+    source, widths = derivatives['source'], derivatives['widths']
+    sizes = f'{width}px'
+
+    def srcset(ext):
+        return ', '.join(f'{default_storage.url(derivative_name(source, w, ext))} {w}w' for w in widths)
+
+    *modern, fallback = derivatives['formats']
+    default_width = next((w for w in widths if w >= width), widths[-1])
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="{}" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">',
+                         ((MIME_TYPES[ext], srcset(ext), sizes) for ext in modern)),
+        default_storage.url(derivative_name(source, default_width, fallback)),
+        srcset(fallback), sizes, css_class, movie.name, loading,
+    )
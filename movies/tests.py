@@ -1,3 +1,839 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import importlib.util
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from cart.models import Item, Order
+from moviesstore.querybudget import budget_for
+from moviesstore.testing import PerformanceTestCase
+from . import geometry, images, interactions, recommend, search, similar, stats, suggest
+from .models import LeaderboardEntry, Movie, MovieNeighbor, MovieStats, Rating, RegionalSales, Review
+
+
+class MovieShowQueryCountTests(TestCase):
+    # Session, user, movie+stats, review count, review page, top review,
+    # similar movies, user rating, movie liked state and liked review ids.
+    MAX_QUERIES = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer', password='pass')
+        cls.fans = [User.objects.create_user(f'fan{i}', password='pass') for i in range(5)]
+        cls.movie = Movie.objects.create(
+            name='Interstellar', price=12, description='Space.', image='movie_images/interstellar.jpg',
+        )
+        cls.movie.liked_users.add(cls.user)
+
+    def add_reviews(self, count):
+        for i in range(count):
+            review = Review.objects.create(comment=f'Review {i}', movie=self.movie, user=self.fans[i % 5])
+            review.liked_users.add(*self.fans[:i % 5], self.user)
+
+    def count_show_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_reviews(self):
+        self.client.force_login(self.user)
+        self.add_reviews(2)
+        few = self.count_show_queries()
+        self.add_reviews(25)
+        many = self.count_show_queries()
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.MAX_QUERIES)
+
+    def test_anonymous_query_count(self):
+        self.add_reviews(25)
+        self.assertLessEqual(self.count_show_queries(), self.MAX_QUERIES - 3)
+
+    def test_like_counts_and_state_are_rendered(self):
+        self.client.force_login(self.user)
+        self.add_reviews(3)
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        reviews = list(response.context['template_data']['reviews'])
+        self.assertEqual([review.popularity for review in reviews], [1, 2, 3])
+        self.assertEqual(response.context['template_data']['liked_review_ids'], {r.id for r in reviews})
+        self.assertTrue(response.context['template_data']['user_likes_movie'])
+
+
+@skipUnless(importlib.util.find_spec('numpy'), 'build_recommendations needs NumPy')
+class LeaderboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fan', password='pw')
+        cls.first, cls.second = [
+            Movie.objects.create(name=name, price=10, description='Film.', image='movie_images/film.jpg')
+            for name in ('First', 'Second')
+        ]
+
+    def board(self, board):
+        return list(LeaderboardEntry.objects.filter(board=board)
+                    .order_by('-score').values_list('movie_id', 'score'))
+
+    def test_ratings_update_the_rating_board(self):
+        with transaction.atomic():
+            interactions.rate(self.first.id, self.user.id, 6)
+            interactions.rate(self.second.id, self.user.id, 9)
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_RATING),
+                         [(self.second.id, 9), (self.first.id, 6)])
+        with transaction.atomic():
+            interactions.rate(self.first.id, self.user.id, 10)
+            interactions.unrate(self.second.id, self.user.id)
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_RATING), [(self.first.id, 10)])
+
+    def test_likes_update_only_the_like_board(self):
+        with transaction.atomic():
+            interactions.toggle_movie_like(self.second.id, self.user.id)
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_LIKES), [(self.second.id, 1)])
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_RATING), [])
+        with transaction.atomic():
+            interactions.toggle_movie_like(self.second.id, self.user.id)
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_LIKES), [])
+
+    def test_purchases_update_the_order_board_in_one_batch(self):
+        stats.record_purchase({self.first.id: 2, self.second.id: 5})
+        stats.record_purchase({self.first.id: 4})
+        self.assertEqual(self.board(LeaderboardEntry.MOVIES_BY_ORDERS),
+                         [(self.first.id, 6), (self.second.id, 5)])
+
+    def test_index_reads_the_boards(self):
+        stats.record_purchase({self.second.id: 3})
+        response = self.client.get(reverse('movies.index'))
+        top = list(response.context['template_data']['top_movies'])
+        self.assertEqual([(movie.id, movie.times_ordered) for movie in top], [(self.second.id, 3)])
+
+    def test_rebuild_matches_incremental_updates(self):
+        with transaction.atomic():
+            interactions.rate(self.first.id, self.user.id, 7)
+            interactions.toggle_movie_like(self.first.id, self.user.id)
+        stats.record_purchase({self.second.id: 2})
+        incremental = set(LeaderboardEntry.objects.values_list('board', 'movie_id', 'score'))
+        call_command('rebuild_leaderboard', stdout=io.StringIO())
+        self.assertEqual(set(LeaderboardEntry.objects.values_list('board', 'movie_id', 'score')), incremental)
+
+
+class MovieStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'viewer{i}', password='pw') for i in range(2)]
+        cls.movie = Movie.objects.create(name='Counted', price=10, description='Film.',
+                                         image='movie_images/film.jpg')
+
+    def counters(self):
+        return MovieStats.objects.values('rating_sum', 'rating_count', 'like_count', 'units_sold').get(
+            movie=self.movie)
+
+    def test_new_movies_get_an_empty_stats_row(self):
+        self.assertEqual(self.counters(),
+                         {'rating_sum': 0, 'rating_count': 0, 'like_count': 0, 'units_sold': 0})
+
+    def test_counters_follow_each_write(self):
+        with transaction.atomic():
+            interactions.rate(self.movie.id, self.users[0].id, 4)
+            interactions.rate(self.movie.id, self.users[1].id, 8)
+            interactions.rate(self.movie.id, self.users[0].id, 6)
+            interactions.toggle_movie_like(self.movie.id, self.users[1].id)
+        stats.record_purchase({self.movie.id: 3})
+        self.assertEqual(self.counters(),
+                         {'rating_sum': 14, 'rating_count': 2, 'like_count': 1, 'units_sold': 3})
+        self.assertEqual(MovieStats.objects.get(movie=self.movie).avg_rating, 7)
+
+        with transaction.atomic():
+            interactions.unrate(self.movie.id, self.users[1].id)
+            interactions.toggle_movie_like(self.movie.id, self.users[1].id)
+        self.assertEqual(self.counters(),
+                         {'rating_sum': 6, 'rating_count': 1, 'like_count': 0, 'units_sold': 3})
+
+    def test_concurrent_first_ratings_do_not_fail(self):
+        with transaction.atomic():
+            interactions.rate(self.movie.id, self.users[0].id, 3)
+        # The second request looked before the first one's row existed
+        lookups = iter([Rating.objects.none()])
+        select_for_update = Rating.objects.select_for_update
+        with mock.patch.object(Rating.objects, 'select_for_update',
+                               side_effect=lambda: next(lookups, None) or select_for_update()):
+            with transaction.atomic():
+                movie_stats = interactions.rate(self.movie.id, self.users[0].id, 9)
+        self.assertEqual((movie_stats.rating_sum, movie_stats.rating_count), (9, 1))
+        self.assertEqual(Rating.objects.get().rating, 9)
+
+    def test_adjust_applies_deltas_in_the_database(self):
+        stale = MovieStats.objects.get(movie=self.movie)
+        stats.adjust(self.movie.id, like_count=1)
+        stats.adjust(self.movie.id, like_count=1)
+        # The in-memory row was never saved over the F() updates
+        stale.refresh_from_db()
+        self.assertEqual(stale.like_count, 2)
+
+    def test_adjust_creates_a_missing_row(self):
+        MovieStats.objects.filter(movie=self.movie).delete()
+        self.assertEqual(stats.adjust(self.movie.id, units_sold=2).units_sold, 2)
+
+    def test_orm_like_edits_are_recounted(self):
+        likes_board = LeaderboardEntry.objects.filter(board=LeaderboardEntry.MOVIES_BY_LIKES, movie=self.movie)
+        self.movie.liked_users.add(*self.users)
+        self.assertEqual(self.counters()['like_count'], 2)
+        self.assertEqual(likes_board.get().score, 2)
+        self.users[0].liked_movies.remove(self.movie)
+        self.assertEqual(self.counters()['like_count'], 1)
+        self.users[1].liked_movies.clear()
+        self.assertEqual(self.counters()['like_count'], 0)
+        self.assertFalse(likes_board.exists())
+        self.users[0].liked_movies.add(self.movie)
+        self.movie.liked_users.clear()
+        self.assertEqual(self.counters()['like_count'], 0)
+        call_command('rebuild_movie_stats', verify=True, stdout=io.StringIO())
+
+    def test_show_page_without_a_stats_row(self):
+        MovieStats.objects.filter(movie=self.movie).delete()
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['template_data']['avg_rating'])
+
+    def test_verify_reports_drift_and_rebuild_repairs_it(self):
+        with transaction.atomic():
+            interactions.rate(self.movie.id, self.users[0].id, 5)
+        call_command('rebuild_movie_stats', verify=True, stdout=io.StringIO())
+
+        MovieStats.objects.filter(movie=self.movie).update(rating_sum=50, like_count=3)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, '2 counter(s) out of date.'):
+            call_command('rebuild_movie_stats', verify=True, stdout=out)
+        self.assertIn(f'Movie {self.movie.id}: rating_sum is 50, expected 5', out.getvalue())
+        self.assertEqual(self.counters()['rating_sum'], 50)
+
+        call_command('rebuild_movie_stats', stdout=io.StringIO())
+        self.assertEqual(self.counters(),
+                         {'rating_sum': 5, 'rating_count': 1, 'like_count': 0, 'units_sold': 0})
+        self.assertFalse(LeaderboardEntry.objects.filter(board=LeaderboardEntry.MOVIES_BY_LIKES).exists())
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.described = Movie.objects.create(name='Night Train', price=10, image='movie_images/film.jpg',
+                                             description='A heist aboard the Orient express.')
+        cls.named = Movie.objects.create(name='Heist Season', price=10, image='movie_images/film.jpg',
+                                         description='Old friends plan one last job.')
+        Movie.objects.create(name='Quiet Garden', price=10, image='movie_images/film.jpg',
+                             description='Nothing happens, beautifully.')
+
+    def found(self, query):
+        return [movie.name for movie in search.search_movies(query)]
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_name_hits_rank_above_description_hits(self):
+        self.assertEqual(self.found('heist'), ['Heist Season', 'Night Train'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_every_word_matches_as_a_prefix(self):
+        self.assertEqual(self.found('hei sea'), ['Heist Season'])
+        self.assertEqual(self.found('orie'), ['Night Train'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_fts_syntax_in_the_query_is_treated_as_words(self):
+        self.assertEqual(self.found('heist" OR NEAR(garden'), [])
+        self.assertEqual(self.found('"*'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 index is SQLite only')
+    def test_triggers_keep_the_index_in_sync(self):
+        movie = Movie.objects.create(name='Paper Moon', price=10, description='Road trip.',
+                                     image='movie_images/film.jpg')
+        self.assertEqual(self.found('paper'), ['Paper Moon'])
+        movie.name = 'Glass Moon'
+        movie.save()
+        self.assertEqual(self.found('paper'), [])
+        self.assertEqual(self.found('glass'), ['Glass Moon'])
+        movie.delete()
+        self.assertEqual(self.found('moon'), [])
+
+    @override_settings(MOVIES_SEARCH_BACKEND='movies.search.ContainsBackend')
+    def test_contains_backend_fallback(self):
+        self.assertIsInstance(search.get_backend(), search.ContainsBackend)
+        self.assertEqual(self.found('heist'), ['Heist Season', 'Night Train'])
+        self.assertEqual(self.found('garden'), ['Quiet Garden'])
+
+    def test_results_are_paginated(self):
+        page = search.search_movies('heist', per_page=1)
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual([movie.name for movie in search.search_movies('heist', page_number=2, per_page=1)],
+                         ['Night Train'])
+
+
+class SuggestIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.panda = Movie.objects.create(name='Kung Fu Panda', price=10, description='Film.',
+                                         image='movie_images/film.jpg')
+        cls.amelie = Movie.objects.create(name='Amélie', price=10, description='Film.',
+                                          image='movie_images/film.jpg')
+        cls.pan = Movie.objects.create(name="Pan's Labyrinth", price=10, description='Film.',
+                                       image='movie_images/film.jpg')
+
+    def setUp(self):
+        # A private index, so the shared one never holds rows this test rolls back
+        patcher = mock.patch.object(suggest, 'index', suggest.SuggestIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        suggest.index.load()
+
+    def names(self, query, limit=suggest.MAX_RESULTS):
+        return [result['name'] for result in suggest.index.suggest(query, limit)]
+
+    def test_matches_any_word_start_ignoring_case_and_accents(self):
+        self.assertEqual(self.names('PANDA'), ['Kung Fu Panda'])
+        self.assertEqual(self.names('fu pa'), ['Kung Fu Panda'])
+        self.assertEqual(self.names('amel'), ['Amélie'])
+        self.assertEqual(self.names('labyrinth!'), ["Pan's Labyrinth"])
+        self.assertEqual(self.names('anda'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_popular_movies_rank_first(self):
+        self.assertEqual(self.names('pan'), ['Kung Fu Panda', "Pan's Labyrinth"])
+        stats.record_purchase({self.pan.id: 2})
+        suggest.index.load()
+        self.assertEqual(self.names('pan'), ["Pan's Labyrinth", 'Kung Fu Panda'])
+        self.assertEqual(self.names('pan', limit=1), ["Pan's Labyrinth"])
+
+    def test_broad_prefixes_rank_every_match(self):
+        Movie.objects.bulk_create(
+            Movie(name=f'Padding {i:03}', price=10, description='Film.', image='movie_images/film.jpg')
+            for i in range(suggest.MEMO_THRESHOLD)
+        )
+        stats.record_purchase({self.pan.id: 2})
+        suggest.index.load()
+        # Pan's Labyrinth sorts after every padding title, yet still leads
+        self.assertEqual(self.names('p', limit=2), ["Pan's Labyrinth", 'Kung Fu Panda'])
+        self.assertIn('p', suggest.index._ranked)
+        self.pan.name = 'Labyrinth'
+        self.pan.save()
+        self.assertEqual(self.names('p', limit=1), ['Kung Fu Panda'])
+
+    def test_lookups_do_not_query(self):
+        with self.assertNumQueries(0):
+            self.names('kung')
+
+    def test_saves_and_deletes_patch_the_index(self):
+        self.panda.name = 'Kung Fu Panda 2'
+        self.panda.save()
+        self.assertEqual(self.names('panda'), ['Kung Fu Panda 2'])
+        self.amelie.name = 'Le Fabuleux Destin'
+        self.amelie.save()
+        self.assertEqual(self.names('amel'), [])
+        self.assertEqual(self.names('fab'), ['Le Fabuleux Destin'])
+        Movie.objects.create(name='Panic Room', price=10, description='Film.', image='movie_images/film.jpg')
+        self.assertIn('Panic Room', self.names('pani'))
+        self.pan.delete()
+        self.assertEqual(self.names('lab'), [])
+
+    @override_settings(SUGGEST_MAX_AGE=0)
+    def test_stale_index_reloads(self):
+        # A write from another process reaches the table but not this index
+        Movie.objects.filter(pk=self.panda.pk).update(name='Po')
+        self.assertEqual(self.names('po'), ['Po'])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('movies.suggest'), {'q': 'kung', 'limit': 'x'})
+        self.assertEqual(response.json(), {'query': 'kung', 'results': [{'id': self.panda.id,
+                                                                        'name': 'Kung Fu Panda'}]})
+
+    def test_endpoint_clamps_the_limit(self):
+        for limit, count in [('-1', 1), ('0', 1), ('1', 1), ('500', 2)]:
+            response = self.client.get(reverse('movies.suggest'), {'q': 'pan', 'limit': limit})
+            self.assertEqual(len(response.json()['results']), count, limit)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = {
+            name: Movie.objects.create(name=name, price=10, description='Film.', image='movie_images/film.jpg')
+            for name in ['Alien', 'Aliens', 'Predator', 'Amelie', 'Chocolat']
+        }
+        cls.users = [User.objects.create_user(f'viewer{i}', password='pass') for i in range(4)]
+        sci_fi = [cls.movies[name] for name in ['Alien', 'Aliens', 'Predator']]
+        romance = [cls.movies[name] for name in ['Amelie', 'Chocolat']]
+        for movie in sci_fi:
+            movie.liked_users.add(cls.users[0], cls.users[1])
+        Rating.objects.create(movie=cls.movies['Alien'], user=cls.users[2], rating=9)
+        for movie in romance:
+            movie.liked_users.add(cls.users[3])
+
+    def test_neighbors_are_cosine_similar_movies(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        neighbors = MovieNeighbor.objects.filter(movie=self.movies['Aliens']).order_by('-score')
+        self.assertEqual([n.neighbor.name for n in neighbors], ['Predator', 'Alien'])
+        self.assertAlmostEqual(neighbors[0].score, 1.0)
+        self.assertFalse(MovieNeighbor.objects.filter(movie=self.movies['Amelie'],
+                                                      neighbor=self.movies['Alien']).exists())
+
+    def test_recommendations_exclude_movies_the_user_already_has(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        names = [movie.name for movie in recommend.recommended_for(self.users[2])]
+        self.assertEqual(names, ['Aliens', 'Predator'])
+        self.assertEqual(recommend.recommended_for(User.objects.create_user('newcomer')), [])
+
+    def test_incremental_build_only_touches_changed_movies(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        Rating.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        Rating.objects.create(movie=self.movies['Chocolat'], user=self.users[2], rating=8)
+        untouched = MovieNeighbor.objects.get(movie=self.movies['Aliens'], neighbor=self.movies['Predator'])
+        call_command('build_recommendations', since=5, stdout=io.StringIO())
+        self.assertTrue(MovieNeighbor.objects.filter(pk=untouched.pk).exists())
+        self.assertTrue(MovieNeighbor.objects.filter(movie=self.movies['Chocolat'],
+                                                     neighbor=self.movies['Alien']).exists())
+        # The rater's other movie now has Chocolat as a neighbor as well
+        self.assertTrue(MovieNeighbor.objects.filter(movie=self.movies['Alien'],
+                                                     neighbor=self.movies['Chocolat']).exists())
+
+    def test_changed_movies_include_the_active_users_other_movies(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        Rating.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        since = timezone.now()
+        self.assertEqual(recommend.changed_movies(since), set())
+        Rating.objects.create(movie=self.movies['Amelie'], user=self.users[0], rating=6)
+        expected = {'Amelie', 'Chocolat', 'Alien', 'Aliens', 'Predator'}
+        self.assertEqual({Movie.objects.get(pk=pk).name for pk in recommend.changed_movies(since)}, expected)
+
+
+class SimilarMoviesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [
+            Movie.objects.create(name=f'Film {i}', price=10, description='Film.', image='movie_images/film.jpg')
+            for i in range(4)
+        ]
+        users = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(3)]
+        for user in users:
+            order = Order.objects.create(user=user, total=20)
+            Item.objects.create(order=order, movie=cls.movies[0], price=10, quantity=1)
+            Item.objects.create(order=order, movie=cls.movies[1], price=10, quantity=1)
+        cls.movies[2].liked_users.add(users[0])
+        cls.movies[0].liked_users.add(users[0])
+
+    def test_neighbors_are_ranked_by_co_occurrence(self):
+        # Tiny partitions and chunks, so the multi-pass path is exercised too
+        call_command('build_similar_movies', partition_size=1, user_chunk=2, stdout=io.StringIO())
+        self.assertEqual(similar.similar_to(self.movies[0]), [self.movies[1], self.movies[2]])
+        self.assertEqual(MovieNeighbor.objects.get(movie=self.movies[0], neighbor=self.movies[1]).score, 3)
+        self.assertEqual(similar.similar_to(self.movies[3]), [])
+
+    def test_show_renders_the_panel(self):
+        call_command('build_similar_movies', stdout=io.StringIO())
+        response = self.client.get(reverse('movies.show', args=[self.movies[1].id]))
+        self.assertEqual(response.context['template_data']['similar_movies'], [self.movies[0], self.movies[2]])
+        self.assertContains(response, 'also enjoyed')
+
+
+class IndexFragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('critic', password='pass')
+        cls.movie = Movie.objects.create(name='Heat', price=10, description='Film.', image='movie_images/heat.jpg')
+
+    def setUp(self):
+        cache.clear()
+
+    def count_index_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('movies.index'))
+        return response, len(queries)
+
+    def test_repeat_renders_skip_the_cached_blocks(self):
+        _, cold = self.count_index_queries()
+        _, warm = self.count_index_queries()
+        self.assertLess(warm, cold)
+
+    def test_rebuilds_invalidate_the_ranking_blocks(self):
+        self.assertNotContains(self.count_index_queries()[0], 'Average Rating: 9')
+        # Bulk writes send no signals; only the rebuild can tell the cache
+        Rating.objects.bulk_create([Rating(movie=self.movie, user=self.user, rating=9)])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_movie_stats', stdout=io.StringIO())
+        self.assertContains(self.count_index_queries()[0], 'Average Rating: 9')
+
+        MovieStats.objects.filter(movie=self.movie).update(like_count=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_leaderboard', stdout=io.StringIO())
+        self.assertContains(self.count_index_queries()[0], 'Num Likes: 4')
+
+    def test_popularity_rebuild_invalidates_the_review_blocks(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(comment='Tense.', rating=8, movie=self.movie, user=self.user)
+        self.assertContains(self.count_index_queries()[0], 'No liked reviews yet.')
+        Review.liked_users.through.objects.bulk_create([Review.liked_users.through(review=review, user=self.user)])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_review_popularity', stdout=io.StringIO())
+        self.assertContains(self.count_index_queries()[0], 'Likes: 1')
+
+    def test_writes_invalidate_the_blocks_that_show_them(self):
+        self.count_index_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(comment='Best heist film ever', rating=10, movie=self.movie, user=self.user)
+        response, _ = self.count_index_queries()
+        self.assertContains(response, 'Best heist film ever')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='moviesstore-test-media-'))
+class ImageDerivativeTests(TestCase):
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, size=(600, 900)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'navy').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = Movie(name='Jaws', price=10, description='Shark.')
+            movie.image.save('jaws.jpg', ContentFile(buffer.getvalue()))
+        movie.refresh_from_db()
+        return movie
+
+    def test_upload_builds_sized_derivatives(self):
+        movie = self.upload()
+        derivatives = movie.image_derivatives
+        self.assertEqual(derivatives['widths'], [200, 400, 600])
+        self.assertEqual(derivatives['formats'][-1], 'jpg')
+        for width in derivatives['widths']:
+            for ext in derivatives['formats']:
+                name = images.derivative_name(movie.image.name, width, ext)
+                with default_storage.open(name) as derivative:
+                    self.assertEqual(Image.open(derivative).width, width)
+
+    def test_poster_tag_emits_srcset(self):
+        movie = self.upload()
+        html = Template('{% load movie_images %}{% poster movie 200 "card" %}').render(Context({'movie': movie}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('jaws.400w.jpg 400w', html)
+        self.assertIn('sizes="200px"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_backfill_command(self):
+        movie = self.upload()
+        Movie.objects.update(image_derivatives={})
+        call_command('build_image_derivatives', workers=2, stdout=io.StringIO())
+        movie.refresh_from_db()
+        self.assertEqual(movie.image_derivatives['source'], movie.image.name)
+
+    def test_new_derivatives_invalidate_the_cached_cards(self):
+        plain = '<img src="/media/movie_images/jaws.jpg"'
+        cache.clear()
+        movie = self.upload()
+        Movie.objects.update(image_derivatives={})
+        self.assertContains(self.client.get(reverse('movies.index')), plain)
+        with self.captureOnCommitCallbacks(execute=True):
+            images.build_for(movie.id, movie.image.name)
+        self.assertNotContains(self.client.get(reverse('movies.index')), plain)
+
+        Movie.objects.update(image_derivatives={})
+        cache.clear()
+        self.assertContains(self.client.get(reverse('movies.index')), plain)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_image_derivatives', workers=1, stdout=io.StringIO())
+        self.assertNotContains(self.client.get(reverse('movies.index')), plain)
+
+
+class WorldGeometryTests(SimpleTestCase):
+    def square(self, properties, ring):
+        return {'type': 'Feature', 'properties': properties,
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+    def test_neighbours_keep_a_shared_border(self):
+        # Two countries sharing a wiggly border from (10, 0) up to (10, 10)
+        border = [(10, 0)] + [(10 + (0.2 if y % 2 else -0.2), y) for y in range(1, 10)] + [(10, 10)]
+        west = [(0, 0)] + border + [(0, 10), (0, 0)]
+        east = list(reversed(border)) + [(20, 10), (20, 0), (10, 0)]
+        collection = {'type': 'FeatureCollection', 'features': [
+            self.square({'ISO_A3': 'FRA', 'ADMIN': 'France'}, west),
+            self.square({'name': 'Germany'}, east),
+        ]}
+        (west_code, _, [[west_ring]]), (east_code, _, [[east_ring]]) = geometry.simplify(collection, 0.5, 2)
+        self.assertEqual((west_code, east_code), ('FR', 'DE'))
+        self.assertLess(len(west_ring), len(west))
+        shared = set(west_ring) & set(east_ring)
+        self.assertEqual(shared, {(10, 0), (10, 10)})
+
+    def test_build_writes_every_level(self):
+        output = tempfile.mkdtemp(prefix='moviesstore-test-geo-')
+        self.addCleanup(shutil.rmtree, output, ignore_errors=True)
+        collection = {'type': 'FeatureCollection', 'features': [
+            self.square({'ISO_A2': 'JP', 'ADMIN': 'Japan'}, [(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)]),
+        ]}
+        written = geometry.build(collection, output)
+        self.assertEqual(set(written), {level for level, *_ in geometry.LEVELS})
+        with open(written['low'][0]) as low:
+            self.assertEqual(json.load(low)['features'][0]['id'], 'JP')
+
+
+class InteractionApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('clicker', password='pass')
+        cls.movie = Movie.objects.create(name='Heat', price=9, description='Heist.', image='movie_images/heat.jpg')
+        cls.review = Review.objects.create(movie=cls.movie, user=cls.user, comment='Great.')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, name, data=None, **kwargs):
+        url = reverse(name, kwargs=kwargs)
+        budget = budget_for(resolve(url).func)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data or {})
+        self.assertLessEqual(len(queries), budget.max_queries, url)
+        return response.status_code, response.json()
+
+    def test_likes_toggle_and_return_counts(self):
+        self.assertEqual(self.post('movies.api_like_movie', id=self.movie.id), (200, {'liked': True, 'likes': 1}))
+        self.assertEqual(self.post('movies.api_like_movie', id=self.movie.id), (200, {'liked': False, 'likes': 0}))
+        self.assertEqual(self.post('movies.api_like_review', review_id=self.review.id),
+                         (200, {'liked': True, 'likes': 1}))
+        self.assertEqual(list(self.review.liked_users.all()), [self.user])
+        call_command('rebuild_movie_stats', verify=True, stdout=io.StringIO())
+
+    def test_like_toggle_is_one_statement_each_way(self):
+        through = Movie.liked_users.through
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(interactions.toggle_like(through, 'movie_id', self.movie.id, self.user.id),
+                             (True, True))
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries
+                          if 'SAVEPOINT' not in query['sql']], ['DELETE', 'INSERT'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(interactions.toggle_like(through, 'movie_id', self.movie.id, self.user.id),
+                             (False, True))
+        self.assertEqual(len(queries), 1)
+
+    def test_rate_and_unrate(self):
+        self.assertEqual(self.post('movies.api_rate_movie', {'rating': '8'}, id=self.movie.id),
+                         (200, {'rating': 8, 'avg_rating': 8.0, 'rating_count': 1}))
+        self.assertEqual(self.post('movies.api_rate_movie', {'rating': '11'}, id=self.movie.id)[0], 400)
+        self.assertEqual(self.post('movies.api_delete_rating', id=self.movie.id),
+                         (200, {'rating': None, 'avg_rating': None, 'rating_count': 0}))
+
+    def test_errors_are_json(self):
+        self.assertEqual(self.post('movies.api_like_movie', id=0)[0], 404)
+        self.assertEqual(self.post('movies.api_rate_movie', {'rating': '8'}, id=0)[0], 404)
+        self.assertEqual(self.post('movies.api_delete_rating', id=0), (404, {'error': 'No such movie.'}))
+        self.assertEqual(self.client.get(reverse('movies.api_like_movie', args=[self.movie.id])).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.post('movies.api_like_movie', id=self.movie.id)[0], 401)
+
+
+class ReviewPopularityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'reader{i}', password='pass') for i in range(3)]
+        cls.movie = Movie.objects.create(name='Alien', price=8, description='Space.', image='movie_images/alien.jpg')
+        cls.reviews = [Review.objects.create(movie=cls.movie, user=cls.users[0], comment=f'Take {i}')
+                       for i in range(3)]
+
+    def test_likes_keep_popularity_current(self):
+        first, second, _ = self.reviews
+        with transaction.atomic():
+            interactions.toggle_review_like(second.id, self.users[1].id)
+        second.liked_users.add(self.users[0], self.users[2])
+        self.users[1].liked_reviews.add(first)
+        first.liked_users.remove(self.users[1])
+        self.users[2].liked_reviews.add(first)
+        self.users[2].liked_reviews.clear()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.popularity, second.popularity), (0, 2))
+        call_command('rebuild_review_popularity', verify=True, stdout=io.StringIO())
+
+    def test_most_helpful_sort(self):
+        for likes, review in zip([1, 3, 2], self.reviews):
+            review.liked_users.add(*self.users[:likes])
+        response = self.client.get(reverse('movies.show', args=[self.movie.id]) + '?sort=helpful')
+        self.assertEqual([review.id for review in response.context['template_data']['reviews']],
+                         [self.reviews[1].id, self.reviews[2].id, self.reviews[0].id])
+        self.assertContains(response, '?sort=helpful')
+
+    def test_rebuild_corrects_drift(self):
+        self.reviews[0].liked_users.add(self.users[1])
+        Review.objects.filter(pk=self.reviews[0].pk).update(popularity=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_review_popularity', verify=True, stdout=io.StringIO())
+        call_command('rebuild_review_popularity', stdout=io.StringIO())
+        self.reviews[0].refresh_from_db()
+        self.assertEqual(self.reviews[0].popularity, 1)
+
+
+class RegionalSalesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(name='Exported', price=10, description='Film.',
+                                         image='movie_images/film.jpg')
+        cls.buyers = {}
+        for country in ('FR', 'JP', ''):
+            user = User.objects.create_user(f'buyer-{country or "none"}', password='pw')
+            user.profile.country = country
+            user.profile.save()
+            cls.buyers[country] = user
+
+    def buy(self, country, quantity):
+        self.client.force_login(self.buyers[country])
+        self.client.post(reverse('cart.add', args=[self.movie.id]), {'quantity': quantity})
+        self.client.post(reverse('cart.purchase'))
+
+    def sales(self):
+        return dict(RegionalSales.objects.values_list('country', 'units_sold'))
+
+    def test_purchases_add_to_the_buyers_country(self):
+        self.buy('FR', 2)
+        self.buy('FR', 1)
+        self.buy('JP', 4)
+        self.buy('', 5)
+        self.assertEqual(self.sales(), {'FR': 3, 'JP': 4})
+
+    def test_backfill_rebuilds_from_items(self):
+        self.buy('FR', 2)
+        self.buy('JP', 1)
+        expected = self.sales()
+        RegionalSales.objects.all().delete()
+        RegionalSales.objects.create(country='DE', movie=self.movie, units_sold=9)
+        call_command('rebuild_regional_sales', stdout=io.StringIO())
+        self.assertEqual(self.sales(), expected)
+
+
+class MapDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        movie = Movie.objects.create(name='Mapped', price=10, description='Film.', image='movie_images/film.jpg')
+        RegionalSales.objects.create(country='FR', movie=movie, units_sold=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_matching_etag_gets_a_304(self):
+        response = self.client.get(reverse('movies.map_data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['regions'][0]['code'], 'FR')
+        again = self.client.get(reverse('movies.map_data'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_purchases_and_rebuilds_change_the_payload(self):
+        before = self.client.get(reverse('movies.map_data'))['ETag']
+        movie = Movie.objects.get(name='Mapped')
+        with self.captureOnCommitCallbacks(execute=True):
+            stats.record_purchase({movie.id: 2}, 'FR')
+        response = self.client.get(reverse('movies.map_data'))
+        self.assertNotEqual(response['ETag'], before)
+        self.assertEqual(response.json()['regions'][0]['total_purchases'], 5)
+
+        # The rebuild recounts from Items, and there are none
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_regional_sales', stdout=io.StringIO())
+        rebuilt = self.client.get(reverse('movies.map_data'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((rebuilt.status_code, rebuilt.json()), (200, {'regions': []}))
+
+    def test_gzip_only_when_accepted(self):
+        plain = self.client.get(reverse('movies.map_data'))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        zipped = self.client.get(reverse('movies.map_data'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertEqual(zipped['Vary'], 'Accept-Encoding')
+
+    def test_region_is_normalized_before_the_etag_and_cache_key(self):
+        by_name = self.client.get(reverse('movies.map_data') + '?region=France')
+        self.assertEqual(by_name.json()['code'], 'FR')
+        self.assertIn('-FR"', by_name['ETag'])
+
+        hostile = self.client.get(reverse('movies.map_data'), {'region': 'x"\r\nSet-Cookie: a=b'})
+        self.assertEqual(hostile.status_code, 404)
+        self.assertNotIn('Set-Cookie', hostile['ETag'])
+        self.client.get(reverse('movies.map_data'), {'region': 'Atlantis'})
+        # Every unknown region shares one cache entry
+        self.assertEqual(len([key for key in cache._cache if 'map_data' in key]), 2)
+
+
+class IndexAuditTests(TestCase):
+    def test_hot_filters_use_indexes(self):
+        out = io.StringIO()
+        cache.clear()
+        cache.set('sentinel', 1)
+        call_command('audit_indexes', stdout=out, stderr=io.StringIO())
+        # Pages rendered from the rolled-back store stay out of the real cache
+        self.assertEqual(list(cache._cache), [cache.make_key('sentinel')])
+        scans = out.getvalue().split('Temporary sorts')[0]
+        for table in ('movies_review', 'movies_rating', 'movies_requestedmovie', 'cart_item',
+                      'petitions_petitionvote'):
+            self.assertNotIn(f'  {table} (', scans)
+        self.assertNotIn('movies.index', scans)
+
+
+class MoviesPerformanceBudgetTests(PerformanceTestCase):
+    """Every movies URL stays within its declared budget on a seeded store."""
+
+    def setUp(self):
+        super().setUp()
+        self.busy_movie = Movie.objects.order_by('-stats__like_count').first()
+
+    def test_index(self):
+        self.assertWithinBudget(reverse('movies.index'))
+        self.assertWithinBudget(reverse('movies.index'), user=self.shopper)
+
+    def test_index_search(self):
+        self.assertWithinBudget(reverse('movies.index') + '?search=seed movie 12', user=self.shopper)
+
+    def test_show(self):
+        self.assertWithinBudget(reverse('movies.show', args=[self.busy_movie.id]))
+        self.assertWithinBudget(reverse('movies.show', args=[self.busy_movie.id]), user=self.shopper)
+        self.assertWithinBudget(reverse('movies.show', args=[self.busy_movie.id]) + '?sort=helpful&page=2')
+
+    def test_interactions(self):
+        movie_id, review_id = self.busy_movie.id, self.busy_movie.review_set.values_list('id', flat=True)[0]
+        self.client.force_login(self.shopper)
+        for name, kwargs, data in [
+            ('movies.create_review', {'id': movie_id}, {'comment': 'Seen it twice.'}),
+            ('movies.rate_movie', {'id': movie_id}, {'rating': '7'}),
+            ('movies.rate_movie', {'id': movie_id}, {'rating': '9'}),
+            ('movies.delete_rating', {'id': movie_id}, {}),
+            ('movies.like_movie', {'id': movie_id}, {}),
+            ('movies.like_review', {'review_id': review_id}, {}),
+        ]:
+            self.assertWithinBudget(reverse(name, kwargs=kwargs), data=data, status=302)
+        for name, kwargs, data in [
+            ('movies.api_rate_movie', {'id': movie_id}, {'rating': '8'}),
+            ('movies.api_delete_rating', {'id': movie_id}, {}),
+            ('movies.api_like_movie', {'id': movie_id}, {}),
+            ('movies.api_like_review', {'review_id': review_id}, {}),
+        ]:
+            self.assertWithinBudget(reverse(name, kwargs=kwargs), data=data)
+
+    def test_catalog(self):
+        response = self.assertWithinBudget(reverse('movies.catalog'))
+        self.assertWithinBudget(reverse('movies.catalog') + '?cursor=' + response.json()['next_cursor'])
+
+    def test_suggest(self):
+        self.assertWithinBudget(reverse('movies.suggest') + '?q=seed mov', user=self.shopper)
+
+    def test_popularity_map(self):
+        response = self.assertWithinBudget(reverse('movies.popularity_map'), user=self.shopper)
+        self.assertContains(response, '/static/movies/geo/world-low.geojson')
+        self.assertNotContains(response, 'raw.githubusercontent.com')
+
+    def test_map_data(self):
+        response = self.assertWithinBudget(reverse('movies.map_data'))
+        self.assertTrue(all(region['code'] for region in response.json()['regions']))
+        self.assertWithinBudget(reverse('movies.map_data') + '?region=France', user=self.shopper)
@@ -16,8 +16,14 @@ urlpatterns = [
       path('<int:id>/rate/', views.rate_movie, name='movies.rate_movie'),
         path('popularity-map/', views.popularity_map, name='movies.popularity_map'),
     path('map-data/', views.map_data, name='movies.map_data'),
+    path('suggest/', views.suggest_movies, name='movies.suggest'),
+    path('catalog/', views.catalog, name='movies.catalog'),
     path('trending/<str:region>/', views.trending_by_region, name='movies.trending_region'),
     path('<int:id>/rating/delete/', views.delete_rating, name='movies.delete_rating'),
+    path('api/<int:id>/like/', views.api_like_movie, name='movies.api_like_movie'),
+    path('api/review/<int:review_id>/like/', views.api_like_review, name='movies.api_like_review'),
+    path('api/<int:id>/rating/', views.api_rate_movie, name='movies.api_rate_movie'),
+    path('api/<int:id>/rating/delete/', views.api_delete_rating, name='movies.api_delete_rating'),
 
 
 
@@ -1,23 +1,58 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Movie, Review, RequestedMovie, Rating
+from .models import Movie, MovieStats, Review, RequestedMovie, Rating, LeaderboardEntry
+from . import fragments, interactions, leaderboard, recommend, search, similar, suggest
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Sum, Avg
-
+from django.db import transaction
+from django.http import JsonResponse
+from django.db.models import Sum
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from moviesstore.api import json_error, json_post
+from moviesstore.pagecache import cache_anonymous
+from moviesstore.pagination import keyset_paginate, page_size_from
+from moviesstore.querybudget import query_budget
+
+# Orderings for a movie's reviews; 'helpful' reads the popularity indexes on Review
+REVIEW_SORTS = {
+    'oldest': ('id',),
+    'helpful': ('-popularity', '-id'),
+}
+
+@query_budget(17, 0.5)
 def index(request):
     search_term = request.GET.get('search')
-    movies = Movie.objects.filter(name__icontains=search_term) if search_term else Movie.objects.all()
+    catalog_page = None
+    if search_term:
+        search_page = search.search_movies(search_term, request.GET.get('page'))
+        movies = list(search_page)
+    else:
+        search_page = None
+        catalog_page = keyset_paginate(Movie.objects.all(), request.GET.get('cursor'),
+                                       settings.MOVIES_PAGE_SIZE)
+        movies = catalog_page.items
 
     template_data = {
         'title': 'Movies',
         'movies': movies,
-        'top_reviews': Review.objects.order_by('-rating')[:5],
-        'recent_reviews': Review.objects.order_by('-date')[:5],
-        'pop_reviews': Review.objects.annotate(num_likes=Count('liked_users')).order_by('-num_likes')[:5],
-        'top_movies': Movie.objects.annotate(times_ordered=Sum('item__quantity')).order_by('-times_ordered')[:3],
+        'search_term': search_term,
+        'search_page': search_page,
+        'catalog_page': catalog_page,
+        # The blocks below are cached fragments (see movies/fragments.py), so
+        # everything they show is lazy and only queried on a cache miss
+        'fragment_versions': fragments.versions(),
+        'top_reviews': Review.objects.select_related('user').order_by('-rating')[:5],
+        'recent_reviews': Review.objects.select_related('user').order_by('-date')[:5],
+        'pop_reviews': (Review.objects.filter(popularity__gt=0).select_related('user')
+                        .order_by(*REVIEW_SORTS['helpful'])[:5]),
+        # Rankings are read from the precomputed leaderboard tables (see movies/leaderboard.py)
+        'top_movies': SimpleLazyObject(
+            lambda: leaderboard.top_movies(LeaderboardEntry.MOVIES_BY_ORDERS, 3, 'times_ordered')),
         'recent_movies': Movie.objects.order_by('-date')[:3],
-        # Updated to use Rating model for average ratings
-        'top_movies_by_rating': Movie.objects.annotate(avg_rating=Avg('rating__rating')).order_by('-avg_rating')[:3],
-        'top_movies_by_likes': Movie.objects.annotate(num_likes=Count('liked_users')).order_by('-num_likes')[:3],
+        'top_movies_by_rating': SimpleLazyObject(
+            lambda: leaderboard.top_movies(LeaderboardEntry.MOVIES_BY_RATING, 3, 'avg_rating')),
+        'top_movies_by_likes': SimpleLazyObject(
+            lambda: leaderboard.top_movies(LeaderboardEntry.MOVIES_BY_LIKES, 3, 'num_likes')),
         'requested_movies': RequestedMovie.objects.all().order_by('-requested_at'),
     }
 
@@ -26,16 +61,18 @@ def index(request):
         template_data['liked_movies'] = (
             Movie.objects
             .filter(liked_users=request.user)
-            .annotate(avg_rating=Avg('rating__rating'))
+            .select_related('stats')
         )
 
         template_data['ordered_movies'] = (
             Movie.objects
             .filter(item__order__user=request.user)
             .annotate(total_ordered=Sum('item__quantity'))
-            .annotate(avg_rating=Avg('rating__rating'))
+            .select_related('stats')
             .order_by('-total_ordered')
         )
+        # Precomputed neighbors (see movies/recommend.py), so this is two indexed queries
+        template_data['recommended_movies'] = recommend.recommended_for(request.user)
     else:
         template_data['liked_movies'] = Movie.objects.none()
         template_data['ordered_movies'] = Movie.objects.none()
@@ -43,6 +80,41 @@ def index(request):
     return render(request, 'movies/index.html', {'template_data': template_data})
 
 
+@query_budget(3, 0.25)
+@cache_anonymous('movies')
+def catalog(request):
+    """JSON catalog API, keyset-paginated newest first via ``cursor``"""
+    page = keyset_paginate(
+        Movie.objects.all(),
+        request.GET.get('cursor'),
+        page_size_from(request, settings.MOVIES_PAGE_SIZE, settings.MOVIES_MAX_PAGE_SIZE),
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'id': movie.id,
+                'name': movie.name,
+                'price': movie.price,
+                'image': movie.image.url if movie.image else None,
+                'date': movie.date,
+            }
+            for movie in page
+        ],
+        'next_cursor': page.next_cursor,
+    })
+
+
+@query_budget(3, 0.25)
+def suggest_movies(request):
+    """Typeahead API: movie titles matching the ``q`` prefix, most popular first"""
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', suggest.MAX_RESULTS)), 20))
+    except ValueError:
+        limit = suggest.MAX_RESULTS
+    return JsonResponse({'query': query, 'results': suggest.index.suggest(query, limit)})
+
+
 def delete_request(request, request_id):
     if request.method == "POST":
         movie_request = get_object_or_404(RequestedMovie, id=request_id)
@@ -50,58 +122,72 @@ def delete_request(request, request_id):
     return redirect('movies.index')
 
 
+@query_budget(13, 0.5)
 @login_required
 def like_review(request, review_id):
-    review = get_object_or_404(Review, id=review_id)
+    review = get_object_or_404(Review.objects.only('id', 'movie_id'), id=review_id)
+    with transaction.atomic():
+        interactions.toggle_review_like(review.id, request.user.id)
+    return redirect('movies.show', id=review.movie_id)
 
-    if request.user in review.liked_users.all():
-        # User already liked → unlike
-        review.liked_users.remove(request.user)
-    else:
-        # User has not liked → like
-        review.liked_users.add(request.user)
 
-    return redirect('movies.show', id=review.movie.id)
+REVIEWS_PER_PAGE = 10
 
 
+@query_budget(10, 0.5)
 def show(request, id):
-    movie = Movie.objects.get(id=id)
-    reviews = Review.objects.filter(movie=movie)
-    top_review = reviews.order_by('-rating').first()
-    
-    # Get user's rating if they're logged in
+    movie = get_object_or_404(Movie.objects.select_related('stats'), id=id)
+    if not hasattr(movie, 'stats'):
+        # No stats row yet (e.g. a bulk-created movie): show zeros until rebuild_movie_stats runs
+        movie.stats = MovieStats(movie=movie)
+    review_sort = request.GET.get('sort')
+    if review_sort not in REVIEW_SORTS:
+        review_sort = 'oldest'
+    reviews = (Review.objects
+               .filter(movie=movie)
+               .select_related('user')
+               .order_by(*REVIEW_SORTS[review_sort]))
+    reviews_page = Paginator(reviews, REVIEWS_PER_PAGE).get_page(request.GET.get('page'))
+    top_review = Review.objects.filter(movie=movie).order_by('-rating').first()
+
+    # Get user's rating and liked state if they're logged in
     user_rating = None
+    user_likes_movie = False
+    liked_review_ids = set()
     if request.user.is_authenticated:
-        try:
-            user_rating = Rating.objects.get(movie=movie, user=request.user)
-        except Rating.DoesNotExist:
-            user_rating = None
-    
-    # Calculate average rating from Rating model
-    avg_rating = Rating.objects.filter(movie=movie).aggregate(Avg('rating'))['rating__avg']
-    
+        user_rating = Rating.objects.filter(movie=movie, user=request.user).first()
+        user_likes_movie = movie.liked_users.filter(pk=request.user.pk).exists()
+        liked_review_ids = set(
+            Review.liked_users.through.objects
+            .filter(user=request.user, review_id__in=[review.id for review in reviews_page])
+            .values_list('review_id', flat=True)
+        )
+
     template_data = {
         'title': movie.name,
         'movie': movie,
-        'reviews': reviews,
+        'reviews': reviews_page,
+        'review_sort': review_sort,
         'top_review': top_review,
         'user_rating': user_rating,
-        'avg_rating': avg_rating,
+        'avg_rating': movie.stats.avg_rating,
+        'user_likes_movie': user_likes_movie,
+        'liked_review_ids': liked_review_ids,
+        'similar_movies': similar.similar_to(movie),
     }
     return render(request, 'movies/show.html', {'template_data': template_data})
 
 
+@query_budget(14, 0.5)
 @login_required
 def like_movie(request, id):
-    movie = get_object_or_404(Movie, id=id)
-    if request.user in movie.liked_users.all():
-        movie.liked_users.remove(request.user)
-    else:
-        movie.liked_users.add(request.user)
-    movie.save()
+    get_object_or_404(Movie.objects.only('id'), id=id)
+    with transaction.atomic():
+        interactions.toggle_movie_like(id, request.user.id)
     return redirect('movies.show', id=id)
 
 
+@query_budget(14, 0.5)
 @login_required
 def rate_movie(request, id):
     """Rate a movie without writing a review"""
@@ -112,30 +198,78 @@ def rate_movie(request, id):
         if rating_value:
             rating_value = int(rating_value)
             if 1 <= rating_value <= 10:
-                # Update or create rating
-                rating, created = Rating.objects.update_or_create(
-                    movie=movie,
-                    user=request.user,
-                    defaults={'rating': rating_value}
-                )
+                # Update or create rating, keeping the movie's counters in step
+                with transaction.atomic():
+                    interactions.rate(movie.id, request.user.id, rating_value)
     
     return redirect('movies.show', id=id)
 
 
+@query_budget(11, 0.5)
 @login_required
 def delete_rating(request, id):
     """Delete user's rating for a movie"""
     if request.method == 'POST':
         movie = get_object_or_404(Movie, id=id)
-        try:
-            rating = Rating.objects.get(movie=movie, user=request.user)
-            rating.delete()
-        except Rating.DoesNotExist:
-            pass
+        with transaction.atomic():
+            interactions.unrate(movie.id, request.user.id)
     
     return redirect('movies.show', id=id)
 
 
+# JSON counterparts of the like and rating forms, for the show page's fetch()
+# calls. Each answers with the new state and counts, so the page need not reload.
+
+def rating_payload(movie_stats, value):
+    return {'rating': value, 'avg_rating': movie_stats.avg_rating, 'rating_count': movie_stats.rating_count}
+
+
+@query_budget(11, 0.25)
+@json_post
+def api_like_movie(request, id):
+    if not Movie.objects.filter(id=id).exists():
+        return json_error('No such movie.', 404)
+    with transaction.atomic():
+        liked, likes = interactions.toggle_movie_like(id, request.user.id)
+    return JsonResponse({'liked': liked, 'likes': likes})
+
+
+@query_budget(10, 0.25)
+@json_post
+def api_like_review(request, review_id):
+    if not Review.objects.filter(id=review_id).exists():
+        return json_error('No such review.', 404)
+    with transaction.atomic():
+        liked, likes = interactions.toggle_review_like(review_id, request.user.id)
+    return JsonResponse({'liked': liked, 'likes': likes})
+
+
+@query_budget(11, 0.25)
+@json_post
+def api_rate_movie(request, id):
+    try:
+        value = int(request.POST.get('rating', ''))
+    except ValueError:
+        value = None
+    if value is None or not 1 <= value <= 10:
+        return json_error('The rating must be a whole number from 1 to 10.', 400)
+    if not Movie.objects.filter(id=id).exists():
+        return json_error('No such movie.', 404)
+    with transaction.atomic():
+        movie_stats = interactions.rate(id, request.user.id, value)
+    return JsonResponse(rating_payload(movie_stats, value))
+
+
+@query_budget(9, 0.25)
+@json_post
+def api_delete_rating(request, id):
+    if not Movie.objects.filter(id=id).exists():
+        return json_error('No such movie.', 404)
+    with transaction.atomic():
+        movie_stats = interactions.unrate(id, request.user.id)
+    return JsonResponse(rating_payload(movie_stats, None))
+
+
 @login_required
 def delete_review(request, id, review_id):
     review = get_object_or_404(Review, id=review_id, user=request.user)
@@ -143,6 +277,7 @@ def delete_review(request, id, review_id):
     return redirect('movies.show', id=id)
 
 
+@query_budget(3, 0.5)
 @login_required
 def create_review(request, id):
     if request.method == 'POST' and request.POST['comment'] != '':
@@ -195,108 +330,105 @@ def request_movie(request):
 
 
 # Add these to your existing movies/views.py
-from django.http import JsonResponse
-from django.db.models import Count, Sum
-from cart.models import Item
-from accounts.models import UserProfile
-from django.shortcuts import render
-
+from django.views.decorators.http import condition
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django_countries import countries
+from .models import RegionalSales
+from django.templatetags.static import static
+from . import geometry, mapcache
+
+@query_budget(2, 0.5)
 def popularity_map(request):
     """Display the geographic popularity map"""
     template_data = {
         'title': 'Global Popularity Map',
+        # Self-hosted geometry, coarsest first; the page swaps levels as it zooms
+        'geometry_levels': [
+            {'level': level, 'min_zoom': min_zoom, 'url': static(geometry.static_name(level))}
+            for level, _, _, min_zoom in geometry.LEVELS
+        ],
     }
     return render(request, 'movies/popularity_map.html', {'template_data': template_data})
 
 
+TOP_MOVIES_PER_REGION = 10
+
+
+def _region_payload(country, rows, total):
+    return {
+        'region': country.name,
+        'code': country.code,
+        'top_movies': [
+            {'name': row.movie.name, 'count': row.units_sold, 'id': row.movie.id}
+            for row in rows
+        ],
+        'total_purchases': total,
+    }
+
+
+@query_budget(4, 0.25)
+@condition(etag_func=mapcache.etag)
 def map_data(request):
     """API endpoint to get trending movies by country"""
     region = request.GET.get('region', None)
-    
-    countries_data = {}
-    
-    # Query to get top movies by country based on purchases
-    items = Item.objects.select_related('order__user__profile', 'movie').all()
-    
-    for item in items:
-        profile = item.order.user.profile
-        # Get country name from django-countries CountryField
-        country = profile.country.name if profile.country else 'Unknown'
-        
-        if country == 'Unknown' or not country:
-            continue
-        
-        if country not in countries_data:
-            countries_data[country] = {}
-        
-        movie_name = item.movie.name
-        if movie_name not in countries_data[country]:
-            countries_data[country][movie_name] = {
-                'count': 0,
-                'movie_id': item.movie.id,
-                'price': item.movie.price
-            }
-        
-        countries_data[country][movie_name]['count'] += item.quantity
-    
-    # Format data for frontend
-    regions = []
-    for country, movies in countries_data.items():
-        # Sort movies by count
-        sorted_movies = sorted(movies.items(), key=lambda x: x[1]['count'], reverse=True)
-        top_movies = []
-        
-        for movie_name, data in sorted_movies[:10]:  # Top 10 movies
-            top_movies.append({
-                'name': movie_name,
-                'count': data['count'],
-                'id': data['movie_id']
-            })
-        
-        regions.append({
-            'region': country,
-            'top_movies': top_movies,
-            'total_purchases': sum(m[1]['count'] for m in sorted_movies)
-        })
-    
-    # If specific region requested, return just that region
-    if region:
-        region_data = next((r for r in regions if r['region'] == region), None)
-        if region_data:
-            return JsonResponse(region_data)
-        return JsonResponse({'error': 'Region not found'}, status=404)
-    
-    # Return all regions
-    return JsonResponse({'regions': regions})
+    return mapcache.cached_response(request, lambda: _build_map_data(region))
 
 
+def _build_map_data(region):
+    """Build the map_data payload; returns ``(data, status)``."""
+    # If specific region requested, return just that region
+    if region:
+        country_code = countries.by_name(region)
+        rows = (RegionalSales.objects
+                .filter(country=country_code)
+                .select_related('movie')
+                .order_by('-units_sold')[:TOP_MOVIES_PER_REGION]) if country_code else []
+        if not rows:
+            return {'error': 'Region not found'}, 404
+        total = (RegionalSales.objects.filter(country=country_code)
+                 .aggregate(total=Sum('units_sold'))['total'])
+        return _region_payload(rows[0].country, rows, total), 200
+
+    # Top movies per country come straight off the (country, -units_sold) index
+    ranked = (RegionalSales.objects
+              .annotate(rank=Window(RowNumber(), partition_by='country', order_by=F('units_sold').desc()))
+              .filter(rank__lte=TOP_MOVIES_PER_REGION)
+              .select_related('movie')
+              .order_by('country', 'rank'))
+    totals = dict(RegionalSales.objects.values('country')
+                  .annotate(total=Sum('units_sold'))
+                  .values_list('country', 'total'))
+
+    top_by_country = {}
+    for row in ranked:
+        top_by_country.setdefault(row.country.code, (row.country, []))[1].append(row)
+
+    regions = [
+        _region_payload(country, rows, totals[code])
+        for code, (country, rows) in top_by_country.items()
+    ]
+    return {'regions': regions}, 200
+
+
+@query_budget(3, 0.5)
 def trending_by_region(request, region):
     """View trending movies for a specific country"""
     # django-countries stores 2-letter country codes, but we're using names in the URL
-    # We need to get items where the country name matches
-    from django_countries import countries
-    
-    # Find country code from name
-    country_code = None
-    for code, name in countries:
-        if name == region:
-            country_code = code
-            break
-    
-    # Get items for this country
+    country_code = countries.by_name(region)
+
     if country_code:
-        items = (Item.objects
-                 .filter(order__user__profile__country=country_code)
-                 .select_related('movie')
-                 .values('movie__id', 'movie__name', 'movie__price')
-                 .annotate(total_purchases=Sum('quantity'))
-                 .order_by('-total_purchases')[:10])
+        items = (RegionalSales.objects
+                 .filter(country=country_code)
+                 .order_by('-units_sold')
+                 .values('movie__id', 'movie__name', 'movie__price',
+                         total_purchases=F('units_sold'))[:10])
     else:
         items = []
-    
+
     template_data = {
         'title': f'Trending in {region}',
         'region': region,
         'trending_movies': items,
     }
-    return render(request, 'movies/trending_region.html', {'template_data': template_data})
\ No newline at end of file
+    return render(request, 'movies/trending_region.html', {'template_data': template_data})
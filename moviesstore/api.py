@@ -0,0 +1,28 @@
+"""Decorators for the small JSON endpoints the pages call with fetch().
+
+The endpoints change state, so they only accept POST (CSRF-protected as
+usual: send the token in the X-CSRFToken header). Errors come back as JSON
+with a matching status instead of a redirect or an HTML page, so a script
+can act on them.
+"""
+from functools import wraps
+
+from django.http import JsonResponse
+
+
+def json_error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def json_post(view):
+    """Allow only POST from a logged-in user, answering 405/401 in JSON otherwise."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            response = json_error('POST required.', 405)
+            response['Allow'] = 'POST'
+            return response
+        if not request.user.is_authenticated:
+            return json_error('Log in first.', 401)
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -11,6 +11,9 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from moviesstore.assets import AssetServerASGI
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moviesstore.settings")
 
-application = get_asgi_application()
+# Static and media files are answered before Django sees the request
+application = AssetServerASGI(get_asgi_application())
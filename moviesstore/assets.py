@@ -0,0 +1,354 @@
+"""Static and media files served in front of Django.
+
+AssetServer wraps the WSGI application (see wsgi.py) and AssetServerASGI
+wraps the ASGI one (see asgi.py). Each answers GET and HEAD requests under
+STATIC_URL and MEDIA_URL straight from STATIC_ROOT and MEDIA_ROOT. Poster
+and CSS traffic therefore never runs middleware, sessions or views.
+Requests for files that do not exist fall through to Django.
+
+Responses carry:
+
+* an ETag and Last-Modified, with 304s for conditional requests;
+* single byte-range support (206/416), e.g. for resumed downloads;
+* the .br or .gz sibling written by collectstatic, when the client
+  accepts it (see CompressedManifestStaticFilesStorage);
+* ``Cache-Control: immutable`` with a one-year max-age for the
+  content-hashed names listed in the staticfiles manifest, and
+  ASSET_MAX_AGE for everything else, since those names can be rewritten.
+
+Whole files go out through the server's zero-copy path where one exists:
+``wsgi.file_wrapper`` (sendfile under gunicorn) or the ASGI
+``http.response.pathsend`` extension. Under ASGI the stat calls and file
+reads run in worker threads, so a slow disk never blocks the event loop.
+"""
+import asyncio
+import gzip
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz siblings are written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+mimetypes.add_type('application/geo+json', '.geojson')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+# Text formats worth compressing; images and fonts are compressed already
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.geojson', '.txt', '.html', '.xml', '.ico'}
+# Sibling encodings, best first: (Accept-Encoding token, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def compress(path):
+    """Write .gz (and .br, with brotli installed) siblings of ``path``.
+
+    A sibling is only kept when it is at least 5% smaller than the original.
+    Returns the suffixes written.
+    """
+    with open(path, 'rb') as original:
+        data = original.read()
+    encoded = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['.br'] = brotli.compress(data)
+    written = []
+    for suffix, body in encoded.items():
+        if len(body) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as sibling:
+                sibling.write(body)
+            shutil.copystat(path, path + suffix)
+            written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest (content-hashed) static files with pre-compressed siblings.
+
+    collectstatic hashes every file as usual, then compresses each text
+    asset, hashed or not, so AssetServer never compresses on a request.
+    A CSS ``url()`` pointing at a file that does not exist is left as
+    written, with a warning, instead of failing the whole collectstatic run.
+    """
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super().url_converter(name, hashed_files, template)
+
+        def lenient_converter(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError as error:
+                logger.warning('Leaving a missing reference unhashed in %s: %s', name, error)
+                return matchobj['matched']
+        return lenient_converter
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for root, _, names in os.walk(self.location):
+            for name in names:
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                    compress(os.path.join(root, name))
+
+
+def hashed_static_names():
+    """Names in the staticfiles manifest that embed a content hash."""
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None) or {}
+    return frozenset(hashed_files.values())
+
+
+def accepted_encodings(header):
+    """Tokens of an Accept-Encoding header, without those given q=0."""
+    accepted = set()
+    for part in header.split(','):
+        token, _, params = part.strip().partition(';')
+        if token and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def byte_range(header, size):
+    """Return ``(start, end)`` (inclusive) for a single-range header.
+
+    Returns None to serve the whole file (no range, or a multi-range request)
+    and raises ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class Asset:
+    """A prepared response for one file: status, headers and the byte span to send."""
+
+    def __init__(self, status, headers, path=None, offset=0, length=0, size=0):
+        self.status = status
+        self.headers = headers
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.size = size
+
+    @property
+    def whole_file(self):
+        return self.path is not None and self.offset == 0 and self.length == self.size
+
+    def chunks(self):
+        with open(self.path, 'rb') as handle:
+            handle.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = handle.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class AssetResolver:
+    """Maps request paths under STATIC_URL and MEDIA_URL to Asset responses."""
+
+    def __init__(self):
+        self.roots = []
+        if settings.STATIC_URL and settings.STATIC_ROOT:
+            self.roots.append((self._prefix(settings.STATIC_URL), str(settings.STATIC_ROOT), True))
+        if settings.MEDIA_URL and settings.MEDIA_ROOT:
+            self.roots.append((self._prefix(settings.MEDIA_URL), str(settings.MEDIA_ROOT), False))
+        self.max_age = getattr(settings, 'ASSET_MAX_AGE', 60 * 60)
+        self.hashed = hashed_static_names()
+
+    @staticmethod
+    def _prefix(url):
+        # STATIC_URL may be a full URL on a CDN; only its path can reach us
+        path = re.sub(r'^[a-z]+://[^/]+', '', url)
+        return '/' + path.strip('/') + '/'
+
+    def handles(self, path):
+        """Whether ``path`` is under STATIC_URL or MEDIA_URL; touches no files."""
+        return any(path.startswith(prefix) for prefix, _, _ in self.roots)
+
+    def locate(self, path):
+        """Return ``(filesystem path, relative name, is_static)`` or None."""
+        for prefix, root, is_static in self.roots:
+            if path.startswith(prefix):
+                name = path[len(prefix):]
+                try:
+                    full_path = safe_join(root, name)
+                except (SuspiciousFileOperation, ValueError):
+                    return None
+                if os.path.isfile(full_path):
+                    return full_path, name, is_static
+                return None
+        return None
+
+    def resolve(self, method, path, headers):
+        """Return an Asset for a GET/HEAD request, or None to hand it to Django.
+
+        ``headers`` maps lower-case request header names to values.
+        """
+        if method not in ('GET', 'HEAD'):
+            return None
+        located = self.locate(path)
+        if located is None:
+            return None
+        full_path, name, is_static = located
+
+        siblings = [(token, full_path + suffix) for token, suffix in ENCODINGS
+                    if os.path.isfile(full_path + suffix)]
+        range_header = headers.get('range')
+        serve_path, encoding = full_path, None
+        if not range_header:
+            accepted = accepted_encodings(headers.get('accept-encoding', ''))
+            for token, sibling in siblings:
+                if token in accepted:
+                    serve_path, encoding = sibling, token
+                    break
+
+        stat = os.stat(serve_path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+        content_type, _ = mimetypes.guess_type(full_path)
+        response_headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE if is_static and name in self.hashed else f'public, max-age={self.max_age}'),
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Accept-Ranges', 'bytes'),
+            # Uploaded media must not be sniffed into a type the browser would run
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        if siblings:
+            response_headers.append(('Vary', 'Accept-Encoding'))
+        if encoding:
+            response_headers.append(('Content-Encoding', encoding))
+
+        if self._not_modified(headers, etag, stat.st_mtime):
+            return Asset(304, response_headers)
+
+        span = None
+        if range_header and self._range_applies(headers.get('if-range'), etag, stat.st_mtime):
+            try:
+                span = byte_range(range_header, stat.st_size)
+            except ValueError:
+                return Asset(416, response_headers + [('Content-Range', f'bytes */{stat.st_size}'),
+                                                      ('Content-Length', '0')])
+        if span is None:
+            start, length, status = 0, stat.st_size, 200
+        else:
+            start, length, status = span[0], span[1] - span[0] + 1, 206
+            response_headers.append(('Content-Range', f'bytes {span[0]}-{span[1]}/{stat.st_size}'))
+        response_headers.append(('Content-Length', str(length)))
+        if method == 'HEAD':
+            return Asset(status, response_headers)
+        return Asset(status, response_headers, serve_path, start, length, stat.st_size)
+
+    @staticmethod
+    def _not_modified(headers, etag, mtime):
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = headers.get('if-modified-since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _range_applies(if_range, etag, mtime):
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return if_range == etag
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_range).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+
+STATUS_TEXT = {200: '200 OK', 206: '206 Partial Content', 304: '304 Not Modified',
+               416: '416 Range Not Satisfiable'}
+
+
+class AssetServer:
+    """WSGI middleware: serve static and media files, pass everything else on."""
+
+    def __init__(self, application):
+        self.application = application
+        self.resolver = AssetResolver()
+
+    def __call__(self, environ, start_response):
+        headers = {key[5:].replace('_', '-').lower(): value for key, value in environ.items()
+                   if key.startswith('HTTP_')}
+        path = environ.get('PATH_INFO', '').encode('latin-1').decode('utf-8', 'replace')
+        asset = self.resolver.resolve(environ['REQUEST_METHOD'], path, headers)
+        if asset is None:
+            return self.application(environ, start_response)
+        start_response(STATUS_TEXT[asset.status], asset.headers)
+        if asset.path is None:
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and asset.whole_file:
+            return file_wrapper(open(asset.path, 'rb'), CHUNK_SIZE)
+        return asset.chunks()
+
+
+class AssetServerASGI:
+    """ASGI middleware: serve static and media files, pass everything else on."""
+
+    def __init__(self, application):
+        self.application = application
+        self.resolver = AssetResolver()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.application(scope, receive, send)
+        if not self.resolver.handles(scope['path']):
+            return await self.application(scope, receive, send)
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        asset = await asyncio.to_thread(self.resolver.resolve, scope['method'], scope['path'], headers)
+        if asset is None:
+            return await self.application(scope, receive, send)
+        await send({
+            'type': 'http.response.start',
+            'status': asset.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in asset.headers],
+        })
+        if asset.path is None:
+            await send({'type': 'http.response.body', 'body': b''})
+        elif asset.whole_file and 'http.response.pathsend' in scope.get('extensions', {}):
+            await send({'type': 'http.response.pathsend', 'path': asset.path})
+        else:
+            chunks = asset.chunks()
+            try:
+                chunk = await asyncio.to_thread(next, chunks, b'')
+                while (following := await asyncio.to_thread(next, chunks, None)) is not None:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    chunk = following
+                await send({'type': 'http.response.body', 'body': chunk})
+            finally:
+                # Closes the file even if the client went away mid-response
+                await asyncio.to_thread(chunks.close)
@@ -0,0 +1,52 @@
+"""Versioned keys for cached template fragments.
+
+A fragment is cached with ``{% cache %}`` and varies on the version of
+every group of data it shows, for example::
+
+    {% cache None movies_top_rated template_data.fragment_versions.ratings %}
+
+Writes bump a group's version from signal receivers (see
+movies/fragments.py). The next render then misses, and the old entries are
+never read again and age out of the cache. Fragments are stored without
+a timeout, because freshness comes from versions rather than TTLs.
+
+A version starts from the current time in nanoseconds rather than 1. If
+the cache evicts a version key, its replacement therefore never collides
+with a version that is still cached.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _key(group):
+    return f'fragments:version:{group}'
+
+
+def versions(*groups):
+    """Return ``{group: version}`` for ``groups`` with one cache round trip."""
+    keys = {group: _key(group) for group in groups}
+    found = cache.get_many(keys.values())
+    result = {}
+    for group, key in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        result[group] = found[key]
+    return result
+
+
+def bump(*groups):
+    """Invalidate every fragment that varies on any of ``groups``.
+
+    The bump waits for the current transaction to commit. Otherwise a render
+    in between could cache the old data under the new version.
+    """
+    def apply():
+        for group in groups:
+            try:
+                cache.incr(_key(group))
+            except ValueError:
+                cache.set(_key(group), time.time_ns(), None)
+    transaction.on_commit(apply)
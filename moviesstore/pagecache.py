@@ -0,0 +1,100 @@
+"""Full-page cache for anonymous GET traffic.
+
+Views opt in with ``@cache_anonymous(*groups)``. The groups name the data
+their output depends on (see moviesstore/fragments.py). For a repeat
+anonymous request, AnonymousPageCacheMiddleware then answers from the
+cache with one ``get_many`` for the group versions and one ``get`` for the
+page. No view, ORM or template code runs.
+
+A request is looked up, and its response stored, only if:
+
+* it is a GET or HEAD from a visitor who is not logged in and has no
+  pending messages;
+* the response is a 200 that did not use a CSRF token, sets no cookies, is
+  not marked private, no-cache or no-store, and varies on nothing but Cookie.
+
+Pages are keyed on the path, the query string with its parameters sorted
+(so ``?page=2&search=x`` and ``?search=x&page=2`` share an entry), and the
+current versions of their groups. Bumping a group therefore purges every
+page built from it. PAGE_CACHE_TIMEOUT bounds how long a page can live
+regardless of versions.
+
+Keep this middleware last in MIDDLEWARE. Its response phase must run
+before CsrfViewMiddleware clears the flag that shows a token was used.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import cc_delim_re
+
+from . import fragments
+
+
+def cache_anonymous(*groups):
+    """Serve this view's anonymous GET responses from the page cache."""
+    def decorator(view_func):
+        view_func.page_cache_groups = groups
+        return view_func
+    return decorator
+
+
+def is_anonymous(request):
+    """True for a visitor with no login and no pending messages.
+
+    Reading the session costs no query with a cache-backed session engine.
+    """
+    if request.COOKIES.get('messages'):
+        return False
+    session = request.session
+    return SESSION_KEY not in session and '_messages' not in session
+
+
+def page_key(request, groups):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    versions = fragments.versions(*groups)
+    raw = '|'.join([request.path, query] + [f'{group}={versions[group]}' for group in groups])
+    return 'pagecache:' + hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+def is_cacheable(request, response):
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    cache_control = {directive.strip().lower() for directive in cc_delim_re.split(response.get('Cache-Control', ''))}
+    if cache_control & {'private', 'no-store', 'no-cache'}:
+        return False
+    vary = {header.strip().lower() for header in cc_delim_re.split(response.get('Vary', '')) if header.strip()}
+    return vary <= {'cookie'}
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, '_page_cache_key', None)
+        if key is not None and is_cacheable(request, response):
+            cache.set(key, (list(response.items()), response.content), self.timeout)
+            response['X-Page-Cache'] = 'miss'
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        groups = getattr(view_func, 'page_cache_groups', None)
+        if groups is None or request.method not in ('GET', 'HEAD') or not is_anonymous(request):
+            return None
+        key = page_key(request, groups)
+        entry = cache.get(key)
+        if entry is None:
+            request._page_cache_key = key
+            return None
+        headers, content = entry
+        response = HttpResponse(content, headers=headers)
+        response['X-Page-Cache'] = 'hit'
+        return response
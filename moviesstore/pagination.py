@@ -0,0 +1,74 @@
+"""Keyset (cursor) pagination shared by the catalog and order history.
+
+Rows are ordered by ``(<field> DESC, id DESC)`` and a page starts strictly
+after the last row of the previous one. Each page is then a bounded index
+range scan, however deep the page, and inserts never shift rows across
+pages. Cursors are opaque, URL-safe tokens encoding that last
+``(<field>, id)`` pair.
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(value, pk):
+    payload = json.dumps([value.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(datetime, pk)`` for a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded))
+        value = parse_datetime(value)
+        if value is None:
+            return None
+        return value, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(queryset, cursor, page_size, field='date'):
+    """Return the KeysetPage of ``queryset`` that follows ``cursor``."""
+    queryset = queryset.order_by(f'-{field}', '-id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+    rows = list(queryset[:page_size + 1])
+    page = KeysetPage(items=rows[:page_size])
+    if len(rows) > page_size:
+        last = page.items[-1]
+        page.next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return page
+
+
+def page_size_from(request, default, maximum):
+    """Read a ``page_size`` query parameter, clamped to ``1..maximum``."""
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        return default
+    return max(1, min(size, maximum))
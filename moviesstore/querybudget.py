@@ -0,0 +1,89 @@
+"""Per-view query and wall-time budgets.
+
+Views declare what they may cost with ``@query_budget(max_queries,
+max_seconds)``. A view whose POST path writes, and so costs more than its
+GET, declares that separately with ``post_queries``. Put the decorator
+outermost, above ``@login_required`` and friends.
+The budget counts every query in the request, including the session and
+user lookups, and the regression tests assert each URL stays within the
+budget its view declares.
+
+During development QueryBudgetMiddleware measures each request and either
+logs (QUERY_BUDGET_MODE = 'log') or fails (QUERY_BUDGET_MODE = 'raise')
+when a view goes over. With any other mode the middleware unloads itself
+and costs nothing.
+"""
+import logging
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_queries: int
+    max_seconds: float = None
+
+    def violations(self, num_queries, elapsed):
+        problems = []
+        if num_queries > self.max_queries:
+            problems.append(f'{num_queries} queries (budget {self.max_queries})')
+        if self.max_seconds is not None and elapsed > self.max_seconds:
+            problems.append(f'{elapsed:.3f}s (budget {self.max_seconds}s)')
+        return problems
+
+
+def query_budget(max_queries, max_seconds=None, post_queries=None):
+    """Declare the most queries (and optionally seconds) a view may spend per request.
+
+    ``post_queries`` is the query budget for POST requests, if it differs.
+    """
+    def decorator(view_func):
+        view_func.query_budget = QueryBudget(max_queries, max_seconds)
+        view_func.post_query_budget = (QueryBudget(post_queries, max_seconds) if post_queries is not None
+                                       else view_func.query_budget)
+        return view_func
+    return decorator
+
+
+def budget_for(view_func, method='GET'):
+    if method == 'POST':
+        return getattr(view_func, 'post_query_budget', None)
+    return getattr(view_func, 'query_budget', None)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+        if self.mode not in ('log', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None:
+            problems = budget.violations(len(queries), elapsed)
+            if problems:
+                message = f"{request.method} {request.path} exceeded its budget: {', '.join(problems)}"
+                if self.mode == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = budget_for(view_func, request.method)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so it counts the session and auth queries too
+    "moviesstore.querybudget.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -53,6 +56,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # Innermost, so it sees whether the view used a CSRF token
+    "moviesstore.pagecache.AnonymousPageCacheMiddleware",
 ]
 
 ROOT_URLCONF = "moviesstore.urls"
@@ -76,14 +81,118 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "moviesstore.wsgi.application"
 
-DATABASES = {
-    'default': {
+# Database tier, picked with the MOVIESSTORE_DB environment variable:
+#   sqlite         db.sqlite3 in WAL mode, so readers never block the writer.
+#                  Writers queue for up to 5s (busy_timeout) instead of failing
+#                  with "database is locked", and transactions take the write
+#                  lock up front (BEGIN IMMEDIATE), so two of them can never
+#                  deadlock upgrading a read lock. synchronous=NORMAL is
+#                  durable in WAL mode except on power loss, and reads go
+#                  through a 256 MB memory map.
+#   postgres       MOVIESSTORE_DB_NAME/_USER/_PASSWORD/_HOST/_PORT, with
+#                  persistent connections that are health-checked before reuse
+#   postgres_pool  the same server through a psycopg 3 connection pool shared
+#                  by the threads of a process (needs psycopg[pool])
+# Compare write throughput under concurrency with `manage.py bench_db_writes`.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+]
+POSTGRES = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.environ.get('MOVIESSTORE_DB_NAME', 'moviesstore'),
+    'USER': os.environ.get('MOVIESSTORE_DB_USER', 'moviesstore'),
+    'PASSWORD': os.environ.get('MOVIESSTORE_DB_PASSWORD', ''),
+    'HOST': os.environ.get('MOVIESSTORE_DB_HOST', '127.0.0.1'),
+    'PORT': os.environ.get('MOVIESSTORE_DB_PORT', '5432'),
+}
+DATABASE_PROFILES = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'postgres': {
+        **POSTGRES,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'postgres_pool': {
+        **POSTGRES,
+        # Pooled connections are returned after each request, so CONN_MAX_AGE stays 0
+        'OPTIONS': {'pool': {'min_size': 2, 'max_size': 20, 'timeout': 10}},
+    },
+}
+DATABASE_MODE = os.environ.get('MOVIESSTORE_DB', 'sqlite')
+DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_MODE],
 }
 
 
+# Caches. MOVIESSTORE_CACHE picks the backend of the default cache, which
+# holds the rendered page fragments and other derived data:
+#   locmem  per-process memory (default); invalidations
+#           only reach the process that made them, so use it with one worker
+#   file    a directory shared by the processes on one host
+#   redis   a Redis-compatible server at MOVIESSTORE_CACHE_URL
+# Cached entries are versioned and invalidated by signals (see
+# moviesstore/fragments.py), so no backend depends on expiry for freshness.
+# 'sessions' backs the cached_db and cache session engines, so it must be
+# shared by every worker process: a file cache by default.
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('MOVIESSTORE_CACHE_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'moviesstore-cache')),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('MOVIESSTORE_CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHE_MODE = os.environ.get('MOVIESSTORE_CACHE', 'locmem')
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_MODE],
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('MOVIESSTORE_SESSION_CACHE_DIR',
+                                   os.path.join(tempfile.gettempdir(), 'moviesstore-sessions')),
+    },
+}
+
+# Session tier, picked with the MOVIESSTORE_SESSIONS environment variable:
+#   db              every request reads django_session, every change writes it
+#   cached_db       reads come from the 'sessions' cache, writes also go to the db
+#   cache           'sessions' cache only, no database at all
+#   signed_cookies  no server-side state; the session is a signed cookie
+#   file            one file per session under SESSION_FILE_PATH
+# The cart keeps only its id in the session, so every engine can hold it.
+# Compare the engines with `manage.py bench_sessions`.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'file': 'django.contrib.sessions.backends.file',
+}
+SESSION_MODE = os.environ.get('MOVIESSTORE_SESSIONS', 'cached_db')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# Upper bound on a page's life in the anonymous page cache; writes purge
+# pages earlier through their data-group versions (moviesstore/pagecache.py)
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -119,6 +228,27 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
 STATIC_URL = "/static/"
+STATIC_ROOT = os.environ.get('MOVIESSTORE_STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+# Asset mode, picked with the MOVIESSTORE_ASSETS environment variable:
+#   dev         plain names, served by runserver's staticfiles handler
+#   production  collectstatic writes content-hashed names plus .gz/.br
+#               siblings to STATIC_ROOT
+# In both modes moviesstore.assets serves STATIC_ROOT and MEDIA_ROOT in
+# front of Django (see wsgi.py and asgi.py). Hashed names are cached for a
+# year, everything else for ASSET_MAX_AGE seconds.
+ASSET_MODE = os.environ.get('MOVIESSTORE_ASSETS', 'dev')
+if ASSET_MODE == 'production':
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'moviesstore.assets.CompressedManifestStaticFilesStorage'},
+    }
+ASSET_MAX_AGE = 60 * 60
+
+# `manage.py test` runs with in-memory caches, cache-backed sessions and
+# plain static storage, whatever the MOVIESSTORE_* variables above select
+# (see moviesstore/testing.py)
+TEST_RUNNER = 'moviesstore.testing.TestRunner'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -131,3 +261,18 @@ STATICFILES_DIRS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+
+# Query budgets declared with @query_budget: 'log' or 'raise' when a view
+# goes over, anything else disables the check
+QUERY_BUDGET_MODE = 'log' if DEBUG else 'off'
+
+# Catalog pagination (movies index and /movies/catalog/)
+MOVIES_PAGE_SIZE = 24
+MOVIES_MAX_PAGE_SIZE = 100
+
+# Orders per page of purchase history
+ORDERS_PAGE_SIZE = 10
+
+# Anonymous carts untouched for this many days are deleted by the
+# expire_carts command (run it daily, e.g. from cron). Users' carts are kept.
+ANONYMOUS_CART_MAX_AGE_DAYS = 30
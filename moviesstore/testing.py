@@ -0,0 +1,161 @@
+"""Test runner and shared fixtures for the performance regression tests.
+
+``TestRunner`` (the TEST_RUNNER setting) overrides the environment-selected
+cache, session and static storage backends with in-memory defaults, so the
+suite behaves the same whatever MOVIESSTORE_* variables are set.
+``seed_store`` bulk-loads a realistically sized store: thousands of
+movies, reviews, ratings and order items. It then rebuilds the derived
+tables with the same commands used in production.
+``PerformanceTestCase.assertWithinBudget`` requests a URL and checks it
+against the query/time budget declared on its view.
+"""
+import io
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from accounts.models import UserProfile
+from cart.models import Item, Order
+from movies.models import Movie, Rating, Review
+from moviesstore.querybudget import budget_for
+from petitions.models import Petition, PetitionVote
+
+TEST_SETTINGS = {
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+    },
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cache',
+    'STORAGES': {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+COUNTRIES = ['US', 'GB', 'FR', 'DE', 'IN', 'BR', 'JP', 'AU', 'CA', 'MX']
+
+
+def seed_store(movies=2000, users=200, reviews=5000, ratings=5000, orders=1500,
+               petitions=300, seed=1234):
+    """Bulk-create a store of the given size and return the list of users."""
+    rng = random.Random(seed)
+
+    User.objects.bulk_create(
+        User(username=f'shopper{i}', password='!', email=f'shopper{i}@example.com')
+        for i in range(users)
+    )
+    user_list = list(User.objects.filter(username__startswith='shopper').order_by('id'))
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, country=COUNTRIES[i % len(COUNTRIES)])
+        for i, user in enumerate(user_list)
+    )
+
+    Movie.objects.bulk_create(
+        Movie(name=f'Seed Movie {i}', price=rng.randint(5, 30),
+              description=f'Description of seeded movie number {i}.',
+              image=f'movie_images/seed{i}.jpg')
+        for i in range(movies)
+    )
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+
+    Review.objects.bulk_create(
+        Review(comment=f'Review {i}', rating=rng.randint(1, 10),
+               movie_id=rng.choice(movie_ids), user=rng.choice(user_list))
+        for i in range(reviews)
+    )
+    review_ids = list(Review.objects.values_list('id', flat=True))
+
+    rating_pairs = {(rng.choice(movie_ids), rng.choice(user_list).id) for _ in range(ratings)}
+    Rating.objects.bulk_create(
+        Rating(movie_id=movie_id, user_id=user_id, rating=rng.randint(1, 10))
+        for movie_id, user_id in rating_pairs
+    )
+
+    movie_likes = {(rng.choice(movie_ids), rng.choice(user_list).id) for _ in range(reviews)}
+    Movie.liked_users.through.objects.bulk_create(
+        Movie.liked_users.through(movie_id=movie_id, user_id=user_id)
+        for movie_id, user_id in movie_likes
+    )
+    review_likes = {(rng.choice(review_ids), rng.choice(user_list).id) for _ in range(reviews)}
+    Review.liked_users.through.objects.bulk_create(
+        Review.liked_users.through(review_id=review_id, user_id=user_id)
+        for review_id, user_id in review_likes
+    )
+
+    Order.objects.bulk_create(
+        Order(total=0, user=rng.choice(user_list)) for _ in range(orders)
+    )
+    items = []
+    for order_id in Order.objects.values_list('id', flat=True):
+        for movie_id in rng.sample(movie_ids, 3):
+            items.append(Item(order_id=order_id, movie_id=movie_id, price=10, quantity=rng.randint(1, 3)))
+    Item.objects.bulk_create(items)
+
+    Petition.objects.bulk_create(
+        Petition(title=f'Please add movie {i}', description='Pretty please.',
+                 created_by=rng.choice(user_list))
+        for i in range(petitions)
+    )
+    petition_ids = list(Petition.objects.values_list('id', flat=True))
+    votes = {(rng.choice(petition_ids), rng.choice(user_list).id) for _ in range(petitions * 10)}
+    PetitionVote.objects.bulk_create(
+        PetitionVote(petition_id=petition_id, user_id=user_id, value=rng.random() < 0.7)
+        for petition_id, user_id in votes
+    )
+
+    call_command('rebuild_movie_stats', stdout=io.StringIO())
+    call_command('rebuild_review_popularity', stdout=io.StringIO())
+    call_command('rebuild_regional_sales', stdout=io.StringIO())
+    call_command('rebuild_petition_tallies', stdout=io.StringIO())
+    return user_list
+
+
+class PerformanceTestCase(TestCase):
+    """Seeds one store per test class and checks URLs against view budgets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = seed_store()
+        # The shopper with the most orders, so history pages have real volume
+        cls.shopper = max(cls.users, key=lambda user: user.order_set.count())
+
+    def setUp(self):
+        # Cached fragments and order lines from another test's store would hide real queries
+        cache.clear()
+
+    def assertWithinBudget(self, url, user=None, data=None, status=200):
+        """GET ``url``, or POST ``data`` to it, and check the view's budget for that method."""
+        method = 'GET' if data is None else 'POST'
+        budget = budget_for(resolve(url.split('?')[0]).func, method)
+        self.assertIsNotNone(budget, f'{url} has no @query_budget declared')
+        if user is not None:
+            self.client.force_login(user)
+
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url) if data is None else self.client.post(url, data)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, status, url)
+        self.assertEqual(budget.violations(len(queries), elapsed), [], url)
+        return response
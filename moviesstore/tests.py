@@ -0,0 +1,319 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from movies.models import Movie
+from petitions.models import Petition
+from . import assets, pagecache, pagination
+from .querybudget import QueryBudgetExceeded, QueryBudgetMiddleware, query_budget
+
+
+@query_budget(1)
+def two_query_view(request):
+    User.objects.count()
+    User.objects.exists()
+    return HttpResponse('ok')
+
+
+@query_budget(1, post_queries=2)
+def writing_view(request):
+    User.objects.count()
+    if request.method == 'POST':
+        User.objects.exists()
+    return HttpResponse('ok')
+
+
+def undeclared_view(request):
+    User.objects.count()
+    User.objects.exists()
+    return HttpResponse('ok')
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def run_view(self, view, method='get'):
+        request = getattr(RequestFactory(), method)('/')
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        return middleware(request)
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_raise_mode_fails_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.run_view(two_query_view)
+
+    @override_settings(QUERY_BUDGET_MODE='log')
+    def test_log_mode_logs_over_budget(self):
+        with self.assertLogs('moviesstore.querybudget', 'WARNING') as logs:
+            self.assertEqual(self.run_view(two_query_view).status_code, 200)
+        self.assertIn('2 queries (budget 1)', logs.output[0])
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_post_requests_use_the_post_budget(self):
+        self.assertEqual(self.run_view(writing_view, 'post').status_code, 200)
+        self.assertEqual(self.run_view(writing_view).status_code, 200)
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_views_without_budget_are_not_checked(self):
+        self.assertEqual(self.run_view(undeclared_view).status_code, 200)
+
+
+class QueryBudgetDisabledTests(SimpleTestCase):
+    @override_settings(QUERY_BUDGET_MODE='off')
+    def test_middleware_unloads_itself(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(lambda request: None)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Movie.objects.bulk_create(
+            Movie(name=f'Movie {i}', price=10, description='Film.', image='movie_images/film.jpg')
+            for i in range(5)
+        )
+        # Two movies share a date, so the id has to break the tie
+        cls.tied_date = timezone.now() - timedelta(days=1)
+        Movie.objects.filter(name__in=['Movie 1', 'Movie 3']).update(date=cls.tied_date)
+
+    def test_cursor_round_trips(self):
+        pk = 42
+        self.assertEqual(pagination.decode_cursor(pagination.encode_cursor(self.tied_date, pk)),
+                         (self.tied_date, pk))
+
+    def test_pages_cover_every_row_once_in_order(self):
+        expected = list(Movie.objects.order_by('-date', '-id').values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            page = pagination.keyset_paginate(Movie.objects.all(), cursor, 2)
+            seen.extend(movie.id for movie in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursors_start_from_the_first_page(self):
+        first = [movie.id for movie in pagination.keyset_paginate(Movie.objects.all(), None, 2)]
+        for cursor in ['', 'not-base64!', 'bm90IGpzb24', 'WyJub3QgYSBkYXRlIiwgMV0', 'WzFd']:
+            self.assertIsNone(pagination.decode_cursor(cursor), cursor)
+            page = pagination.keyset_paginate(Movie.objects.all(), cursor, 2)
+            self.assertEqual([movie.id for movie in page], first)
+
+    def test_inserts_do_not_shift_later_pages(self):
+        first = pagination.keyset_paginate(Movie.objects.all(), None, 2)
+        expected = [movie.id for movie in pagination.keyset_paginate(Movie.objects.all(), first.next_cursor, 2)]
+        Movie.objects.create(name='Newest', price=10, description='Film.', image='movie_images/film.jpg')
+        again = pagination.keyset_paginate(Movie.objects.all(), first.next_cursor, 2)
+        self.assertEqual([movie.id for movie in again], expected)
+
+    def test_page_size_is_clamped(self):
+        factory = RequestFactory()
+        for raw, size in [('5', 5), ('0', 1), ('-3', 1), ('999', 50), ('x', 10)]:
+            request = factory.get('/', {'page_size': raw})
+            self.assertEqual(pagination.page_size_from(request, 10, 50), size, raw)
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('member', password='pass')
+        cls.petition = Petition.objects.create(title='Bring back Firefly', created_by=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_repeat_anonymous_requests_skip_the_orm(self):
+        first, _ = self.get(reverse('petitions.index'))
+        second, queries = self.get(reverse('petitions.index'))
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(queries, 0)
+        self.assertEqual(second.content, first.content)
+
+    def test_query_strings_are_keyed_in_any_order(self):
+        self.get(reverse('movies.catalog') + '?page_size=5&cursor=')
+        response, _ = self.get(reverse('movies.catalog') + '?cursor=&page_size=5')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response, _ = self.get(reverse('movies.catalog') + '?page_size=6')
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+    def test_writes_purge_dependent_pages(self):
+        self.get(reverse('petitions.index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Petition.objects.create(title='Release the Snyder cut', created_by=self.user)
+        response, _ = self.get(reverse('petitions.index'))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Release the Snyder cut')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.get(reverse('petitions.index'))
+        self.client.force_login(self.user)
+        response, _ = self.get(reverse('petitions.index'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'member')
+
+    def test_responses_that_used_csrf_or_vary_are_not_stored(self):
+        request = RequestFactory().get('/')
+        self.assertTrue(pagecache.is_cacheable(request, HttpResponse('ok')))
+        request.META['CSRF_COOKIE_NEEDS_UPDATE'] = True
+        self.assertFalse(pagecache.is_cacheable(request, HttpResponse('ok')))
+        request = RequestFactory().get('/')
+        self.assertFalse(pagecache.is_cacheable(request, HttpResponse('ok', headers={'Vary': 'Accept-Language'})))
+        self.assertFalse(pagecache.is_cacheable(request, HttpResponse('ok', headers={'Cache-Control': 'private'})))
+
+
+@override_settings(
+    STATIC_ROOT=tempfile.mkdtemp(prefix='moviesstore-test-static-'),
+    MEDIA_ROOT=tempfile.mkdtemp(prefix='moviesstore-test-media-'),
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'moviesstore.assets.CompressedManifestStaticFilesStorage'},
+    },
+)
+class AssetServerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.MEDIA_ROOT, 'poster.jpg'), 'wb') as poster:
+            poster.write(bytes(range(256)) * 4)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.STATIC_ROOT, ignore_errors=True)
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def request(self, path, **headers):
+        def django(environ, start_response):
+            start_response('404 Not Found', [])
+            return [b'django']
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+        environ.update({'HTTP_' + name.upper(): value for name, value in headers.items()})
+        started = {}
+        body = b''.join(assets.AssetServer(django)(environ, lambda status, headers: started.update(
+            status=status, headers=dict(headers))))
+        return started['status'], started['headers'], body
+
+    def test_hashed_static_files_are_immutable_and_precompressed(self):
+        hashed = staticfiles_storage.stored_name('admin/css/base.css')
+        status, headers, body = self.request(f'/static/{hashed}', accept_encoding='gzip, deflate')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Cache-Control'], assets.IMMUTABLE)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['X-Content-Type-Options'], 'nosniff')
+        with open(os.path.join(settings.STATIC_ROOT, hashed), 'rb') as original:
+            self.assertEqual(gzip.decompress(body), original.read())
+        _, headers, _ = self.request('/static/admin/css/base.css')
+        self.assertNotIn('immutable', headers['Cache-Control'])
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_range_and_conditional_requests(self):
+        status, headers, body = self.request('/media/poster.jpg', range='bytes=10-19')
+        self.assertEqual(status, '206 Partial Content')
+        self.assertEqual(headers['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(body, bytes(range(10, 20)))
+        status, _, body = self.request('/media/poster.jpg', range='bytes=-4')
+        self.assertEqual(body, bytes(range(252, 256)))
+        status, headers, _ = self.request('/media/poster.jpg', range='bytes=2000-')
+        self.assertEqual(status, '416 Range Not Satisfiable')
+        self.assertEqual(headers['X-Content-Type-Options'], 'nosniff')
+        status, headers, _ = self.request('/media/poster.jpg')
+        status, headers, body = self.request('/media/poster.jpg', if_none_match=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        self.assertEqual(headers['X-Content-Type-Options'], 'nosniff')
+
+    def test_missing_files_and_traversal_fall_through_to_django(self):
+        self.assertEqual(self.request('/media/missing.jpg')[2], b'django')
+        self.assertEqual(self.request('/media/../manage.py')[2], b'django')
+        self.assertEqual(self.request('/movies/')[2], b'django')
+
+    async def asgi_request(self, path, extensions=None, **headers):
+        async def django(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'extensions': extensions or {},
+            'headers': [(name.replace('_', '-').encode(), value.encode()) for name, value in headers.items()],
+        }
+        await assets.AssetServerASGI(django)(scope, None, send)
+        return messages
+
+    async def test_asgi_reads_files_off_the_event_loop(self):
+        threads = set()
+        resolve, chunks = assets.AssetResolver.resolve, assets.Asset.chunks
+
+        def recording_resolve(*args):
+            threads.add(threading.get_ident())
+            return resolve(*args)
+
+        def recording_chunks(asset):
+            for chunk in chunks(asset):
+                threads.add(threading.get_ident())
+                yield chunk
+
+        with mock.patch.object(assets.AssetResolver, 'resolve', recording_resolve), \
+                mock.patch.object(assets.Asset, 'chunks', recording_chunks), \
+                mock.patch.object(assets, 'CHUNK_SIZE', 100):
+            messages = await self.asgi_request('/media/poster.jpg', range='bytes=50-849')
+        self.assertEqual(messages[0]['status'], 206)
+        self.assertEqual(b''.join(message['body'] for message in messages[1:]), (bytes(range(256)) * 4)[50:850])
+        self.assertEqual(len(messages), 1 + 8)
+        self.assertFalse(messages[-1].get('more_body'))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_asgi_pathsend_and_fall_through(self):
+        messages = await self.asgi_request('/media/poster.jpg', extensions={'http.response.pathsend': {}})
+        self.assertIn((b'x-content-type-options', b'nosniff'), messages[0]['headers'])
+        self.assertEqual(messages[1], {'type': 'http.response.pathsend',
+                                       'path': os.path.join(settings.MEDIA_ROOT, 'poster.jpg')})
+        self.assertEqual((await self.asgi_request('/media/missing.jpg'))[1]['body'], b'django')
+        with mock.patch.object(assets.AssetResolver, 'resolve') as resolve:
+            self.assertEqual((await self.asgi_request('/movies/'))[1]['body'], b'django')
+        resolve.assert_not_called()
+
+
+class DatabaseTierTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite profile only')
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for pragma in ('busy_timeout', 'synchronous', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                pragmas[pragma] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {'busy_timeout': 5000, 'synchronous': 1, 'temp_store': 2})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
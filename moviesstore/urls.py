@@ -16,8 +16,6 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf.urls.static import static
-from django.conf import settings
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', include('home.urls')),
@@ -26,6 +24,6 @@ urlpatterns = [
     path('cart/', include('cart.urls')),
     path('petitions/', include('petitions.urls')),
 ]
-urlpatterns += static(settings.MEDIA_URL,
-    document_root=settings.MEDIA_ROOT)
+# Media and collected static files are served by moviesstore.assets in
+# front of Django, so no URL patterns are needed for them
 
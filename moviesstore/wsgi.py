@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from moviesstore.assets import AssetServer
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moviesstore.settings")
 
-application = get_wsgi_application()
+# Static and media files are answered before Django sees the request
+application = AssetServer(get_wsgi_application())
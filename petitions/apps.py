@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class PetitionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "petitions"
+
+    def ready(self):
+        # Registers the receivers that purge cached petition pages and
+        # take deleted votes off the tallies.
+        from . import fragments, tallies  # noqa: F401
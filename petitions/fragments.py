@@ -0,0 +1,19 @@
+"""Signal receivers that purge cached petition pages.
+
+The petitions listing is cached for anonymous visitors under the
+'petitions' group (see moviesstore/pagecache.py). Any petition or vote write
+bumps that group.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from moviesstore import fragments
+from .models import Petition, PetitionVote
+
+
+@receiver(post_save, sender=Petition)
+@receiver(post_delete, sender=Petition)
+@receiver(post_save, sender=PetitionVote)
+@receiver(post_delete, sender=PetitionVote)
+def petitions_changed(sender, **kwargs):
+    fragments.bump('petitions')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from petitions import tallies
+from petitions.models import Petition
+
+FIELDS = ('yes_votes', 'no_votes', 'total_votes', 'trending_score')
+SCORE_TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = 'Recompute the vote tallies and trending scores on Petition from the PetitionVote table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only report tallies that disagree with the votes; do not write.',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = tallies.computed_tallies()
+            petitions = list(Petition.objects.only('id', *FIELDS))
+
+            mismatches = []
+            for petition in petitions:
+                for field in FIELDS:
+                    actual, wanted = getattr(petition, field), expected[petition.id][field]
+                    # The score is maintained incrementally in floating point, so allow rounding error
+                    tolerance = SCORE_TOLERANCE if field == 'trending_score' else 0
+                    if abs(actual - wanted) > tolerance:
+                        mismatches.append((petition.id, field, actual, wanted))
+                    setattr(petition, field, wanted)
+
+            if options['verify']:
+                for petition_id, field, actual, wanted in mismatches:
+                    self.stdout.write(f'Petition {petition_id}: {field} is {actual}, expected {wanted}')
+                if mismatches:
+                    raise CommandError(f'{len(mismatches)} tally(ies) out of date.')
+                self.stdout.write(self.style.SUCCESS(f'All {len(petitions)} petition tallies are correct.'))
+                return
+
+            Petition.objects.bulk_update(petitions, FIELDS, batch_size=500)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt tallies for {len(petitions)} petitions ({len(mismatches)} value(s) corrected).'
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petitions', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='petitionvote',
+            index=models.Index(fields=['petition', 'value'], name='petitionvote_petition_value'),
+        ),
+        migrations.AddIndex(
+            model_name='petitionvote',
+            index=models.Index(fields=['petition', '-voted_at'], name='petitionvote_petition_voted'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:38
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_tallies(apps, schema_editor):
+    # Same weighting as petitions.tallies at the time of writing (one-day half-life)
+    epoch, half_life = datetime(2024, 1, 1, tzinfo=timezone.utc), timedelta(days=1)
+    Petition = apps.get_model('petitions', 'Petition')
+    PetitionVote = apps.get_model('petitions', 'PetitionVote')
+    votes = {}
+    for petition_id, value, voted_at in PetitionVote.objects.values_list('petition_id', 'value', 'voted_at'):
+        votes.setdefault(petition_id, []).append((value, (voted_at - epoch) / half_life * math.log(2)))
+    petitions = list(Petition.objects.filter(id__in=votes))
+    for petition in petitions:
+        cast = votes[petition.id]
+        top = max(x for _, x in cast)
+        petition.yes_votes = sum(1 for value, _ in cast if value)
+        petition.no_votes = len(cast) - petition.yes_votes
+        petition.total_votes = len(cast)
+        petition.trending_score = top + math.log(sum(math.exp(x - top) for _, x in cast))
+    Petition.objects.bulk_update(petitions, ['yes_votes', 'no_votes', 'total_votes', 'trending_score'],
+                                 batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('petitions', '0002_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='petition',
+            name='no_votes',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='total_votes',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='trending_score',
+            field=models.FloatField(db_default=0.0, default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='petition',
+            name='yes_votes',
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='petition',
+            index=models.Index(fields=['-created_at', '-id'], name='petition_created'),
+        ),
+        migrations.AddIndex(
+            model_name='petition',
+            index=models.Index(fields=['-trending_score', '-id'], name='petition_trending'),
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
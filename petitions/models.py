@@ -7,12 +7,18 @@ class Petition(models.Model):
     description = models.TextField(blank=True, null=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from PetitionVote by petitions/tallies.py, in the same transaction as each vote
+    yes_votes = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    no_votes = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    total_votes = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    # Log of the time-decayed vote count; higher means more recent momentum
+    trending_score = models.FloatField(default=0.0, db_default=0.0, editable=False)
 
-    def yes_votes(self):
-        return self.votes.filter(value=True).count()
-
-    def no_votes(self):
-        return self.votes.filter(value=False).count()
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='petition_created'),
+            models.Index(fields=['-trending_score', '-id'], name='petition_trending'),
+        ]
 
     def __str__(self):
         return f"{self.id} - {self.title}"
@@ -26,3 +32,9 @@ class PetitionVote(models.Model):
 
     class Meta:
         unique_together = ('petition', 'user')
+        indexes = [
+            # Covers yes/no counts per petition
+            models.Index(fields=['petition', 'value'], name='petitionvote_petition_value'),
+            # A petition's voters, newest first
+            models.Index(fields=['petition', '-voted_at'], name='petitionvote_petition_voted'),
+        ]
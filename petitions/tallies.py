@@ -0,0 +1,127 @@
+"""Maintenance of the denormalized vote tallies on Petition.
+
+Views call these helpers inside the same transaction as the PetitionVote
+rows they write, so yes_votes, no_votes and total_votes move atomically with
+the votes. Updates are F() expressions, which keeps concurrent voters from
+losing increments. Votes are never deleted by a view; a post_delete receiver
+takes the deleted ones (from the admin, or a voter's account being deleted)
+back off the tallies.
+
+trending_score ranks petitions by recent momentum. Each vote is worth
+``2 ** ((voted_at - EPOCH) / HALF_LIFE)``, so a vote counts half as much
+for every HALF_LIFE that passes. Every petition decays at the same rate,
+so the order of the decayed sums never changes as time passes. The column
+therefore stores the natural log of the sum, which grows by a bounded
+amount per vote and never has to be recomputed. Listing trending
+petitions is then an ordered read of the ``-trending_score`` index.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Exp, Greatest, Ln
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from moviesstore import fragments
+from .models import Petition, PetitionVote
+
+HALF_LIFE = timedelta(days=1)
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Score of a petition with no votes; any real vote outweighs it
+NO_MOMENTUM = 0.0
+# exp() of anything lower is zero for our purposes, and PostgreSQL raises on underflow
+EXP_FLOOR = Value(-700.0)
+
+
+def momentum(when):
+    """The log-weight of one vote cast at ``when``."""
+    return (when - EPOCH) / HALF_LIFE * math.log(2)
+
+
+def vote_recorded(petition_id, value, voted_at):
+    x = momentum(voted_at)
+    Petition.objects.filter(pk=petition_id).update(
+        yes_votes=F('yes_votes') + int(value),
+        no_votes=F('no_votes') + int(not value),
+        total_votes=F('total_votes') + 1,
+        # log(e**score + e**x), computed as x + log(1 + e**(score - x)) so nothing overflows
+        trending_score=Value(x) + Ln(Value(1.0) + Exp(Greatest(F('trending_score') - Value(x), EXP_FLOOR))),
+    )
+
+
+def vote_removed(petition_id, value, voted_at):
+    x = momentum(voted_at)
+    Petition.objects.filter(pk=petition_id).update(
+        yes_votes=F('yes_votes') - int(value),
+        no_votes=F('no_votes') - int(not value),
+        total_votes=F('total_votes') - 1,
+        # log(e**score - e**x); the last vote out resets the score exactly
+        trending_score=Case(
+            When(total_votes__lte=1, then=Value(NO_MOMENTUM)),
+            default=F('trending_score') + Ln(Greatest(
+                Value(1.0) - Exp(Greatest(Value(x) - F('trending_score'), EXP_FLOOR)), Value(1e-12),
+            )),
+        ),
+    )
+
+
+@receiver(post_delete, sender=PetitionVote)
+def vote_deleted(sender, instance, **kwargs):
+    # When the petition itself is being deleted this updates a row that is about to go
+    vote_removed(instance.petition_id, instance.value, instance.voted_at)
+
+
+def vote_changed(petition_id, value):
+    """Move one vote from the other side to ``value``; momentum is unchanged."""
+    delta = 1 if value else -1
+    Petition.objects.filter(pk=petition_id).update(
+        yes_votes=F('yes_votes') + delta,
+        no_votes=F('no_votes') - delta,
+    )
+
+
+def cast_vote(petition_id, user_id, value):
+    """Record ``user_id``'s vote, or move their existing vote to ``value``.
+
+    Costs one UPDATE when the user had voted the other way, and one INSERT
+    otherwise. Returns False if the user had already voted ``value``.
+    """
+    if PetitionVote.objects.filter(petition_id=petition_id, user_id=user_id, value=not value).update(value=value):
+        vote_changed(petition_id, value)
+        # update() sends no post_save for petitions/fragments.py
+        fragments.bump('petitions')
+        return True
+    try:
+        with transaction.atomic():
+            vote = PetitionVote.objects.create(petition_id=petition_id, user_id=user_id, value=value)
+    except IntegrityError:
+        return False
+    vote_recorded(petition_id, value, vote.voted_at)
+    return True
+
+
+def computed_tallies():
+    """Recompute every petition's tallies from PetitionVote.
+
+    Returns ``{petition_id: {field: value}}``. Only the rebuild command
+    should need this; request handling reads the Petition columns.
+    """
+    tallies = {
+        petition_id: {'yes_votes': 0, 'no_votes': 0, 'total_votes': 0, 'trending_score': NO_MOMENTUM}
+        for petition_id in Petition.objects.values_list('id', flat=True)
+    }
+    counts = PetitionVote.objects.values('petition_id').annotate(
+        yes=Count('id', filter=Q(value=True)), no=Count('id', filter=Q(value=False)),
+    )
+    for row in counts:
+        tallies[row['petition_id']].update(yes_votes=row['yes'], no_votes=row['no'],
+                                           total_votes=row['yes'] + row['no'])
+    weights = {}
+    for petition_id, voted_at in PetitionVote.objects.values_list('petition_id', 'voted_at').iterator():
+        weights.setdefault(petition_id, []).append(momentum(voted_at))
+    for petition_id, xs in weights.items():
+        top = max(xs)
+        tallies[petition_id]['trending_score'] = top + math.log(sum(math.exp(x - top) for x in xs))
+    return tallies
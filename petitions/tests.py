@@ -1,3 +1,133 @@
+import io
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from moviesstore.testing import PerformanceTestCase
+from . import tallies
+from .models import Petition, PetitionVote
+
+
+class PetitionTallyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.voters = [User.objects.create_user(f'voter{i}', password='pass') for i in range(4)]
+        cls.old = Petition.objects.create(title='Old favourite', created_by=cls.voters[0])
+        cls.new = Petition.objects.create(title='New favourite', created_by=cls.voters[0])
+
+    def vote(self, petition, user, value, voted_at):
+        PetitionVote.objects.create(petition=petition, user=user, value=value)
+        PetitionVote.objects.filter(petition=petition, user=user).update(voted_at=voted_at)
+        tallies.vote_recorded(petition.id, value, voted_at)
+
+    def test_voting_updates_the_tallies(self):
+        self.client.force_login(self.voters[1])
+        self.client.post(reverse('petitions.show', args=[self.new.id]), {'value': 'True'})
+        self.client.force_login(self.voters[2])
+        self.client.post(reverse('petitions.show', args=[self.new.id]), {'value': 'False'})
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.yes_votes, self.new.no_votes, self.new.total_votes), (1, 1, 2))
+        self.assertGreater(self.new.trending_score, tallies.NO_MOMENTUM)
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+
+    def test_recent_votes_outrank_more_older_ones(self):
+        now = timezone.now()
+        for voter in self.voters[:3]:
+            self.vote(self.old, voter, True, now - timedelta(days=7))
+        for voter in self.voters[:2]:
+            self.vote(self.new, voter, True, now - timedelta(hours=1))
+        # Members skip the anonymous page cache
+        self.client.force_login(self.voters[3])
+        response = self.client.get(reverse('petitions.index') + '?sort=trending')
+        self.assertEqual([petition.id for petition in response.context['petitions']], [self.new.id, self.old.id])
+        response = self.client.get(reverse('petitions.index'))
+        self.assertEqual([petition.id for petition in response.context['petitions']], [self.new.id, self.old.id])
+
+    def test_removed_and_changed_votes_match_a_rebuild(self):
+        now = timezone.now()
+        for hours, voter in enumerate(self.voters):
+            self.vote(self.old, voter, hours % 2 == 0, now - timedelta(hours=hours))
+        removed = PetitionVote.objects.get(petition=self.old, user=self.voters[1])
+        removed.delete()
+        PetitionVote.objects.filter(petition=self.old, user=self.voters[2]).update(value=False)
+        tallies.vote_changed(self.old.id, False)
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+
+    def test_deleted_votes_leave_the_tallies(self):
+        now = timezone.now()
+        for hours, voter in enumerate(self.voters[1:]):
+            self.vote(self.old, voter, True, now - timedelta(hours=hours))
+            self.vote(self.new, voter, False, now - timedelta(hours=hours))
+        self.voters[1].delete()
+        PetitionVote.objects.filter(petition=self.new, user=self.voters[2]).delete()
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.no_votes, self.new.total_votes), (1, 1))
+        # Deleting a petition cascades to its votes, which must not fail
+        self.old.delete()
+        self.assertFalse(PetitionVote.objects.filter(petition_id=self.old.id).exists())
+
+    def test_vote_api_casts_and_changes_votes(self):
+        self.client.force_login(self.voters[1])
+        url = reverse('petitions.api_vote', args=[self.new.id])
+        response = self.client.post(url, {'value': 'True'})
+        self.assertEqual(response.json(), {'vote': True, 'yes_votes': 1, 'no_votes': 0, 'total_votes': 1})
+        self.client.post(url, {'value': 'True'})
+        response = self.client.post(url, {'value': 'False'})
+        self.assertEqual(response.json(), {'vote': False, 'yes_votes': 0, 'no_votes': 1, 'total_votes': 1})
+        self.assertEqual(self.client.post(url, {'value': 'maybe'}).status_code, 400)
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+
+    def test_show_page_changes_votes_like_the_api(self):
+        self.client.force_login(self.voters[1])
+        url = reverse('petitions.show', args=[self.new.id])
+        self.client.post(url, {'value': 'True'})
+        response = self.client.post(url, {'value': 'True'}, follow=True)
+        self.assertContains(response, 'You have already voted &quot;Yes&quot; on this petition.')
+        response = self.client.post(url, {'value': 'False'}, follow=True)
+        self.assertContains(response, 'Your vote has been changed to &quot;No&quot;.')
+        self.assertContains(response, 'Change Vote')
+        self.new.refresh_from_db()
+        self.assertEqual((self.new.yes_votes, self.new.no_votes, self.new.total_votes), (0, 1, 1))
+        # A vote cast on the page can be switched through the API, and back again
+        api_url = reverse('petitions.api_vote', args=[self.new.id])
+        self.assertEqual(self.client.post(api_url, {'value': 'True'}).json()['yes_votes'], 1)
+        self.client.post(url, {'value': 'False'})
+        self.assertEqual(PetitionVote.objects.get(petition=self.new, user=self.voters[1]).value, False)
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+
+    def test_rebuild_corrects_stale_tallies(self):
+        self.vote(self.old, self.voters[1], True, timezone.now())
+        Petition.objects.filter(pk=self.old.pk).update(yes_votes=5, trending_score=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+        call_command('rebuild_petition_tallies', stdout=io.StringIO())
+        call_command('rebuild_petition_tallies', verify=True, stdout=io.StringIO())
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.yes_votes, 1)
+
+
+class PetitionsPerformanceBudgetTests(PerformanceTestCase):
+    """Petition pages stay within their declared budgets on a seeded store."""
+
+    def test_index(self):
+        self.assertWithinBudget(reverse('petitions.index'))
+        self.assertWithinBudget(reverse('petitions.index') + '?page=3', user=self.shopper)
+        self.assertWithinBudget(reverse('petitions.index') + '?sort=trending', user=self.shopper)
+
+    def test_show(self):
+        petition = Petition.objects.first()
+        self.assertWithinBudget(reverse('petitions.show', args=[petition.id]), user=self.shopper)
+
+    def test_votes(self):
+        petitions = Petition.objects.exclude(votes__user=self.shopper)[:2]
+        self.assertWithinBudget(reverse('petitions.show', args=[petitions[0].id]), user=self.shopper,
+                                data={'value': 'True'}, status=302)
+        self.assertWithinBudget(reverse('petitions.api_vote', args=[petitions[1].id]), data={'value': 'False'})
 
-# Create your tests here.
+    def test_create_form(self):
+        self.assertWithinBudget(reverse('petitions.create'), user=self.shopper)
@@ -7,4 +7,5 @@ urlpatterns = [
     path('<int:petition_id>/', views.show, name='petitions.show'),
     path('my-petitions/', views.my_petitions, name='petitions.my_petitions'),
     path('<int:petition_id>/delete/', views.delete_petition, name='petitions.delete'),
+    path('api/<int:petition_id>/vote/', views.api_vote, name='petitions.api_vote'),
 ]
\ No newline at end of file
@@ -2,17 +2,29 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Count, Q
+from django.db import transaction
+from django.http import JsonResponse
+from . import tallies
 from .models import Petition, PetitionVote
 from .forms import PetitionForm, VoteForm
+from moviesstore.api import json_error, json_post
+from moviesstore.pagecache import cache_anonymous
+from moviesstore.querybudget import query_budget
 
+# Both orderings are served by an index on Petition (see Meta.indexes)
+SORTS = {
+    'newest': ('-created_at', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+@query_budget(5, 0.5)
+@cache_anonymous('petitions')
 def index(request):
     """Display all active petitions with voting stats"""
-    petitions_list = Petition.objects.annotate(
-        total_votes=Count('votes'),
-        yes_votes=Count('votes', filter=Q(votes__value=True)),
-        no_votes=Count('votes', filter=Q(votes__value=False))
-    ).order_by('-created_at')
+    sort = request.GET.get('sort')
+    if sort not in SORTS:
+        sort = 'newest'
+    petitions_list = Petition.objects.select_related('created_by').order_by(*SORTS[sort])
     
     paginator = Paginator(petitions_list, 10)
     page_number = request.GET.get('page')
@@ -20,32 +32,35 @@ def index(request):
     
     return render(request, 'petitions/index.html', {
         'template_data': {'title': 'Movie Petitions'},
-        'petitions': petitions
+        'petitions': petitions,
+        'sort': sort,
     })
 
 
+@query_budget(11, 0.5)
 def show(request, petition_id):
-    """Display a single petition and handle voting"""
-    petition = get_object_or_404(Petition, id=petition_id)
-    votes = petition.votes.select_related('user').order_by('-voted_at')
+    """Display a single petition and handle casting or changing a vote"""
+    petition = get_object_or_404(Petition.objects.select_related('created_by'), id=petition_id)
+    recent_votes = list(petition.votes.select_related('user').order_by('-voted_at')[:5])
 
     user_vote = None
     if request.user.is_authenticated:
         user_vote = PetitionVote.objects.filter(petition=petition, user=request.user).first()
 
     if request.method == 'POST' and request.user.is_authenticated:
-        if user_vote:
-            messages.warning(request, 'You have already voted on this petition.')
-            return redirect('petitions.show', petition_id=petition.id)
-
         form = VoteForm(request.POST)
         if form.is_valid():
-            vote = form.save(commit=False)
-            vote.petition = petition
-            vote.user = request.user
-            vote.save()
-            vote_type = "Yes" if vote.value else "No"
-            messages.success(request, f'Your "{vote_type}" vote has been recorded!')
+            # Same policy as api_vote: a voter may switch sides, but only has one vote
+            value = form.cleaned_data['value']
+            with transaction.atomic():
+                cast = tallies.cast_vote(petition.id, request.user.id, value)
+            vote_type = "Yes" if value else "No"
+            if not cast:
+                messages.warning(request, f'You have already voted "{vote_type}" on this petition.')
+            elif user_vote:
+                messages.success(request, f'Your vote has been changed to "{vote_type}".')
+            else:
+                messages.success(request, f'Your "{vote_type}" vote has been recorded!')
             return redirect('petitions.show', petition_id=petition.id)
     else:
         form = VoteForm()
@@ -53,12 +68,33 @@ def show(request, petition_id):
     return render(request, 'petitions/show.html', {
         'template_data': {'title': f'Petition: {petition.title}'},
         'petition': petition,
-        'votes': votes,
+        'recent_votes': recent_votes,
         'user_vote': user_vote,
         'form': form
     })
 
 
+@query_budget(10, 0.25)
+@json_post
+def api_vote(request, petition_id):
+    """Cast or change a vote from the show page's fetch() call; answers with the new tallies"""
+    value = {'True': True, 'False': False}.get(request.POST.get('value'))
+    if value is None:
+        return json_error('The vote must be True or False.', 400)
+    if not Petition.objects.filter(id=petition_id).exists():
+        return json_error('No such petition.', 404)
+    with transaction.atomic():
+        tallies.cast_vote(petition_id, request.user.id, value)
+    petition = Petition.objects.only('yes_votes', 'no_votes', 'total_votes').get(id=petition_id)
+    return JsonResponse({
+        'vote': value,
+        'yes_votes': petition.yes_votes,
+        'no_votes': petition.no_votes,
+        'total_votes': petition.total_votes,
+    })
+
+
+@query_budget(2, 0.5)
 @login_required
 def create(request):
     """Create a new petition"""
@@ -82,11 +118,7 @@ def create(request):
 @login_required
 def my_petitions(request):
     """Display current user's petitions"""
-    petitions_list = Petition.objects.filter(created_by=request.user).annotate(
-        total_votes=Count('votes'),
-        yes_votes=Count('votes', filter=Q(votes__value=True)),
-        no_votes=Count('votes', filter=Q(votes__value=False))
-    ).order_by('-created_at')
+    petitions_list = Petition.objects.filter(created_by=request.user).order_by(*SORTS['newest'])
     
     paginator = Paginator(petitions_list, 10)
     page_number = request.GET.get('page')